@@ -23,9 +23,11 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = os.environ['SECRET_KEY']
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = bool(int(os.environ.get('DEBUG', 1)))
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('ALLOWED_HOSTS', '').split(',') if host
+]
 
 
 # Application definition
@@ -41,14 +43,18 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'core',
     'user',
+    'recipe',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +93,39 @@ DATABASES = {
     }
 }
 
+# The default cache is per-process memory unless CACHE_BACKEND and
+# CACHE_LOCATION name a shared one, e.g. django's DatabaseCache with a
+# table made by createcachetable, or memcached. Response cache
+# generations, ETags, index versions and replica pins all live in caches,
+# so with several workers they must be shared. With DEBUG off, the system
+# checks refuse to start on a per-process cache unless SHARED_CACHE_REQUIRED
+# is set to 0 for a single-process deployment.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+SHARED_CACHE_REQUIRED = bool(int(
+    os.environ.get('SHARED_CACHE_REQUIRED', int(not DEBUG))))
+
+# Read replicas of the primary, as a comma-separated list of hosts that
+# share its database name, user and password. Safe requests to views using
+# ReplicaReadMixin read from them (see core.routers); a user who
+# writes is pinned to the primary for REPLICA_PIN_SECONDS, using the
+# REPLICA_PIN_CACHE_ALIAS cache, which all workers should share.
+REPLICA_DATABASES = []
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dict(
+        DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE_ALIAS = os.environ.get('REPLICA_PIN_CACHE_ALIAS', 'default')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -130,6 +169,96 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Serve uploaded media to anyone, as django.conf.urls.static did. Turn off
+# to serve recipe images only to their owners; image URLs then need the
+# owner's session or API token.
+MEDIA_PUBLIC = bool(int(os.environ.get('MEDIA_PUBLIC', 1)))
+
+# Hand media bytes to the front-end server: 'nginx' (X-Accel-Redirect to
+# MEDIA_SENDFILE_URL, an internal location) or 'xsendfile'. Unset serves
+# them from Python.
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND')
+MEDIA_SENDFILE_URL = os.environ.get('MEDIA_SENDFILE_URL', '/protected-media/')
+
+
+# Keyset pagination for the recipe API. Clients opt in by passing
+# ?page_size= or following a ?cursor= link; the size is capped at the max.
+RECIPE_API_PAGE_SIZE = int(os.environ.get('RECIPE_API_PAGE_SIZE', 100))
+RECIPE_API_MAX_PAGE_SIZE = int(
+    os.environ.get('RECIPE_API_MAX_PAGE_SIZE', 1000))
+
+# Largest batch accepted by the bulk recipe endpoint
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 1000))
+
+# Cache for recipe API responses, and for the generation counters behind
+# them and the ETags. It must be shared between workers (see CACHES); a
+# TTL of 0 turns response caching off.
+RECIPE_API_CACHE_ALIAS = os.environ.get('RECIPE_API_CACHE_ALIAS', 'default')
+RECIPE_API_CACHE_TTL = int(os.environ.get('RECIPE_API_CACHE_TTL', 300))
+
+# Recipes rendered per round trip by the streaming export
+RECIPE_EXPORT_CHUNK_SIZE = int(
+    os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000))
+
+# Per-process cache of the in-memory recipe indexes behind
+# recipes/{id}/similar and recipes/pantry: how many users' indexes of each
+# kind to keep, and for how many seconds
+RECIPE_INDEX_CACHE_SIZE = int(
+    os.environ.get('RECIPE_INDEX_CACHE_SIZE', 64))
+RECIPE_INDEX_CACHE_TTL = int(
+    os.environ.get('RECIPE_INDEX_CACHE_TTL', 3600))
+# Most similar recipes returned by default, and at most
+RECIPE_SIMILAR_LIMIT = int(os.environ.get('RECIPE_SIMILAR_LIMIT', 10))
+RECIPE_SIMILAR_MAX_LIMIT = int(
+    os.environ.get('RECIPE_SIMILAR_MAX_LIMIT', 100))
+# Recipes returned by recipes/pantry by default, and at most
+RECIPE_PANTRY_LIMIT = int(os.environ.get('RECIPE_PANTRY_LIMIT', 20))
+RECIPE_PANTRY_MAX_LIMIT = int(
+    os.environ.get('RECIPE_PANTRY_MAX_LIMIT', 200))
+
+
+# Token authentication cache. Leave the alias unset for a per-process LRU
+# of TOKEN_AUTH_CACHE_SIZE entries, or name one of CACHES to share it. A
+# per-process LRU only forgets a revoked token in the worker that revoked
+# it, so other workers accept it for up to the TTL; keep it short unless
+# the alias is shared. 0 turns the cache off.
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 10))
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 1024))
+TOKEN_AUTH_CACHE_ALIAS = os.environ.get('TOKEN_AUTH_CACHE_ALIAS')
+
+
+# Processes that build resized copies of uploaded recipe images. Zero
+# builds them inline in the request, which is handy for tests.
+RECIPE_RENDITION_WORKERS = int(os.environ.get('RECIPE_RENDITION_WORKERS', 2))
+
+
+# Per-request SQL instrumentation. Requests over either budget are logged
+# with their view; 0 turns a budget off. Server-Timing headers show the
+# numbers to clients, so they can be switched off on public deployments.
+REQUEST_QUERY_BUDGET = int(os.environ.get('REQUEST_QUERY_BUDGET', 20))
+REQUEST_LATENCY_BUDGET_MS = int(
+    os.environ.get('REQUEST_LATENCY_BUDGET_MS', 500))
+REQUEST_SERVER_TIMING = bool(int(os.environ.get('REQUEST_SERVER_TIMING', 1)))
+
+# Request metrics served at /metrics in the Prometheus text format. Set
+# METRICS_DIR to a directory the workers share (emptied on restart) when
+# running several processes, and METRICS_TOKEN to the
+# "Authorization: Bearer <token>" the scraper sends; without a token the
+# endpoint is only served with DEBUG on.
+METRICS_ENABLED = bool(int(os.environ.get('METRICS_ENABLED', 1)))
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Request profiling. Staff can ask for a profile with an X-Profile header
+# ("collapsed" stacks or "pstats"); a sample rate of N also profiles 1 in
+# N requests from anyone (0 is off). The newest PROFILE_KEEP profiles are
+# kept in PROFILE_DIR; see `manage.py profiles`.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/vol/web/profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 1))
+
 
 # Points back to our model file
 AUTH_USER_MODEL = 'core.User'
@@ -1,5 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        """Hook up cache invalidation and the system checks once the
+        models are loaded"""
+        from rest_framework.authtoken.models import Token
+        from core import authentication
+        # Register the system checks
+        from core import checks  # noqa: F401
+
+        post_delete.connect(
+            authentication.token_deleted, sender=Token,
+            dispatch_uid='core.token_deleted'
+        )
+        post_save.connect(
+            authentication.user_saved, sender=self.get_model('User'),
+            dispatch_uid='core.user_saved'
+        )
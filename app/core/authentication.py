@@ -0,0 +1,108 @@
+"""
+Token authentication that remembers who a token belongs to.
+
+DRF's TokenAuthentication joins authtoken_token to the user table on every
+request. CachedTokenAuthentication keeps the result for
+TOKEN_AUTH_CACHE_TTL seconds, either in a bounded per-process LRU or, when
+TOKEN_AUTH_CACHE_ALIAS names a Django cache, in that shared backend so
+every worker sees invalidations at once. With the local LRU, deleting a
+token or deactivating a user only reaches the worker that handled it:
+the others keep accepting the token until their entry expires, so keep
+the TTL short there. A TTL of 0 turns the cache off.
+
+Each token has a generation in the cache, and entries are stamped with
+the generation read before the database was. Invalidating a token moves
+its generation on, so a lookup that raced with the invalidation stores
+an entry that is never used.
+"""
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.cache import TTLCache, new_generation
+
+KEY_PREFIX = 'authtoken:'
+GENERATION_PREFIX = 'authtoken-gen:'
+
+_local_cache = None
+
+
+def get_token_cache():
+    """Return the store cached credentials live in"""
+    global _local_cache
+
+    alias = settings.TOKEN_AUTH_CACHE_ALIAS
+    if alias:
+        return caches[alias]
+
+    if _local_cache is None:
+        _local_cache = TTLCache(
+            maxsize=settings.TOKEN_AUTH_CACHE_SIZE,
+            timeout=settings.TOKEN_AUTH_CACHE_TTL
+        )
+
+    return _local_cache
+
+
+def reset_token_cache():
+    """Forget the local cache so the next lookup rebuilds it from settings"""
+    global _local_cache
+    _local_cache = None
+
+
+def invalidate_token(key):
+    """Drop a token from the cache, and any lookup of it in flight"""
+    cache = get_token_cache()
+    cache.set(GENERATION_PREFIX + key, new_generation(), None)
+    cache.delete(KEY_PREFIX + key)
+
+
+def invalidate_user_tokens(user):
+    """Drop every cached token belonging to user"""
+    keys = Token.objects.filter(user_id=user.pk).values_list('key', flat=True)
+    for key in keys:
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in TokenAuthentication backed by a TTL cache"""
+
+    def authenticate_credentials(self, key):
+        """Look the token up in the cache before hitting the database"""
+        cache = get_token_cache()
+        generation_key = GENERATION_PREFIX + key
+        found = cache.get_many([KEY_PREFIX + key, generation_key])
+        generation = found.get(generation_key)
+        cached = found.get(KEY_PREFIX + key)
+        if generation is None:
+            generation = new_generation()
+            cache.add(generation_key, generation, None)
+            generation = cache.get(generation_key)
+
+        if cached is None or cached[2] != generation:
+            user, token = super().authenticate_credentials(key)
+            cached = (user, token, generation)
+            cache.set(
+                KEY_PREFIX + key, cached, settings.TOKEN_AUTH_CACHE_TTL)
+
+        # Views may modify request.user, so hand each request its own copy
+        user, token, _ = cached
+        return (copy.copy(user), token)
+
+
+def token_deleted(sender, instance, **kwargs):
+    """Signal receiver: a deleted token must stop working immediately"""
+    invalidate_token(instance.key)
+
+
+def user_saved(sender, instance, created, **kwargs):
+    """Signal receiver: drop a user's tokens when the user changes
+
+    This covers deactivation and password changes as well as plain
+    profile edits, which would otherwise leave a stale user cached.
+    """
+    if not created:
+        invalidate_user_tokens(instance)
@@ -0,0 +1,94 @@
+"""
+Small in-process caches shared by the API's hot paths.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Like Django's DEFAULT_TIMEOUT: use the cache's own timeout
+DEFAULT_TIMEOUT = object()
+
+
+def new_generation():
+    """Starting value for a counter that is missing or was evicted
+
+    Taken from the clock, so a counter that starts over never comes back
+    to a generation that may still have entries cached under it.
+    """
+    return int(time.time() * 1000000)
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after a TTL
+
+    The get/set/delete signatures mirror Django's cache API, so code can
+    take either one of these or a configured django.core.cache backend.
+    As there, a timeout of None keeps an entry until it is evicted and a
+    timeout of 0 doesn't store it at all.
+    """
+
+    def __init__(self, maxsize=1024, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Return the live value for key, refreshing its LRU position"""
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        """Return a dict of the live values among keys"""
+        missing = object()
+        values = {key: self.get(key, missing) for key in keys}
+        return {key: value for key, value in values.items()
+                if value is not missing}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """Store value, evicting the least recently used entry if full"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+
+        expires = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        """Store value unless key is already cached; return whether it
+        was stored"""
+        missing = object()
+        with self._lock:
+            if self.get(key, missing) is not missing:
+                return False
+            self.set(key, value, timeout)
+        return True
+
+    def delete(self, key):
+        """Drop key if it is cached"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
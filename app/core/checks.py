@@ -0,0 +1,37 @@
+"""
+System checks for settings that are only wrong with several processes.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+def shared_aliases():
+    """(setting, alias) of the caches every worker must see alike"""
+    aliases = [('RECIPE_API_CACHE_ALIAS', settings.RECIPE_API_CACHE_ALIAS)]
+    if settings.REPLICA_DATABASES and settings.REPLICA_PIN_SECONDS:
+        aliases.append(
+            ('REPLICA_PIN_CACHE_ALIAS', settings.REPLICA_PIN_CACHE_ALIAS))
+    return aliases
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """Refuse per-process caches where invalidation has to reach every
+    worker"""
+    if not settings.SHARED_CACHE_REQUIRED:
+        return []
+
+    errors = []
+    for setting, alias in shared_aliases():
+        if isinstance(caches[alias], LocMemCache):
+            errors.append(Error(
+                f'{setting} names the per-process cache {alias!r}, so '
+                f'writes in one worker would not invalidate the others.',
+                hint='Point CACHE_BACKEND and CACHE_LOCATION, or the '
+                     'alias, at a shared cache, or set '
+                     'SHARED_CACHE_REQUIRED=0 for a single process.',
+                id='core.E001',
+            ))
+    return errors
@@ -0,0 +1,432 @@
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from PIL import Image
+
+from core.management.commands.seed_benchmark_data import BENCH_EMAIL, \
+    BENCH_PASSWORD
+
+# Share of requests going to each scenario. Workers log in once up front
+# as well, so every run measures the token endpoint.
+MIX = (
+    ('token', 5),
+    ('recipe list', 30),
+    ('recipe filter', 20),
+    ('recipe detail', 30),
+    ('recipe create', 10),
+    ('image upload', 5),
+)
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(latencies, errors, duration):
+    """Throughput and latency figures (in ms) for one endpoint
+
+    errors maps the status code of each failed request to how often it
+    was seen.
+    """
+    values = sorted(latencies)
+    summary = {
+        'requests': len(values),
+        'errors': sum(errors.values()),
+        'error_statuses': {
+            str(status): count for status, count in sorted(errors.items())},
+        'throughput': len(values) / duration if duration else 0,
+        'mean_ms': sum(values) / len(values) if values else None,
+        'max_ms': values[-1] if values else None,
+    }
+    for pct in PERCENTILES:
+        summary[f'p{pct}_ms'] = percentile(values, pct)
+    return summary
+
+
+def compare(results, baseline, threshold):
+    """Return (endpoint, message) for every regression against baseline
+
+    An endpoint regresses when its p95 latency grew, or its throughput
+    fell, by more than threshold (a fraction).
+    """
+    regressions = []
+    for name, current in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before or not before['requests'] or not current['requests']:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append((name, 'p95 {:.1f} ms -> {:.1f} ms'.format(
+                before['p95_ms'], current['p95_ms'])))
+        if current['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append((name, 'throughput {:.1f}/s -> {:.1f}/s'.format(
+                before['throughput'], current['throughput'])))
+    return regressions
+
+
+def sample_image():
+    """A small JPEG to upload"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def multipart(field, filename, content, content_type):
+    """Encode one file as a multipart/form-data body"""
+    boundary = uuid.uuid4().hex
+    body = b''.join((
+        f'--{boundary}\r\n'.encode('ascii'),
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'.encode('ascii'),
+        f'Content-Type: {content_type}\r\n\r\n'.encode('ascii'),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode('ascii'),
+    ))
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def git_commit():
+    """The commit being measured, if this is a git checkout"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Client:
+    """Minimal HTTP client for the API, using only the standard library"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, params=None, data=None,
+                content_type='application/json'):
+        """Return (status, parsed JSON body or None)"""
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if data is not None:
+            if content_type == 'application/json':
+                data = json.dumps(data).encode('utf-8')
+            headers['Content-Type'] = content_type
+
+        request = Request(url, data=data, headers=headers, method=method)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except HTTPError as exc:
+            status, body = exc.code, exc.read()
+
+        try:
+            return status, json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            return status, None
+
+
+class Worker(threading.Thread):
+    """One simulated user running the request mix until the deadline"""
+
+    def __init__(self, email, client, rng, deadline, recorder, image):
+        super().__init__(daemon=True)
+        self.email = email
+        self.client = client
+        self.rng = rng
+        self.deadline = deadline
+        self.record = recorder
+        self.image = image
+        self.created = []
+        self.error = None
+
+    def timed(self, name, *args, **kwargs):
+        """Make a request and record how long it took"""
+        start = time.perf_counter()
+        status, body = self.client.request(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.record(name, elapsed, status)
+        return status, body
+
+    def login(self):
+        """Get a token from CreateTokenView"""
+        self.client.token = None
+        status, body = self.timed(
+            'token', 'POST', reverse('user:token'),
+            data={'email': self.email, 'password': BENCH_PASSWORD})
+        if status != 200:
+            raise CommandError(f'Could not log in as {self.email}')
+        self.client.token = body['token']
+
+    def setup(self):
+        """Log in and learn the ids the scenarios pick from"""
+        self.login()
+        _, tags = self.client.request('GET', reverse('recipe:tag-list'))
+        _, ingredients = self.client.request(
+            'GET', reverse('recipe:ingredient-list'))
+        _, recipes = self.client.request(
+            'GET', reverse('recipe:recipe-list'),
+            {'fields': 'id', 'page_size': 500})
+        self.tag_ids = [tag['id'] for tag in tags or []]
+        self.ingredient_ids = [item['id'] for item in ingredients or []]
+        self.recipe_ids = [
+            recipe['id'] for recipe in (recipes or {}).get('results', [])]
+
+    def recipe_list(self):
+        """A page of recipes"""
+        self.timed('recipe list', 'GET', reverse('recipe:recipe-list'),
+                   {'page_size': 50})
+
+    def recipe_filter(self):
+        """A page of recipes with one of the tags"""
+        if not self.tag_ids:
+            return self.recipe_list()
+        self.timed('recipe filter', 'GET', reverse('recipe:recipe-list'), {
+            'tags': self.rng.choice(self.tag_ids), 'page_size': 50})
+
+    def recipe_detail(self):
+        """One recipe"""
+        if not self.recipe_ids:
+            return self.recipe_list()
+        recipe_id = self.rng.choice(self.recipe_ids)
+        self.timed('recipe detail', 'GET',
+                   reverse('recipe:recipe-detail', args=[recipe_id]))
+
+    def recipe_create(self):
+        """A new recipe with tags and ingredients"""
+        status, body = self.timed(
+            'recipe create', 'POST', reverse('recipe:recipe-list'), data={
+                'title': f'Load test {uuid.uuid4().hex[:8]}',
+                'time_minutes': self.rng.randint(5, 90),
+                'price': '9.99',
+                'tags': self.rng.sample(
+                    self.tag_ids, min(2, len(self.tag_ids))),
+                'ingredients': self.rng.sample(
+                    self.ingredient_ids, min(5, len(self.ingredient_ids))),
+            })
+        if status == 201:
+            self.created.append(body['id'])
+
+    def image_upload(self):
+        """An image for the newest recipe this worker created"""
+        if not self.created:
+            return self.recipe_create()
+        body, content_type = multipart(
+            'image', 'load-test.jpg', self.image, 'image/jpeg')
+        self.timed('image upload', 'POST', reverse(
+            'recipe:recipe-upload-image', args=[self.created[-1]]),
+            data=body, content_type=content_type)
+
+    def cleanup(self):
+        """Delete the recipes this worker created"""
+        for recipe_id in self.created:
+            self.client.request(
+                'DELETE', reverse('recipe:recipe-detail', args=[recipe_id]))
+
+    def run(self):
+        scenarios = {
+            'token': self.login,
+            'recipe list': self.recipe_list,
+            'recipe filter': self.recipe_filter,
+            'recipe detail': self.recipe_detail,
+            'recipe create': self.recipe_create,
+            'image upload': self.image_upload,
+        }
+        names = [name for name, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        try:
+            self.setup()
+            while time.perf_counter() < self.deadline:
+                scenarios[self.rng.choices(names, weights)[0]]()
+        except (CommandError, URLError, OSError) as exc:
+            self.error = exc
+        finally:
+            self.cleanup()
+
+
+class Command(BaseCommand):
+    """Drive a realistic request mix at the API and report latencies"""
+
+    help = 'Load-test the recipe and user APIs against seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='API to test; by default runserver is started for you'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Simultaneous simulated users (default 8)'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds to run for (default 30)'
+        )
+        parser.add_argument(
+            '--random-seed', type=int, default=42,
+            help='Seed for the request mix'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Seconds before a request is abandoned'
+        )
+        parser.add_argument(
+            '--output', metavar='FILE',
+            help='Save the results as JSON'
+        )
+        parser.add_argument(
+            '--compare', metavar='FILE',
+            help='Flag regressions against an earlier --output'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Change that counts as a regression (default 0.1 = 10%%)'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error if any regression is flagged'
+        )
+
+    def start_server(self):
+        """Run the development server on a free port"""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        self.server = subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+             'runserver', f'127.0.0.1:{port}', '--noreload'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), 1):
+                    return url
+            except OSError:
+                if self.server.poll() is not None:
+                    break
+                time.sleep(0.2)
+
+        self.server.terminate()
+        raise CommandError('The development server did not start')
+
+    def record(self, name, elapsed, status):
+        """Collect one measurement; called from the worker threads"""
+        with self.lock:
+            if status < 400:
+                self.latencies[name].append(elapsed)
+            else:
+                self.errors[name][status] += 1
+
+    def run_workers(self, url, options):
+        """Run the simulated users and return the elapsed time"""
+        rng = random.Random(options['random_seed'])
+        image = sample_image()
+        start = time.perf_counter()
+        deadline = start + options['duration']
+        workers = [
+            Worker(BENCH_EMAIL.format(n), Client(url, options['timeout']),
+                   random.Random(rng.random()), deadline, self.record, image)
+            for n in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        failed = [worker.error for worker in workers if worker.error]
+        if failed:
+            raise CommandError(f'{len(failed)} workers failed: {failed[0]}')
+
+        return time.perf_counter() - start
+
+    def report(self, results):
+        """Print a table of the results"""
+        self.stdout.write(
+            f'{"endpoint":<16}{"req":>8}{"err":>6}{"req/s":>9}'
+            f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+        for name, row in results['endpoints'].items():
+            self.stdout.write(
+                f'{name:<16}{row["requests"]:>8}{row["errors"]:>6}'
+                f'{row["throughput"]:>9.1f}' + ''.join(
+                    f'{row[f"p{pct}_ms"] or 0:>9.1f}' for pct in PERCENTILES))
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.server = None
+
+        url = options['url']
+        if url is None:
+            url = self.start_server()
+        try:
+            duration = self.run_workers(url, options)
+        finally:
+            if self.server is not None:
+                self.server.terminate()
+                self.server.wait()
+
+        results = {
+            'commit': git_commit(),
+            'started': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in (
+                'concurrency', 'duration', 'random_seed')},
+            'duration': duration,
+            'endpoints': {
+                name: summarize(
+                    self.latencies[name], self.errors[name], duration)
+                for name, _ in MIX
+            },
+        }
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results saved to {options["output"]}')
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options['threshold'])
+            for name, message in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f'REGRESSION {name}: {message}'))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS(
+                    f'No regressions against {baseline.get("commit")}'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions')
@@ -0,0 +1,142 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef
+
+from core.management.commands.seed_benchmark_data import BENCH_EMAIL, seed
+from core.models import Tag, Ingredient, Recipe
+from recipe.views import filter_by_links
+
+# The indexes added by core migration 0008
+ACCESS_PATH_INDEXES = (
+    'core_tag_user_name_idx',
+    'core_ingredient_user_name_idx',
+    'core_recipe_user_id_idx',
+    'core_recipe_tags_tag_recipe_idx',
+    'core_recipe_ingr_ingr_recipe_idx',
+)
+
+
+def access_paths(user):
+    """The queries recipe.views runs, keyed by a short description"""
+    tag = Tag.objects.filter(user=user).order_by('id').first()
+    # The two tags on most of the user's recipes
+    common = list(Recipe.tags.through.objects.filter(
+        recipe__user=user
+    ).values('tag_id').annotate(uses=Count('*')).order_by(
+        '-uses').values_list('tag_id', flat=True)[:2])
+    middle = Recipe.objects.filter(user=user).order_by('-id').values_list(
+        'id', flat=True)[50:51]
+    return [
+        ('tag list', Tag.objects.filter(
+            user=user).order_by('-name', '-id')[:100]),
+        ('ingredient list', Ingredient.objects.filter(
+            user=user).order_by('-name', '-id')[:100]),
+        ('recipe list', Recipe.objects.filter(
+            user=user).order_by('-id')[:100]),
+        ('recipe keyset page', Recipe.objects.filter(
+            user=user, id__lt=middle).order_by('-id')[:100]),
+        # Just columns, as recipe.readers selects, so the link filters are
+        # only in the WHERE clause
+        ('recipes by tag', filter_by_links(
+            Recipe.objects.filter(user=user), 'tags', [tag.id if tag else 0]
+        ).order_by('-id').values('id', 'title')[:100]),
+        ('recipes with any of two tags', filter_by_links(
+            Recipe.objects.filter(user=user), 'tags', common
+        ).order_by('-id').values('id', 'title')[:100]),
+        ('recipes with all of two tags', filter_by_links(
+            Recipe.objects.filter(user=user), 'tags', common, match_all=True
+        ).order_by('-id').values('id', 'title')[:100]),
+        ('tags in use', Tag.objects.filter(user=user).annotate(
+            assigned=Exists(Recipe.tags.through.objects.filter(
+                tag_id=OuterRef('pk')))
+        ).filter(assigned=True).order_by('-name', '-id')[:100]),
+    ]
+
+
+class Command(BaseCommand):
+    """Show the plans of the API's queries with and without the
+    composite indexes, against seeded data"""
+
+    help = 'Compare query plans with and without the access path indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='First seed benchmark data with this many recipes per '
+                 'user (see seed_benchmark_data)'
+        )
+        parser.add_argument(
+            '--users', type=int, default=5,
+            help='How many users to seed (default 5)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Runs of each query to average the timing over'
+        )
+        parser.add_argument(
+            '--random-seed', type=int, default=42,
+            help='Seed for the generated data'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Use EXPLAIN ANALYZE (PostgreSQL only)'
+        )
+
+    def measure(self, queryset, repeat):
+        """Return (plan, average milliseconds) for queryset"""
+        plan = queryset.explain(**self.explain_options)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+
+        return plan, elapsed
+
+    def run_all(self, user, repeat):
+        """Measure every access path"""
+        return {
+            name: self.measure(queryset, repeat)
+            for name, queryset in access_paths(user)
+        }
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        self.explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            self.explain_options = {'analyze': True, 'buffers': True}
+
+        if options['seed']:
+            self.stdout.write('Seeding data...')
+            seed(options['users'], options['users'] * options['seed'],
+                 options['random_seed'])
+
+        # The seeded user with the most recipes
+        user = get_user_model().objects.filter(
+            email=BENCH_EMAIL.format(0)).first()
+        if user is None:
+            self.stderr.write('No benchmark data; run with --seed first')
+            return
+
+        # Drop the indexes and measure, then roll back to put them back.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index in ACCESS_PATH_INDEXES:
+                    cursor.execute(f'DROP INDEX {index}')
+            before = self.run_all(user, options['repeat'])
+            transaction.set_rollback(True)
+
+        # SQLite's statement cache would otherwise replay the old plans
+        connection.close()
+        after = self.run_all(user, options['repeat'])
+
+        for name in after:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name}'))
+            for label, (plan, ms) in (('before', before[name]),
+                                      ('after', after[name])):
+                self.stdout.write(f'-- {label}: {ms:.2f} ms')
+                self.stdout.write(plan)
+
+        self.stdout.write(self.style.SUCCESS('Done'))
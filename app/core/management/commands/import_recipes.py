@@ -0,0 +1,332 @@
+import io
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.models import ImportCheckpoint, Tag, Ingredient, Recipe
+from core.utils import chunks
+from recipe.signals import recipes_bulk_saved
+
+RECIPE_FIELDS = ('title', 'time_minutes', 'price', 'link')
+
+
+def read_batches(f, size):
+    """Yield (lines, offset after them) from a binary file, size at a time"""
+    lines = []
+    while True:
+        line = f.readline()
+        if line:
+            lines.append(line)
+        if lines and (not line or len(lines) == size):
+            yield lines, f.tell()
+            lines = []
+        if not line:
+            return
+
+
+def clean_names(values, model):
+    """Turn a list of names, or of {"name": ...} objects, into clean names"""
+    if not isinstance(values, list):
+        raise ValueError(f'{model._meta.verbose_name_plural} must be a list')
+
+    field = model._meta.get_field('name')
+    names = []
+    for value in values:
+        if isinstance(value, dict):
+            value = value.get('name')
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'Invalid {model._meta.verbose_name} {value!r}')
+        names.append(field.clean(value.strip(), None))
+
+    return list(OrderedDict.fromkeys(names))
+
+
+def parse_item(line, default_email):
+    """Validate one line of the import file"""
+    data = json.loads(line.decode('utf-8'))
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+
+    email = data.get('user') or default_email
+    if not email:
+        raise ValueError('No user given and no --user default')
+
+    item = {'email': email}
+    for name in RECIPE_FIELDS:
+        value = data.get(name, '' if name == 'link' else None)
+        item[name] = Recipe._meta.get_field(name).clean(value, None)
+    item['tags'] = clean_names(data.get('tags', []), Tag)
+    item['ingredients'] = clean_names(data.get('ingredients', []), Ingredient)
+
+    return item
+
+
+def resolve_names(model, pairs):
+    """Map (user id, name) -> id, creating the objects that don't exist
+
+    When a user already has several objects of the same name, the oldest
+    one is used.
+    """
+    found = {}
+
+    def lookup(wanted):
+        for chunk in chunks(wanted):
+            rows = model.objects.filter(
+                user_id__in={user_id for user_id, _ in chunk},
+                name__in={name for _, name in chunk},
+            ).order_by('id').values_list('user_id', 'name', 'id')
+            for user_id, name, pk in rows:
+                found.setdefault((user_id, name), pk)
+
+    lookup(pairs)
+    missing = [pair for pair in pairs if pair not in found]
+    if missing:
+        model.objects.bulk_create(
+            model(user_id=user_id, name=name) for user_id, name in missing)
+        lookup(missing)
+
+    return found
+
+
+def copy_csv(rows):
+    """Encode rows for COPY's csv format
+
+    Every value is quoted, so only None, written as a bare empty field,
+    reads back as NULL; text such as \\N or an empty string stays text.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(
+            '' if value is None
+            else '"{}"'.format(str(value).replace('"', '""'))
+            for value in row
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(table, columns, rows):
+    """Load rows into table with PostgreSQL's COPY"""
+    sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        connection.ops.quote_name(table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, copy_csv(rows))
+
+
+class CopyLoader:
+    """Insert recipes and their links with COPY (PostgreSQL)"""
+
+    def allocate_ids(self, count):
+        """Reserve count ids from the recipe table's sequence"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [Recipe._meta.db_table, Recipe._meta.pk.column, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def load_recipes(self, recipes):
+        """Insert recipes, giving each its id"""
+        for recipe, pk in zip(recipes, self.allocate_ids(len(recipes))):
+            recipe.pk = pk
+
+        fields = Recipe._meta.concrete_fields
+        copy_rows(
+            Recipe._meta.db_table,
+            [field.column for field in fields],
+            ([field.get_db_prep_save(field.pre_save(recipe, True),
+                                     connection) for field in fields]
+             for recipe in recipes)
+        )
+
+    def load_links(self, through, columns, pairs):
+        """Insert (recipe id, target id) rows into a through table"""
+        copy_rows(through._meta.db_table, columns, pairs)
+
+
+class BulkCreateLoader:
+    """Insert recipes and their links with bulk_create (other backends)"""
+
+    def load_recipes(self, recipes):
+        """Insert recipes, giving each its id"""
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            return
+
+        # The batch's transaction already holds the write lock, so the
+        # new rows are exactly those above the current maximum, in order.
+        before = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        Recipe.objects.bulk_create(recipes)
+        ids = list(Recipe.objects.filter(id__gt=before).order_by(
+            'id').values_list('id', flat=True))
+        if len(ids) != len(recipes):
+            raise CommandError('Recipes were added by someone else mid-batch')
+        for recipe, pk in zip(recipes, ids):
+            recipe.pk = pk
+
+    def load_links(self, through, columns, pairs):
+        """Insert (recipe id, target id) rows into a through table
+
+        These rows are plain id pairs, so executemany() skips building a
+        model instance for each of them.
+        """
+        sql = 'INSERT INTO {} ({}) VALUES (%s, %s)'.format(
+            connection.ops.quote_name(through._meta.db_table),
+            ', '.join(connection.ops.quote_name(column)
+                      for column in columns),
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, pairs)
+
+
+class Command(BaseCommand):
+    """Load recipes from a JSON lines file, a batch per transaction"""
+
+    help = 'Import recipes from a JSONL file, resuming where it stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL file, one recipe per line')
+        parser.add_argument(
+            '--user', metavar='EMAIL',
+            help='Owner of recipes whose line has no "user"'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Lines per transaction (default 5000)'
+        )
+        parser.add_argument(
+            '--source',
+            help='Name to checkpoint progress under (default: the path)'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Ignore any checkpoint and start from the first line'
+        )
+
+    def get_users(self, emails):
+        """Map email -> user, for the users that exist"""
+        missing = [email for email in emails if email not in self.users]
+        for chunk in chunks(missing):
+            for user in get_user_model().objects.filter(email__in=chunk):
+                self.users[user.email] = user
+
+        return {email: self.users[email]
+                for email in emails if email in self.users}
+
+    def parse_batch(self, lines, first_line):
+        """Validate a batch of lines, reporting the ones that are skipped"""
+        items = []
+        for number, line in enumerate(lines, first_line):
+            if not line.strip():
+                continue
+            try:
+                item = parse_item(line, self.default_email)
+            except (ValueError, ValidationError) as exc:
+                messages = getattr(exc, 'messages', [str(exc)])
+                self.skip(number, '; '.join(messages))
+            else:
+                item['line'] = number
+                items.append(item)
+
+        users = self.get_users({item['email'] for item in items})
+        for item in items:
+            item['user'] = users.get(item['email'])
+            if item['user'] is None:
+                self.skip(item['line'], f'Unknown user {item["email"]}')
+
+        return [item for item in items if item['user'] is not None]
+
+    def skip(self, number, message):
+        """Report a line that won't be imported"""
+        self.skipped += 1
+        self.stderr.write(f'Line {number}: {message}')
+
+    def load_batch(self, items):
+        """Write a batch of recipes with their tags and ingredients"""
+        recipes = [
+            Recipe(user=item['user'],
+                   **{name: item[name] for name in RECIPE_FIELDS})
+            for item in items
+        ]
+        self.loader.load_recipes(recipes)
+
+        for field, model in (('tags', Tag), ('ingredients', Ingredient)):
+            ids = resolve_names(model, {
+                (item['user'].pk, name)
+                for item in items for name in item[field]
+            })
+            m2m = Recipe._meta.get_field(field)
+            columns = [f'{m2m.m2m_field_name()}_id',
+                       f'{m2m.m2m_reverse_field_name()}_id']
+            self.loader.load_links(m2m.remote_field.through, columns, [
+                (recipe.pk, ids[(item['user'].pk, name)])
+                for recipe, item in zip(recipes, items)
+                for name in item[field]
+            ])
+
+        by_user = defaultdict(list)
+        for recipe in recipes:
+            by_user[recipe.user].append(recipe.pk)
+        for user, recipe_ids in by_user.items():
+            recipes_bulk_saved.send(
+                sender=Recipe, user=user, recipe_ids=recipe_ids)
+
+        return len(recipes)
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'No such file: {path}')
+
+        self.default_email = options['user']
+        self.users = {}
+        self.skipped = 0
+        self.loader = CopyLoader() if connection.vendor == 'postgresql' \
+            else BulkCreateLoader()
+
+        source = options['source'] or os.path.abspath(path)
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source)
+        if options['restart']:
+            checkpoint.offset = checkpoint.lines = checkpoint.recipes = 0
+            checkpoint.save()
+        elif checkpoint.offset:
+            self.stdout.write(
+                f'Resuming after line {checkpoint.lines:,} '
+                f'({checkpoint.recipes:,} recipes already imported)')
+
+        start = time.perf_counter()
+        imported = 0
+        with open(path, 'rb') as f:
+            f.seek(checkpoint.offset)
+            for lines, offset in read_batches(f, options['batch_size']):
+                items = self.parse_batch(lines, checkpoint.lines + 1)
+                with transaction.atomic():
+                    # Write the checkpoint first: on SQLite that takes the
+                    # write lock before any ids are worked out.
+                    checkpoint.offset = offset
+                    checkpoint.lines += len(lines)
+                    checkpoint.recipes += len(items)
+                    checkpoint.save()
+                    if items:
+                        imported += self.load_batch(items)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{checkpoint.lines:,} lines, {imported:,} recipes '
+                    f'imported, {imported / elapsed:,.0f} recipes/s')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {imported:,} recipes imported, {self.skipped:,} lines '
+            f'skipped'))
@@ -0,0 +1,95 @@
+import io
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import load
+
+
+def summarize_collapsed(path, limit):
+    """Return (samples, [(samples, frame)]) for the frames most often on
+    top of the stack"""
+    own = Counter()
+    total = 0
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            own[stack.rsplit(';', 1)[-1]] += int(count)
+            total += int(count)
+
+    return total, [(count, frame) for frame, count in own.most_common(limit)]
+
+
+class Command(BaseCommand):
+    """List saved request profiles, or summarize one of them"""
+
+    help = 'List request profiles, or summarize the one given by id'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'id', nargs='?',
+            help='Profile to summarize (see the X-Profile-Id header)'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=25,
+            help='Profiles to list, or functions to show (default 25)'
+        )
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='pstats sort key for pstats profiles (default cumulative)'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        profiles = load()
+        if not options['id']:
+            self.list_profiles(profiles[-options['limit']:])
+            return
+
+        matches = [meta for meta in profiles
+                   if meta['id'].startswith(options['id'])]
+        if len(matches) != 1:
+            raise CommandError(
+                f'{len(matches)} profiles match {options["id"]!r}')
+        self.summarize(matches[0], options['limit'], options['sort'])
+
+    def list_profiles(self, profiles):
+        if not profiles:
+            self.stdout.write(f'No profiles in {settings.PROFILE_DIR}')
+            return
+
+        for meta in reversed(profiles):
+            self.stdout.write(
+                f'{meta["id"]}  {meta["format"]:<9}  '
+                f'{meta["duration_ms"]:>8.1f}ms  '
+                f'{meta["queries"] if meta["queries"] is not None else "-":>4}'
+                f' queries  {meta["status"]}  {meta["method"]} '
+                f'{meta["path"]}  {meta["view"] or ""}'
+                f'{"  (sampled)" if meta["sampled"] else ""}')
+
+    def summarize(self, meta, limit, sort):
+        path = os.path.join(settings.PROFILE_DIR, meta['file'])
+        self.stdout.write(
+            f'{meta["method"]} {meta["path"]} -> {meta["status"]} '
+            f'({meta["view"] or "no view"}), {meta["duration_ms"]}ms, '
+            f'{meta["queries"]} queries, user {meta["user"]}, {meta["time"]}')
+        self.stdout.write(f'File: {path}')
+
+        if meta['format'] == 'pstats':
+            stream = io.StringIO()
+            stats = pstats.Stats(path, stream=stream)
+            stats.strip_dirs().sort_stats(sort).print_stats(limit)
+            self.stdout.write(stream.getvalue())
+            return
+
+        total, frames = summarize_collapsed(path, limit)
+        if not total:
+            self.stdout.write('No samples: the request finished within one '
+                              'sampling interval')
+            return
+        self.stdout.write(f'{total} samples; where they were spent:')
+        for count, frame in frames:
+            self.stdout.write(f'{count / total:>7.1%}  {count:>6}  {frame}')
@@ -0,0 +1,275 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.management.commands.import_recipes import BulkCreateLoader, \
+    CopyLoader
+from core.models import Tag, Ingredient, Recipe
+from recipe.caching import bump_generation
+from recipe.indexes import recipes_changed
+from recipe.search import unindex
+from recipe.signals import recipes_bulk_saved
+
+BENCH_DOMAIN = 'seed.example'
+BENCH_EMAIL = 'bench-{}@' + BENCH_DOMAIN
+BENCH_PASSWORD = 'benchmark'
+# Recipes written per round trip
+CHUNK_SIZE = 10000
+
+ADJECTIVES = (
+    'Quick', 'Spicy', 'Creamy', 'Roasted', 'Crispy', 'Smoky', 'Hearty',
+    'Zesty', 'Slow-cooked', 'Grilled', 'Sticky', 'Golden', 'Rustic',
+)
+DISHES = (
+    'soup', 'curry', 'stew', 'salad', 'pie', 'risotto', 'tacos', 'pasta',
+    'noodles', 'tart', 'bread', 'casserole', 'stir-fry', 'cake', 'chili',
+)
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dessert', 'Breakfast', 'Dinner', 'Lunch',
+    'Quick', 'Gluten-free', 'Spicy', 'Comfort', 'Party', 'Budget',
+    'Healthy', 'Baking', 'Summer', 'Winter', 'Kids', 'Batch-cook',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Onion', 'Garlic', 'Butter', 'Flour', 'Sugar',
+    'Egg', 'Milk', 'Tomato', 'Potato', 'Carrot', 'Rice', 'Chicken',
+    'Lentils', 'Lemon', 'Basil', 'Cumin', 'Ginger', 'Cheese', 'Spinach',
+)
+# How many tags and ingredients a recipe gets, as (count, weight)
+TAG_COUNTS = ((0, 10), (1, 25), (2, 30), (3, 20), (4, 10), (5, 4), (6, 1))
+INGREDIENT_COUNTS = (
+    (2, 2), (3, 5), (4, 9), (5, 13), (6, 15), (7, 15), (8, 13), (9, 11),
+    (10, 8), (11, 5), (12, 4),
+)
+
+
+def zipf_weights(n, exponent):
+    """Weights 1/rank**exponent for ranks 1..n"""
+    return [1 / rank ** exponent for rank in range(1, n + 1)]
+
+
+def zipf_split(total, n, exponent):
+    """Split total into n Zipf-distributed integer shares, largest first
+
+    Every share gets at least one as long as total allows it; the rest is
+    divided by largest remainder so the shares always add up to total.
+    """
+    base = 1 if total >= n else 0
+    rest = total - base * n
+    weights = zipf_weights(n, exponent)
+    scale = rest / sum(weights)
+    exact = [weight * scale for weight in weights]
+    shares = [int(value) for value in exact]
+    by_remainder = sorted(
+        range(n), key=lambda i: exact[i] - shares[i], reverse=True)
+    for i in by_remainder[:rest - sum(shares)]:
+        shares[i] += 1
+
+    return [base + share for share in shares]
+
+
+def vocabulary_size(recipes, factor, low, high):
+    """How many distinct tags or ingredients a user with recipes has"""
+    return max(low, min(high, round(factor * recipes ** 0.5)))
+
+
+def names(words, count):
+    """Make count distinct names out of a word list"""
+    return [
+        words[i % len(words)] + ('' if i < len(words) else
+                                 f' {i // len(words) + 1}')
+        for i in range(count)
+    ]
+
+
+def pick(rng, ids, cum_weights, counts):
+    """Choose a Zipf-weighted set of ids, sized by a (count, weight) table"""
+    count = rng.choices(
+        [count for count, _ in counts],
+        weights=[weight for _, weight in counts]
+    )[0]
+    if not ids or not count:
+        return []
+
+    return list(dict.fromkeys(
+        rng.choices(ids, cum_weights=cum_weights, k=count)))
+
+
+def get_loader():
+    """Write rows with COPY on PostgreSQL, bulk inserts elsewhere"""
+    if connection.vendor == 'postgresql':
+        return CopyLoader()
+    return BulkCreateLoader()
+
+
+def seed_users(count, email):
+    """Create count users sharing one password hash"""
+    password = make_password(BENCH_PASSWORD)
+    emails = [email.format(n) for n in range(count)]
+    get_user_model().objects.bulk_create(
+        get_user_model()(email=address, password=password)
+        for address in emails
+    )
+    users = get_user_model().objects.in_bulk(emails, field_name='email')
+    return [users[address] for address in emails]
+
+
+def create_named(model, user, count, words):
+    """Create count tags or ingredients for user and return their ids"""
+    model.objects.bulk_create(
+        model(user=user, name=name) for name in names(words, count))
+    # Not every backend returns ids from bulk_create, so read them back
+    return list(model.objects.filter(user=user).order_by(
+        'id').values_list('id', flat=True))
+
+
+def seed_user(user, recipes, rng, exponent, loader):
+    """Give user recipes with Zipf-popular tags and ingredients"""
+    tag_ids = create_named(
+        Tag, user, vocabulary_size(recipes, 3, 5, 500), TAG_WORDS)
+    ingredient_ids = create_named(
+        Ingredient, user, vocabulary_size(recipes, 8, 10, 2000),
+        INGREDIENT_WORDS)
+    tag_weights = list(accumulate(zipf_weights(len(tag_ids), exponent)))
+    ingredient_weights = list(accumulate(
+        zipf_weights(len(ingredient_ids), exponent)))
+
+    for start in range(0, recipes, CHUNK_SIZE):
+        batch = [
+            Recipe(
+                user=user,
+                title=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} {i}',
+                time_minutes=rng.choice((5, 10, 15, 20, 30, 45, 60, 90)),
+                price=f'{rng.randint(100, 4999) / 100:.2f}',
+            )
+            for i in range(start, min(start + CHUNK_SIZE, recipes))
+        ]
+        loader.load_recipes(batch)
+
+        tags = [(recipe.pk, tag_id) for recipe in batch for tag_id in pick(
+            rng, tag_ids, tag_weights, TAG_COUNTS)]
+        ingredients = [
+            (recipe.pk, ingredient_id) for recipe in batch
+            for ingredient_id in pick(
+                rng, ingredient_ids, ingredient_weights, INGREDIENT_COUNTS)
+        ]
+        loader.load_links(
+            Recipe.tags.through, ['recipe_id', 'tag_id'], tags)
+        loader.load_links(
+            Recipe.ingredients.through, ['recipe_id', 'ingredient_id'],
+            ingredients)
+
+        recipes_bulk_saved.send(
+            sender=Recipe, user=user,
+            recipe_ids=[recipe.pk for recipe in batch])
+
+
+def flush(users):
+    """Delete a queryset of users and all their data
+
+    The recipes, their links, tags and ingredients go one DELETE per
+    table, skipping the per-row signals, and each user's caches and
+    indexes are invalidated once instead.
+    """
+    user_ids = list(users.values_list('pk', flat=True))
+    with transaction.atomic():
+        unindex(Recipe.objects.filter(user__in=users))
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            through.objects.filter(recipe__user__in=users)._raw_delete(
+                through.objects.db)
+        for model in (Recipe, Tag, Ingredient):
+            model.objects.filter(user__in=users)._raw_delete(
+                model.objects.db)
+        for user_id in user_ids:
+            bump_generation(user_id)
+            recipes_changed(user_id)
+        users.delete()
+
+
+def seed(users, recipes, random_seed=42, exponent=1.1, email=BENCH_EMAIL,
+         progress=None):
+    """Create users sharing recipes between them along a Zipf curve
+
+    The same arguments always produce the same data. User 0 has the most
+    recipes. progress(user number, recipes so far) is called after each
+    user. Returns the users.
+    """
+    rng = random.Random(random_seed)
+    loader = get_loader()
+    created = seed_users(users, email)
+
+    done = 0
+    for n, (user, count) in enumerate(zip(
+            created, zipf_split(recipes, users, exponent))):
+        # One transaction per user, opened by a write, keeps the id
+        # read-back of the bulk insert fallback safe.
+        with transaction.atomic():
+            seed_user(user, count, rng, exponent, loader)
+        done += count
+        if progress is not None:
+            progress(n, done)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return created
+
+
+class Command(BaseCommand):
+    """Generate a reproducible, production-shaped dataset"""
+
+    help = 'Seed users, recipes, tags and ingredients for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Number of users (default 1000)'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=1000000,
+            help='Total recipes shared between the users (default 1M)'
+        )
+        parser.add_argument(
+            '--random-seed', type=int, default=42,
+            help='Seed for the generated data'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Zipf exponent; higher is more skewed (default 1.1)'
+        )
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete previously seeded users and their data first'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if options['users'] < 1 or options['recipes'] < 0:
+            raise CommandError('Need at least one user and no negative '
+                               'recipe count')
+
+        seeded = get_user_model().objects.filter(
+            email__endswith='@' + BENCH_DOMAIN)
+        if options['flush']:
+            flush(seeded)
+        elif seeded.exists():
+            raise CommandError(
+                'Benchmark data already exists; use --flush to replace it')
+
+        start = time.perf_counter()
+
+        def progress(n, done):
+            if n % 100 == 0 or n == options['users'] - 1:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{n + 1:,} users, {done:,} recipes, '
+                    f'{done / elapsed:,.0f} recipes/s')
+
+        seed(options['users'], options['recipes'], options['random_seed'],
+             options['exponent'], progress=progress)
+
+        self.stdout.write(self.style.SUCCESS('Done'))
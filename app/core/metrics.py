@@ -0,0 +1,367 @@
+"""
+Request metrics in the Prometheus text format.
+
+QueryInstrumentationMiddleware records every request here, labelled by
+view and action: how long it took, how many queries it ran, how big the
+response was and its status code. Recording is a few additions under a
+lock, cheap enough to leave on all the time.
+
+Each process keeps its own counts. With METRICS_DIR set, every process
+also writes a snapshot to METRICS_DIR/metrics-<pid>.json at most every
+METRICS_FLUSH_INTERVAL seconds and when it exits, and the endpoint adds
+up the snapshots of all workers. Like prometheus_client's
+mark_process_dead, the snapshots of workers that have exited are folded
+into metrics-dead.json, so the directory doesn't grow with every
+recycled worker and a new process given an old pid doesn't overwrite its
+predecessor's counts. Clear the directory when the whole server
+restarts.
+
+The endpoint is open with DEBUG on; otherwise it needs METRICS_TOKEN.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+SNAPSHOT_NAME = re.compile(r'metrics-(\d+)\.json$')
+DEAD_FILE = 'metrics-dead.json'
+LOCK_FILE = 'metrics.lock'
+
+
+class Metric:
+    """A counter, or a histogram when it has buckets"""
+
+    def __init__(self, name, help_text, labels, buckets=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+
+    @property
+    def kind(self):
+        return 'counter' if self.buckets is None else 'histogram'
+
+    def empty(self):
+        """A fresh value: a number, or bucket counts plus the sum"""
+        if self.buckets is None:
+            return 0
+        return [0] * (len(self.buckets) + 2)
+
+
+REQUEST_METRICS = (
+    Metric('http_request_duration_seconds',
+           'Time taken to build the response.',
+           ('view', 'action'), DURATION_BUCKETS),
+    Metric('http_request_queries',
+           'SQL queries run while building the response.',
+           ('view', 'action'), QUERY_BUCKETS),
+    Metric('http_response_size_bytes',
+           'Size of the response body.',
+           ('view', 'action'), SIZE_BUCKETS),
+    Metric('http_responses_total',
+           'Responses sent, by status code.',
+           ('view', 'action', 'status')),
+)
+
+
+def add(metric, total, value):
+    """Add one process's value of metric into total and return it"""
+    if metric.buckets is None:
+        return total + value
+    return [a + b for a, b in zip(total, value)]
+
+
+def escape(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+def pid_exists(pid):
+    """Whether a process with this pid is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_rows(path):
+    """Load a snapshot file, or None when it is gone or half-written"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_rows(path, rows):
+    """Replace a snapshot file in one step"""
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(rows, f)
+    os.replace(temp, path)
+
+
+def format_number(value):
+    if isinstance(value, float) and value != int(value):
+        return repr(value)
+    return str(int(value))
+
+
+class Registry:
+    """Metric values for this process, optionally shared through a directory
+
+    Values are keyed by (metric name, label values). A process forked
+    after values were recorded starts again from zero, so workers don't
+    report their parent's requests as their own.
+    """
+
+    def __init__(self, metrics=REQUEST_METRICS, directory=None,
+                 flush_interval=5):
+        self.metrics = OrderedDict((metric.name, metric)
+                                   for metric in metrics)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.values = {}
+        self.flushed = time.monotonic()
+        if self.directory:
+            # A snapshot under our pid is from a dead process that had it
+            self.mark_dead(self.pid)
+
+    def snapshot_path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    @property
+    def path(self):
+        return self.snapshot_path(self.pid)
+
+    @contextmanager
+    def files_locked(self, exclusive=False):
+        """Hold the directory's lock: shared to read the snapshots,
+        exclusive to fold one into the dead total"""
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def add_rows(self, totals, rows):
+        """Add a snapshot's rows into totals"""
+        for name, labels, value in rows:
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            key = (name, tuple(labels))
+            totals[key] = add(
+                metric, totals.get(key, metric.empty()), value)
+        return totals
+
+    def mark_dead(self, pid):
+        """Fold the snapshot of an exited process into metrics-dead.json"""
+        path = self.snapshot_path(pid)
+        dead = os.path.join(self.directory, DEAD_FILE)
+        with self.files_locked(exclusive=True):
+            rows = read_rows(path)
+            if rows is None:
+                return
+            totals = self.add_rows(
+                self.add_rows({}, read_rows(dead) or []), rows)
+            write_rows(dead, [[name, list(labels), value]
+                              for (name, labels), value in totals.items()])
+            os.remove(path)
+
+    def inc(self, name, labels, amount=1):
+        """Add amount to a counter"""
+        self._record(name, labels, amount)
+
+    def observe(self, name, labels, value):
+        """Count value in a histogram"""
+        self._record(name, labels, value)
+
+    def _record(self, name, labels, value):
+        metric = self.metrics[name]
+        with self._lock:
+            if self.pid != os.getpid():
+                self._reset()
+            key = (name, tuple(labels))
+            if metric.buckets is None:
+                self.values[key] = self.values.get(key, 0) + value
+            else:
+                counts = self.values.get(key)
+                if counts is None:
+                    counts = self.values[key] = metric.empty()
+                # Buckets are stored per bucket and summed up on output
+                counts[bisect_left(metric.buckets, value)] += 1
+                counts[-1] += value
+            due = self.directory and \
+                time.monotonic() - self.flushed >= self.flush_interval
+
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        """Copy this process's values"""
+        with self._lock:
+            if self.pid != os.getpid():
+                self._reset()
+            return {key: list(value) if isinstance(value, list) else value
+                    for key, value in self.values.items()}
+
+    def flush(self):
+        """Write this process's values where other processes can read them"""
+        if not self.directory:
+            return
+        values = self.snapshot()
+        self.flushed = time.monotonic()
+
+        write_rows(self.path, [[name, list(labels), value]
+                               for (name, labels), value in values.items()])
+
+    def collect(self):
+        """Add up the values of every process, this one's live"""
+        totals = self.snapshot()
+        if not self.directory:
+            return totals
+
+        pattern = os.path.join(self.directory, 'metrics-*.json')
+        for path in glob.glob(pattern):
+            match = SNAPSHOT_NAME.search(path)
+            if match:
+                pid = int(match.group(1))
+                if pid != self.pid and not pid_exists(pid):
+                    self.mark_dead(pid)
+
+        own = self.path
+        with self.files_locked():
+            for path in glob.glob(pattern):
+                if path != own:
+                    self.add_rows(totals, read_rows(path) or [])
+
+        return totals
+
+    def render(self):
+        """Format every metric in the Prometheus text format"""
+        by_metric = defaultdict(list)
+        for (name, labels), value in sorted(self.collect().items()):
+            by_metric[name].append((labels, value))
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for labels, value in by_metric[metric.name]:
+                pairs = list(zip(metric.labels, labels))
+                if metric.buckets is None:
+                    lines.append(f'{metric.name}{format_labels(pairs)} '
+                                 f'{format_number(value)}')
+                    continue
+
+                count = 0
+                bounds = [format_number(bucket) for bucket in metric.buckets]
+                for bound, bucket in zip(bounds + ['+Inf'], value[:-1]):
+                    count += bucket
+                    lines.append(
+                        f'{metric.name}_bucket'
+                        f'{format_labels(pairs + [("le", bound)])} {count}')
+                lines.append(f'{metric.name}_sum{format_labels(pairs)} '
+                             f'{format_number(value[-1])}')
+                lines.append(
+                    f'{metric.name}_count{format_labels(pairs)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the registry requests are recorded in"""
+    global _registry
+
+    if _registry is None:
+        _registry = Registry(
+            directory=settings.METRICS_DIR,
+            flush_interval=settings.METRICS_FLUSH_INTERVAL
+        )
+        if _registry.directory:
+            atexit.register(_registry.flush)
+
+    return _registry
+
+
+def reset_registry():
+    """Forget the registry so the next request rebuilds it from settings"""
+    global _registry
+    _registry = None
+
+
+def response_size(response):
+    """Body size in bytes, or None for a stream of unknown length"""
+    if not response.streaming:
+        return len(response.content)
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return None
+
+
+def observe_request(timings, response, duration):
+    """Record a finished request, given its RequestTimings"""
+    registry = get_registry()
+    labels = (timings.viewset or 'none', timings.action)
+
+    registry.observe('http_request_duration_seconds', labels, duration)
+    registry.observe('http_request_queries', labels, timings.queries)
+    size = response_size(response)
+    if size is not None:
+        registry.observe('http_response_size_bytes', labels, size)
+    registry.inc('http_responses_total', labels + (response.status_code,))
+
+
+@require_safe
+def metrics_view(request):
+    """Serve the metrics to holders of METRICS_TOKEN, or to anyone with
+    DEBUG on and no token set"""
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not constant_time_compare(header, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+
+    return HttpResponse(get_registry().render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,186 @@
+"""
+Per-request SQL instrumentation that is safe to leave on in production.
+
+connection.queries only fills up with DEBUG on, and then it keeps the text
+of every query until the request ends. QueryInstrumentationMiddleware
+installs an execute_wrapper on each database connection instead, which
+only counts queries and adds up their time.
+
+Every response gets a Server-Timing header with the query count, the time
+spent in the database, turning objects or rows into response data
+(serialize), encoding that data into the body (render), and the total.
+Views and serializers report their serialize time through serializing()
+and TimedSerializerMixin; it includes any queries serializing triggers,
+such as those for related rows.
+Requests over REQUEST_QUERY_BUDGET queries or REQUEST_LATENCY_BUDGET_MS
+milliseconds are logged with the view and action that served them, and
+with METRICS_ENABLED every request is recorded in core.metrics.
+
+Queries made while a streaming response is being sent happen after the
+headers are out, so they aren't counted.
+"""
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """Counters for one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.serialize_start = None
+        self.render = 0.0
+        self.render_start = None
+        self.viewset = None
+        self.action = ''
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: count the query and time it, keeping no SQL"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def rendered(self, response):
+        """Post-render callback: stop the render clock"""
+        if self.render_start is not None:
+            self.render += time.perf_counter() - self.render_start
+            self.render_start = None
+
+    @property
+    def view(self):
+        """The view and action, as 'RecipeViewSet.list'"""
+        if self.viewset is None:
+            return None
+        return '.'.join(filter(None, (self.viewset, self.action)))
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        """Format the Server-Timing header value"""
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def serializing(request):
+    """Count a block towards the request's serialize time
+
+    Blocks nested in one another count once.
+    """
+    timings = getattr(request, '_timings', None)
+    if timings is None or timings.serialize_start is not None:
+        yield
+        return
+
+    timings.serialize_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialize += time.perf_counter() - timings.serialize_start
+        timings.serialize_start = None
+
+
+class TimedSerializerMixin:
+    """Count a serializer's to_representation as serialize time"""
+
+    def to_representation(self, instance):
+        with serializing(self.context.get('request')):
+            return super().to_representation(instance)
+
+
+def view_labels(view_func, method):
+    """Return (view, action) naming what handles a request
+
+    DRF views are named by their class, and viewsets also by the action
+    the method maps to; plain views by their module and function.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}', ''
+
+    actions = getattr(view_func, 'actions', None) or {}
+    return cls.__name__, actions.get(method.lower(), '')
+
+
+class QueryInstrumentationMiddleware:
+    """Count and time the SQL of each request and report it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        request._timings = timings
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(timings))
+            response = self.get_response(request)
+
+        total = timings.total
+        if settings.REQUEST_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(total)
+        self.check_budgets(request, response, timings, total)
+        if settings.METRICS_ENABLED:
+            metrics.observe_request(timings, response, total)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timings.viewset, request._timings.action = view_labels(
+            view_func, request.method)
+
+    def process_template_response(self, request, response):
+        """Start the render clock; DRF responses are rendered right after"""
+        timings = request._timings
+        timings.render_start = time.perf_counter()
+        response.add_post_render_callback(timings.rendered)
+        return response
+
+    def check_budgets(self, request, response, timings, total):
+        """Log the request when it used too many queries or too much time"""
+        query_budget = settings.REQUEST_QUERY_BUDGET
+        latency_budget = settings.REQUEST_LATENCY_BUDGET_MS / 1000
+        over = []
+        if query_budget and timings.queries > query_budget:
+            over.append('queries')
+        if latency_budget and total > latency_budget:
+            over.append('latency')
+        if not over:
+            return
+
+        logger.warning(
+            'Over %s budget: %s %s (%s) -> %s, %d queries, %.1fms db, '
+            '%.1fms serialize, %.1fms render, %.1fms total',
+            ' and '.join(over), request.method, request.path,
+            timings.view or 'no view', response.status_code,
+            timings.queries, timings.db * 1000, timings.serialize * 1000,
+            timings.render * 1000, total * 1000,
+            extra={
+                'view': timings.view,
+                'queries': timings.queries,
+                'db_ms': timings.db * 1000,
+                'serialize_ms': timings.serialize * 1000,
+                'total_ms': total * 1000,
+            }
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-17 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_renditions_ready',
+            field=models.BooleanField(default=False),
+        ),
+    ]
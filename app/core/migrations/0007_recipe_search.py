@@ -0,0 +1,69 @@
+# Generated by Django 2.1.15 on 2026-10-17 01:18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Mirrors the statements in recipe.search, kept here so the migration
+# doesn't depend on application code.
+TAG_NAMES = (
+    "(SELECT {agg} FROM core_recipe_tags x JOIN core_tag n "
+    "ON n.id = x.tag_id WHERE x.recipe_id = r.id)"
+)
+INGREDIENT_NAMES = (
+    "(SELECT {agg} FROM core_recipe_ingredients x JOIN core_ingredient n "
+    "ON n.id = x.ingredient_id WHERE x.recipe_id = r.id)"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Build the full-text index the database supports, and fill it"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        agg = "string_agg(n.name, ' ')"
+        schema_editor.execute(
+            "UPDATE core_recipe r SET search_vector = "
+            "setweight(to_tsvector('english', r.title), 'A') || "
+            "setweight(to_tsvector('english', coalesce(%s, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(%s, '')), 'C')"
+            % (TAG_NAMES.format(agg=agg), INGREDIENT_NAMES.format(agg=agg))
+        )
+        schema_editor.execute(
+            'CREATE INDEX core_recipe_search_vector_gin '
+            'ON core_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        agg = "group_concat(n.name, ' ')"
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE core_recipe_fts '
+            'USING fts5(title, tags, ingredients)'
+        )
+        schema_editor.execute(
+            "INSERT INTO core_recipe_fts (rowid, title, tags, ingredients) "
+            "SELECT r.id, r.title, coalesce(%s, ''), coalesce(%s, '') "
+            "FROM core_recipe r"
+            % (TAG_NAMES.format(agg=agg), INGREDIENT_NAMES.format(agg=agg))
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX core_recipe_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE core_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image_renditions_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.1.15 on 2026-10-17 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_ingredient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_tag_user_name_idx'),
+        ),
+        # The auto-created through tables can't declare indexes, so these
+        # cover the reverse (tag -> recipes, ingredient -> recipes) lookups.
+        migrations.RunSQL(
+            ['CREATE INDEX core_recipe_tags_tag_recipe_idx '
+             'ON core_recipe_tags (tag_id, recipe_id)'],
+            ['DROP INDEX core_recipe_tags_tag_recipe_idx'],
+        ),
+        migrations.RunSQL(
+            ['CREATE INDEX core_recipe_ingr_ingr_recipe_idx '
+             'ON core_recipe_ingredients (ingredient_id, recipe_id)'],
+            ['DROP INDEX core_recipe_ingr_ingr_recipe_idx'],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.1.15 on 2026-10-17 03:11
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingr_user_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='core_recipe_user_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='core_tag_user_updated_idx',
+        ),
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='updated_at',
+        ),
+        migrations.RemoveField(
+            model_name='tag',
+            name='updated_at',
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 import os
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.core.validators import validate_email
@@ -68,6 +69,15 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # Serve the per-user list ordered by (-name, -id)
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_tag_user_name_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -80,6 +90,15 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # Serve the per-user list ordered by (-name, -id)
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_ingredient_user_name_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -98,6 +117,38 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Set once the background job has written the resized copies of image
+    image_renditions_ready = models.BooleanField(default=False)
+    # Maintained by recipe.search. Only PostgreSQL uses it; SQLite keeps
+    # its full-text index in a separate FTS5 table.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Serve the per-user list ordered by -id. The through tables get
+        # their (target, recipe) indexes in migration 0008.
+        indexes = [
+            models.Index(
+                fields=['user', 'id'],
+                name='core_recipe_user_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class ImportCheckpoint(models.Model):
+    """How far import_recipes has got through a source file
+
+    Updated in the same transaction as each batch it covers, so a restart
+    picks up exactly where the last committed batch ended.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    # Byte offset of the first line not yet imported
+    offset = models.BigIntegerField(default=0)
+    lines = models.BigIntegerField(default=0)
+    recipes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
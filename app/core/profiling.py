@@ -0,0 +1,212 @@
+"""
+Opt-in profiling of individual requests.
+
+ProfilingMiddleware profiles the whole view: DRF authentication,
+get_queryset, serialization and rendering. A request gets profiled in two
+cases:
+
+- a staff user sends an X-Profile header
+- PROFILE_SAMPLE_RATE is N and the request is picked, 1 in N
+
+Two formats are written:
+
+- X-Profile: pstats runs cProfile and saves a file that pstats and
+  snakeviz read.
+- X-Profile: collapsed (the default) samples the request thread's stack
+  every PROFILE_INTERVAL_MS. It writes collapsed stacks, one
+  "frame;frame;frame count" line each, which flamegraph.pl and
+  speedscope read.
+
+Profiles go to PROFILE_DIR next to a JSON file describing the request.
+Only the newest PROFILE_KEEP are kept. The response names its profile in
+an X-Profile-Id header; `manage.py profiles` lists and summarizes them.
+"""
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+FORMATS = {'pstats': '.prof', 'collapsed': '.collapsed'}
+DEFAULT_FORMAT = 'collapsed'
+
+
+class StackSampler:
+    """Count the stacks one thread is in, sampled from another thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        """Write the stacks in the collapsed format"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    """cProfile with the same interface as StackSampler"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+def is_staff(request):
+    """Whether the request comes from a staff user
+
+    Session users are known by now; API clients are looked up through
+    the (cached) token authentication the views use.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user, _ = CachedTokenAuthentication().authenticate(request) or \
+                (None, None)
+        except AuthenticationFailed:
+            return False
+
+    return bool(user and user.is_staff)
+
+
+def save(profiler, profile_format, meta):
+    """Write a profile and its description, then drop the oldest ones"""
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}'
+    meta = dict(meta, id=profile_id, format=profile_format,
+                file=profile_id + FORMATS[profile_format])
+
+    profiler.dump(os.path.join(directory, meta['file']))
+    # The description goes last: a listed profile is always complete
+    with open(os.path.join(directory, profile_id + '.json'), 'w') as f:
+        json.dump(meta, f)
+
+    prune(directory, settings.PROFILE_KEEP)
+    return profile_id
+
+
+def load(directory=None):
+    """Return the descriptions of the saved profiles, oldest first"""
+    directory = directory or settings.PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+    return profiles
+
+
+def prune(directory, keep):
+    """Keep only the newest keep profiles"""
+    for meta in load(directory)[:-keep or None]:
+        for name in (meta['file'], meta['id'] + '.json'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """Profile requests that ask for it or are sampled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def choose(self, request):
+        """Return (format, sampled) when the request is to be profiled"""
+        requested = request.META.get(PROFILE_HEADER)
+        if requested is not None and is_staff(request):
+            requested = requested.strip().lower()
+            return requested if requested in FORMATS else DEFAULT_FORMAT, \
+                False
+
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate and random.randrange(rate) == 0:
+            return DEFAULT_FORMAT, True
+
+        return None, False
+
+    def __call__(self, request):
+        profile_format, sampled = self.choose(request)
+        if profile_format is None:
+            return self.get_response(request)
+
+        if profile_format == 'pstats':
+            profiler = CProfiler()
+        else:
+            profiler = StackSampler(
+                threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000)
+
+        start = time.perf_counter()
+        with profiler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        timings = getattr(request, '_timings', None)
+        user = getattr(request, 'user', None)
+        response['X-Profile-Id'] = save(profiler, profile_format, {
+            'time': datetime.utcnow().isoformat() + 'Z',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': user.pk if user and user.is_authenticated else None,
+            'view': timings.view if timings else None,
+            'queries': timings.queries if timings else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'sampled': sampled,
+        })
+
+        return response
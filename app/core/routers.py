@@ -0,0 +1,141 @@
+"""
+Sending safe API traffic to read replicas.
+
+Views using ReplicaReadMixin pick one of REPLICA_DATABASES for a GET or
+HEAD request once it is authenticated, and ReplicaRouter sends the reads
+of that request there. Everything else, and every write, goes to the
+primary.
+
+Replicas lag behind. After a user makes a write request they are pinned
+to the primary for REPLICA_PIN_SECONDS, so they read their own writes
+whichever token or session they use. Pins live in the
+REPLICA_PIN_CACHE_ALIAS cache, which should be shared by all workers.
+Tokens are always read from the primary, so a token that was just issued
+works at once. Anything cached for later requests, such as responses,
+ETags or in-memory indexes, must not be built from a replica's rows: use
+current_replica() to tell, or read with .using(DEFAULT_DB_ALIAS).
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_PREFIX = 'replica-pin:'
+SAFE_METHODS = ('GET', 'HEAD')
+# Read from the primary even in replica-routed requests
+PRIMARY_MODELS = ('authtoken.Token',)
+
+_state = threading.local()
+
+
+def current_replica():
+    """The replica this thread's request reads from, if any"""
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def use_replica(alias):
+    """Route this thread's reads to alias for the duration of a block"""
+    previous = current_replica()
+    _state.replica = alias
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+class ReplicaRouter:
+    """Reads of replica-routed requests go to their replica, the rest to
+    the primary"""
+
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica is None or model._meta.label in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same rows as the primary"""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Replicas are migrated through replication"""
+        return db not in settings.REPLICA_DATABASES
+
+
+def client_key(request):
+    """Cache key identifying the user behind a request, or None"""
+    user = getattr(request, 'user', None)
+    if user is None or user.pk is None:
+        return None
+    return f'{PIN_PREFIX}{user.pk}'
+
+
+def pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def pin(request):
+    """Keep the user on the primary for a while"""
+    key = client_key(request)
+    if key and settings.REPLICA_PIN_SECONDS:
+        pin_cache().set(key, True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    key = client_key(request)
+    return bool(key and pin_cache().get(key))
+
+
+def replica_stream(content, alias):
+    """Keep streamed content reading from the replica of its request"""
+    with use_replica(alias):
+        yield from content
+
+
+def route_to_replica(request):
+    """Send the rest of an authenticated request's reads to a replica,
+    unless it writes or its user is pinned"""
+    replicas = settings.REPLICA_DATABASES
+    if not replicas or request.method not in SAFE_METHODS or \
+            is_pinned(request):
+        return
+    request._replica = _state.replica = random.choice(replicas)
+
+
+class ReplicaReadMixin:
+    """Read from a replica once the user is known, so pins can follow
+    them"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        route_to_replica(request._request)
+
+
+class ReplicaRoutingMiddleware:
+    """Pin users who write, and keep streamed responses on their
+    replica"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = None
+
+        if request.method not in SAFE_METHODS:
+            pin(request)
+        elif request._replica and response.streaming:
+            response.streaming_content = replica_stream(
+                response.streaming_content, request._replica)
+
+        return response
@@ -0,0 +1,156 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core import authentication
+from core.cache import TTLCache
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class TTLCacheTests(TestCase):
+    """Test the in-process LRU cache"""
+
+    def test_evicts_least_recently_used(self):
+        """A full cache drops whatever was touched longest ago"""
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    @patch('core.cache.time.monotonic')
+    def test_entries_expire(self, monotonic):
+        """Entries are gone once their TTL is up"""
+        monotonic.return_value = 100
+        cache = TTLCache(timeout=10)
+        cache.set('a', 1)
+
+        monotonic.return_value = 109
+        self.assertEqual(cache.get('a'), 1)
+        monotonic.return_value = 110
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_zero_timeout_not_stored(self):
+        """A timeout of 0 means don't cache, None means keep"""
+        cache = TTLCache(timeout=0)
+        cache.set('a', 1)
+        cache.set('b', 2, None)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertFalse(cache.add('b', 3))
+        self.assertEqual(cache.get_many(['a', 'b']), {'b': 2})
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the token authentication cache and its invalidation"""
+
+    def setUp(self):
+        authentication.reset_token_cache()
+        self.user = get_user_model().objects.create_user(
+            email='cached@token.org',
+            password='remember-me',
+            name='Cache'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        authentication.reset_token_cache()
+
+    def test_second_request_skips_token_lookup(self):
+        """Only the first request looks the token up"""
+        self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            resp = self.client.get(ME_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_rejected(self):
+        """Deleting a token takes effect despite the cache"""
+        self.client.get(TAGS_URL)
+        self.token.delete()
+
+        resp = self.client.get(TAGS_URL)
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Deactivating a user takes effect despite the cache"""
+        self.client.get(TAGS_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        resp = self.client.get(TAGS_URL)
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_update_not_stale(self):
+        """Changes made through the me endpoint show up right away"""
+        self.client.get(ME_URL)
+        resp = self.client.patch(ME_URL, {
+            'name': 'Renamed',
+            'password': 'a-new-password',
+        })
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        resp = self.client.get(ME_URL)
+        self.assertEqual(resp.data['name'], 'Renamed')
+        self.assertTrue(
+            authentication.get_token_cache().get(
+                authentication.KEY_PREFIX + self.token.key
+            )[0].check_password('a-new-password')
+        )
+
+    @override_settings(TOKEN_AUTH_CACHE_TTL=0)
+    def test_zero_ttl_not_cached(self):
+        """A TTL of 0 looks the token up every time"""
+        self.client.get(ME_URL)
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    def test_lookup_racing_invalidation_not_kept(self):
+        """A lookup that read the database before an invalidation doesn't
+        store what it read for later requests"""
+        lookup = authentication.CachedTokenAuthentication()
+        fetch = TokenAuthentication.authenticate_credentials
+
+        def fetch_then_invalidate(auth, key):
+            result = fetch(auth, key)
+            authentication.invalidate_token(key)
+            return result
+
+        with patch.object(TokenAuthentication, 'authenticate_credentials',
+                          fetch_then_invalidate):
+            lookup.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(1):
+            lookup.authenticate_credentials(self.token.key)
+
+    @override_settings(
+        TOKEN_AUTH_CACHE_ALIAS='default',
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+    )
+    def test_django_cache_backend(self):
+        """A configured Django cache is used instead of the local one"""
+        self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+        self.token.delete()
+        resp = self.client.get(TAGS_URL)
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
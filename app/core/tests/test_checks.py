@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase, override_settings
+
+from core.checks import check_shared_caches
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+SHARED = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+          'LOCATION': 'cache_table'}
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """Test the check that workers share their caches"""
+
+    @override_settings(SHARED_CACHE_REQUIRED=True, CACHES={
+        'default': LOCMEM})
+    def test_per_process_cache_refused(self):
+        """A per-process response cache is an error when required"""
+        errors = check_shared_caches(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+        self.assertIn('RECIPE_API_CACHE_ALIAS', errors[0].msg)
+
+    @override_settings(SHARED_CACHE_REQUIRED=True, CACHES={
+        'default': LOCMEM, 'shared': SHARED},
+        RECIPE_API_CACHE_ALIAS='shared', REPLICA_DATABASES=['replica'],
+        REPLICA_PIN_SECONDS=5, REPLICA_PIN_CACHE_ALIAS='default')
+    def test_replica_pins_checked(self):
+        """Replica pins need a shared cache too"""
+        errors = check_shared_caches(None)
+
+        self.assertEqual(len(errors), 1)
+        self.assertIn('REPLICA_PIN_CACHE_ALIAS', errors[0].msg)
+
+    @override_settings(SHARED_CACHE_REQUIRED=True, CACHES={
+        'default': SHARED})
+    def test_shared_cache_passes(self):
+        """A shared backend passes"""
+        self.assertEqual(check_shared_caches(None), [])
+
+    @override_settings(SHARED_CACHE_REQUIRED=False, CACHES={
+        'default': LOCMEM})
+    def test_not_required(self):
+        """Single-process and DEBUG setups may keep the local cache"""
+        self.assertEqual(check_shared_caches(None), [])
@@ -1,8 +1,20 @@
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.management.commands import benchmark_api, import_recipes, \
+    seed_benchmark_data
+from core.models import ImportCheckpoint, Recipe, Tag
+from recipe.search import search_recipes
 
 
 class CommandsTestCase(TestCase):
@@ -23,3 +35,310 @@ class CommandsTestCase(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_benchmark_indexes(self):
+        """Test the index benchmark reports both plans and keeps indexes"""
+        out = StringIO()
+        call_command('benchmark_indexes', seed=60, users=2, repeat=1,
+                     stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('== recipe list', output)
+        self.assertIn('== recipes with all of two tags', output)
+        self.assertIn('-- before', output)
+        self.assertIn('core_recipe_user_id_idx', output)
+        self.assertEqual(Recipe.objects.count(), 120)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Recipe._meta.db_table)
+        self.assertIn('core_recipe_user_id_idx', indexes)
+
+    def test_benchmark_serializers(self):
+        """Test the serializer benchmark runs both paths and cleans up"""
+        out = StringIO()
+        err = StringIO()
+        call_command('benchmark_serializers', sizes=[5, 20], repeat=1,
+                     stdout=out, stderr=err)
+
+        output = out.getvalue()
+        self.assertIn('== 20 recipes, detail representation', output)
+        self.assertIn('-- reader:', output)
+        self.assertEqual(err.getvalue(), '')
+        self.assertEqual(Recipe.objects.count(), 0)
+
+
+class ImportRecipesTests(TestCase):
+    """Test the import_recipes command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'partner@import.org', 'bulk-load')
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def write_lines(self, lines):
+        """Write the import file"""
+        with open(self.path, 'w') as f:
+            for line in lines:
+                f.write(line if isinstance(line, str) else json.dumps(line))
+                f.write('\n')
+
+    def import_file(self, **options):
+        """Run the command, returning (stdout, stderr)"""
+        out, err = StringIO(), StringIO()
+        call_command('import_recipes', self.path, stdout=out, stderr=err,
+                     **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_recipes(self):
+        """Recipes are loaded with their tags and ingredients"""
+        existing = Tag.objects.create(user=self.user, name='Soup')
+        self.write_lines([
+            {'user': 'partner@import.org', 'title': 'Leek soup',
+             'time_minutes': 30, 'price': '4.50',
+             'tags': ['Soup', 'Winter'], 'ingredients': ['Leek', 'Leek']},
+            {'title': 'Toast', 'time_minutes': 2, 'price': 1,
+             'tags': [{'id': 99, 'name': 'Winter'}]},
+        ])
+
+        out, err = self.import_file(user='partner@import.org')
+
+        self.assertIn('2 recipes imported', out)
+        self.assertEqual(err, '')
+        soup = Recipe.objects.get(title='Leek soup')
+        self.assertEqual(soup.user, self.user)
+        self.assertEqual(str(soup.price), '4.50')
+        self.assertIn(existing, soup.tags.all())
+        self.assertEqual(soup.ingredients.count(), 1)
+        toast = Recipe.objects.get(title='Toast')
+        self.assertEqual(list(toast.tags.all()),
+                         list(Tag.objects.filter(name='Winter')))
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_imported_recipes_are_searchable(self):
+        """The search index learns about imported recipes"""
+        self.write_lines([{'title': 'Pumpkin pie', 'time_minutes': 60,
+                           'price': 6, 'ingredients': ['Pumpkin']}])
+
+        self.import_file(user='partner@import.org')
+
+        found = search_recipes(Recipe.objects.all(), 'pumpkin')
+        self.assertEqual([r.title for r in found], ['Pumpkin pie'])
+
+    def test_invalid_lines_skipped(self):
+        """Bad lines are reported by number and the rest still load"""
+        self.write_lines([
+            'not json',
+            {'title': 'No time', 'price': 1},
+            {'user': 'nobody@import.org', 'title': 'Orphan',
+             'time_minutes': 1, 'price': 1},
+            {'title': 'Fine', 'time_minutes': 1, 'price': 1},
+        ])
+
+        out, err = self.import_file(user='partner@import.org')
+
+        self.assertIn('Line 1:', err)
+        self.assertIn('Line 2:', err)
+        self.assertIn('Line 3: Unknown user nobody@import.org', err)
+        self.assertIn('3 lines skipped', out)
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Fine'])
+
+    def test_resume_after_failure(self):
+        """A failed batch is rolled back and picked up again on rerun"""
+        self.write_lines([
+            {'title': f'Recipe {i}', 'time_minutes': 1, 'price': 1,
+             'tags': [f'Tag {i}']}
+            for i in range(5)
+        ])
+        real_load = import_recipes.Command.load_batch
+        calls = []
+
+        def failing_load(cmd, items):
+            calls.append(len(items))
+            if len(calls) == 2:
+                raise RuntimeError('Connection lost')
+            return real_load(cmd, items)
+
+        with patch.object(import_recipes.Command, 'load_batch',
+                          failing_load):
+            with self.assertRaises(RuntimeError):
+                self.import_file(user='partner@import.org', batch_size=2)
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get().lines, 2)
+
+        out, _ = self.import_file(user='partner@import.org', batch_size=2)
+
+        self.assertIn('Resuming after line 2', out)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            [f'Recipe {i}' for i in range(5)])
+        self.assertEqual(Tag.objects.count(), 5)
+
+        # Everything is done, so another run has nothing to do
+        out, _ = self.import_file(user='partner@import.org')
+        self.assertIn('Done: 0 recipes imported', out)
+        self.assertEqual(Recipe.objects.count(), 5)
+
+    def test_restart(self):
+        """--restart imports the file again from the top"""
+        self.write_lines([{'title': 'Again', 'time_minutes': 1, 'price': 1}])
+        self.import_file(user='partner@import.org')
+
+        self.import_file(user='partner@import.org', restart=True)
+
+        self.assertEqual(Recipe.objects.filter(title='Again').count(), 2)
+
+    def test_copy_csv_quotes_text(self):
+        """Only None is written as COPY's NULL; \\N and '' stay text"""
+        buffer = import_recipes.copy_csv([
+            (1, None, '\\N', ''),
+            ('Say "cheese"', 'a,b\nc', 2.5, None),
+        ])
+
+        self.assertEqual(
+            buffer.read(),
+            '"1",,"\\N",""\n'
+            '"Say ""cheese""","a,b\nc","2.5",\n'
+        )
+
+
+class SeedBenchmarkDataTests(TestCase):
+    """Test the seed_benchmark_data command"""
+
+    def snapshot(self):
+        """Describe the seeded data independently of database ids"""
+        return [
+            (recipe.user.email, recipe.title, str(recipe.price),
+             sorted(tag.name for tag in recipe.tags.all()),
+             sorted(i.name for i in recipe.ingredients.all()))
+            for recipe in Recipe.objects.order_by('id').select_related(
+                'user').prefetch_related('tags', 'ingredients')
+        ]
+
+    def test_zipf_split(self):
+        """Shares add up, never drop below one and fall off by rank"""
+        shares = seed_benchmark_data.zipf_split(1000, 10, 1.1)
+
+        self.assertEqual(sum(shares), 1000)
+        self.assertEqual(shares, sorted(shares, reverse=True))
+        self.assertGreater(shares[0], 5 * shares[-1])
+        self.assertEqual(seed_benchmark_data.zipf_split(3, 5, 1.1),
+                         [1, 1, 1, 0, 0])
+
+    def test_seed_is_deterministic(self):
+        """The same seed always produces the same data"""
+        call_command('seed_benchmark_data', users=4, recipes=50,
+                     stdout=StringIO())
+        first = self.snapshot()
+
+        call_command('seed_benchmark_data', users=4, recipes=50, flush=True,
+                     stdout=StringIO())
+
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(len(first), 50)
+        per_user = [
+            Recipe.objects.filter(
+                user__email=seed_benchmark_data.BENCH_EMAIL.format(n)
+            ).count()
+            for n in range(4)
+        ]
+        self.assertEqual(per_user, sorted(per_user, reverse=True))
+        self.assertTrue(Recipe.tags.through.objects.exists())
+        self.assertTrue(Recipe.ingredients.through.objects.exists())
+
+    def test_other_seed_differs(self):
+        """A different random seed gives different data"""
+        call_command('seed_benchmark_data', users=2, recipes=20,
+                     stdout=StringIO())
+        first = self.snapshot()
+
+        call_command('seed_benchmark_data', users=2, recipes=20, flush=True,
+                     random_seed=7, stdout=StringIO())
+
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_flush_deletes_per_table(self):
+        """--flush deletes in a fixed number of queries, index included"""
+        call_command('seed_benchmark_data', users=2, recipes=60,
+                     stdout=StringIO())
+        seeded = get_user_model().objects.filter(
+            email__endswith='@' + seed_benchmark_data.BENCH_DOMAIN)
+
+        with CaptureQueriesContext(connection) as queries:
+            seed_benchmark_data.flush(seeded)
+
+        self.assertLess(len(queries), 30)
+        self.assertFalse(seeded.exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Recipe.ingredients.through.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM core_recipe_fts')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_refuses_to_seed_twice(self):
+        """Existing benchmark data is only replaced with --flush"""
+        call_command('seed_benchmark_data', users=1, recipes=1,
+                     stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark_data', users=1, recipes=1,
+                         stdout=StringIO())
+
+
+class BenchmarkApiTests(LiveServerTestCase):
+    """Test the benchmark_api load-test harness"""
+
+    def test_summarize(self):
+        """Percentiles use the nearest rank of the successful requests"""
+        summary = benchmark_api.summarize(
+            list(range(1, 101)), {500: 2}, duration=10)
+
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['error_statuses'], {'500': 2})
+        self.assertEqual(summary['throughput'], 10)
+        self.assertEqual(
+            (summary['p50_ms'], summary['p95_ms'], summary['p99_ms']),
+            (50, 95, 99))
+
+    def test_compare_flags_regressions(self):
+        """Slower p95s and lower throughput beyond the threshold are
+        flagged"""
+        def run(p95, throughput):
+            return {'endpoints': {'recipe list': {
+                'requests': 10, 'p95_ms': p95, 'throughput': throughput}}}
+
+        baseline = run(100, 50)
+
+        self.assertEqual(
+            benchmark_api.compare(run(105, 48), baseline, 0.1), [])
+        flagged = benchmark_api.compare(run(150, 20), baseline, 0.1)
+        self.assertEqual([name for name, _ in flagged], ['recipe list'] * 2)
+
+    def test_run_against_live_server(self):
+        """A short run hits every endpoint and saves comparable results"""
+        seed_benchmark_data.seed(1, 20)
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+
+        with tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media, RECIPE_RENDITION_WORKERS=0):
+            call_command('benchmark_api', url=self.live_server_url,
+                         duration=2, concurrency=1, output=path,
+                         compare=path, stdout=out)
+
+        with open(path) as f:
+            results = json.load(f)
+        endpoints = results['endpoints']
+        self.assertGreater(endpoints['token']['requests'], 0)
+        self.assertGreater(endpoints['recipe list']['requests'], 0)
+        self.assertEqual(
+            sum(endpoint['errors'] for endpoint in endpoints.values()), 0)
+        self.assertIn('No regressions', out.getvalue())
+        # Recipes created during the run are cleaned up again
+        self.assertEqual(Recipe.objects.count(), 20)
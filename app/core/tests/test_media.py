@@ -0,0 +1,207 @@
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe
+
+UUID_NAME = 'uploads/recipe/0b6f7e52-8b8c-4a8e-9b9f-3d9b2c1e4a77.jpg'
+CONTENT = bytes(range(256)) * 4
+
+
+def media_url(name):
+    """Return the URL a media file is served from"""
+    return reverse('media', args=[name])
+
+
+class ServeMediaTests(TestCase):
+    """Test the media serving view"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir.name,
+            MEDIA_SENDFILE_BACKEND=None,
+            MEDIA_PUBLIC=True
+        )
+        self.settings_override.enable()
+
+        path = os.path.join(self.tmpdir.name, UUID_NAME)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def test_serves_file_with_validators(self):
+        """Full responses carry an ETag and a long cache lifetime"""
+        resp = self.client.get(media_url(UUID_NAME))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT)
+        self.assertEqual(resp['Content-Type'], 'image/jpeg')
+        self.assertEqual(resp['Content-Length'], str(len(CONTENT)))
+        self.assertTrue(resp['ETag'].startswith('"'))
+        self.assertIn('immutable', resp['Cache-Control'])
+
+    def test_public_media_served_anonymously(self):
+        """With MEDIA_PUBLIC on, anyone may fetch an image by its name"""
+        resp = self.client.get(media_url(UUID_NAME))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Cache-Control'].startswith('public'))
+
+    def test_if_none_match(self):
+        """A matching ETag gets a 304"""
+        etag = self.client.get(media_url(UUID_NAME))['ETag']
+
+        resp = self.client.get(media_url(UUID_NAME), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+    def test_range_request(self):
+        """Byte ranges return only the requested slice"""
+        resp = self.client.get(media_url(UUID_NAME), HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[10:20])
+        self.assertEqual(
+            resp['Content-Range'], f'bytes 10-19/{len(CONTENT)}')
+
+    def test_suffix_range(self):
+        """bytes=-N returns the last N bytes"""
+        resp = self.client.get(media_url(UUID_NAME), HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), CONTENT[-5:])
+
+    def test_unsatisfiable_range(self):
+        """A range past the end of the file is a 416"""
+        resp = self.client.get(
+            media_url(UUID_NAME), HTTP_RANGE='bytes=5000-')
+
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_stale_if_range_gets_whole_file(self):
+        """A Range guarded by an old ETag is ignored"""
+        resp = self.client.get(
+            media_url(UUID_NAME),
+            HTTP_RANGE='bytes=0-1',
+            HTTP_IF_RANGE='"stale"'
+        )
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_path_traversal_rejected(self):
+        """Nothing outside MEDIA_ROOT is reachable"""
+        resp = self.client.get(media_url('../../etc/passwd'))
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_missing_file(self):
+        """Unknown files are a 404"""
+        resp = self.client.get(media_url('uploads/recipe/nope.jpg'))
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_nginx_offload(self):
+        """With nginx configured only headers are sent"""
+        with override_settings(
+            MEDIA_SENDFILE_BACKEND='nginx',
+            MEDIA_SENDFILE_URL='/protected-media/'
+        ):
+            resp = self.client.get(media_url(UUID_NAME))
+
+        self.assertEqual(
+            resp['X-Accel-Redirect'], f'/protected-media/{UUID_NAME}')
+        self.assertEqual(resp.content, b'')
+
+    def test_nginx_offload_quotes_name(self):
+        """Names with spaces or URL delimiters reach nginx intact"""
+        name = 'uploads/recipe/pie #1?.jpg'
+        with open(os.path.join(self.tmpdir.name, name), 'wb') as f:
+            f.write(CONTENT)
+
+        with override_settings(
+            MEDIA_SENDFILE_BACKEND='nginx',
+            MEDIA_SENDFILE_URL='/protected-media/'
+        ):
+            resp = self.client.get(media_url(name))
+
+        self.assertEqual(resp['X-Accel-Redirect'],
+                         '/protected-media/uploads/recipe/pie%20%231%3F.jpg')
+
+    def test_xsendfile_offload(self):
+        """With X-Sendfile configured the absolute path is sent"""
+        with override_settings(MEDIA_SENDFILE_BACKEND='xsendfile'):
+            resp = self.client.get(media_url(UUID_NAME))
+
+        self.assertEqual(
+            resp['X-Sendfile'],
+            os.path.join(os.path.realpath(self.tmpdir.name), UUID_NAME)
+        )
+
+
+@override_settings(MEDIA_PUBLIC=False, MEDIA_SENDFILE_BACKEND='nginx',
+                   MEDIA_SENDFILE_URL='/protected-media/')
+class PrivateMediaTests(TestCase):
+    """Test serving media only to the owner of its recipe"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.tmpdir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.rendition = UUID_NAME.replace('.jpg', '_thumbnail.jpg')
+        for name in (UUID_NAME, self.rendition):
+            path = os.path.join(self.tmpdir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(CONTENT)
+
+        self.owner = get_user_model().objects.create_user(
+            'owner@media.org', 'my-pictures')
+        Recipe.objects.create(user=self.owner, title='Pie', time_minutes=5,
+                              price=1, image=UUID_NAME)
+
+    def token_header(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def test_anonymous_gets_404(self):
+        """Without credentials nothing is handed off"""
+        resp = self.client.get(media_url(UUID_NAME))
+
+        self.assertEqual(resp.status_code, 404)
+        self.assertNotIn('X-Accel-Redirect', resp)
+
+    def test_owner_served_image_and_renditions(self):
+        """The owner's token reaches the image and its renditions"""
+        for name in (UUID_NAME, self.rendition):
+            resp = self.client.get(
+                media_url(name), **self.token_header(self.owner))
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp['X-Accel-Redirect'],
+                             f'/protected-media/{name}')
+            self.assertTrue(resp['Cache-Control'].startswith('private'))
+
+    def test_other_user_gets_404(self):
+        """Someone else's session doesn't reach the image"""
+        other = get_user_model().objects.create_user(
+            'other@media.org', 'not-mine')
+        self.client.force_login(other)
+
+        resp = self.client.get(media_url(self.rendition))
+
+        self.assertEqual(resp.status_code, 404)
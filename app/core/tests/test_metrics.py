@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core import metrics
+from core.models import Tag
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class RegistryTests(TestCase):
+    """Test recording and formatting metrics"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Each bucket counts the observations at or below its bound"""
+        registry = metrics.Registry()
+        for value in (0.001, 0.01, 0.3, 20):
+            registry.observe(
+                'http_request_duration_seconds', ('TagViewSet', 'list'),
+                value)
+
+        text = registry.render()
+        labels = 'view="TagViewSet",action="list"'
+        for bound, count in (('0.005', 1), ('0.01', 2), ('0.25', 2),
+                             ('0.5', 3), ('10', 3), ('+Inf', 4)):
+            self.assertIn(
+                f'http_request_duration_seconds_bucket{{{labels},'
+                f'le="{bound}"}} {count}\n', text)
+        self.assertIn(
+            f'http_request_duration_seconds_count{{{labels}}} 4\n', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+
+    def test_counter(self):
+        """Counters add up and escape their label values"""
+        registry = metrics.Registry()
+        labels = ('Odd"View', 'list', 200)
+        registry.inc('http_responses_total', labels)
+        registry.inc('http_responses_total', labels)
+
+        self.assertIn(
+            'http_responses_total{view="Odd\\"View",action="list",'
+            'status="200"} 2\n', registry.render())
+
+    def test_processes_are_added_up(self):
+        """Snapshots other workers flushed are added to the live values"""
+        registry = metrics.Registry(directory=self.directory)
+        registry.inc('http_responses_total', ('TagViewSet', 'list', 200), 3)
+        registry.flush()
+        # Make that snapshot look like another worker's
+        os.rename(registry.path,
+                  os.path.join(self.directory, 'metrics-1.json'))
+
+        registry.inc('http_responses_total', ('TagViewSet', 'list', 200))
+
+        # 3 from the other worker, 3 + 1 live here
+        self.assertIn(
+            'http_responses_total{view="TagViewSet",action="list",'
+            'status="200"} 7\n', registry.render())
+
+    def test_dead_processes_are_folded(self):
+        """An exited worker's snapshot moves into the dead total, once"""
+        other = metrics.Registry(directory=self.directory)
+        other.inc('http_responses_total', ('TagViewSet', 'list', 200), 3)
+        other.flush()
+        os.rename(other.path, other.snapshot_path(123456))
+        registry = metrics.Registry(directory=self.directory)
+        registry.inc('http_responses_total', ('TagViewSet', 'list', 200))
+
+        with patch.object(metrics, 'pid_exists', return_value=False):
+            texts = [registry.render(), registry.render()]
+
+        for text in texts:
+            self.assertIn(
+                'http_responses_total{view="TagViewSet",action="list",'
+                'status="200"} 4\n', text)
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory)
+                   if name.endswith('.json')),
+            [metrics.DEAD_FILE])
+
+    def test_reused_pid_keeps_old_counts(self):
+        """A process given a dead worker's pid doesn't overwrite its counts"""
+        metrics.write_rows(
+            os.path.join(self.directory, f'metrics-{os.getpid()}.json'),
+            [['http_responses_total', ['TagViewSet', 'list', 200], 2]])
+
+        registry = metrics.Registry(directory=self.directory)
+        registry.inc('http_responses_total', ('TagViewSet', 'list', 200))
+        registry.flush()
+
+        self.assertIn(
+            'http_responses_total{view="TagViewSet",action="list",'
+            'status="200"} 3\n', registry.render())
+
+    def test_forked_process_starts_from_zero(self):
+        """A child doesn't report what its parent recorded"""
+        registry = metrics.Registry()
+        registry.inc('http_responses_total', ('TagViewSet', 'list', 200))
+        registry.pid = -1
+
+        self.assertEqual(registry.snapshot(), {})
+
+
+@override_settings(METRICS_DIR=None, METRICS_TOKEN=None, DEBUG=True,
+                   RECIPE_API_CACHE_TTL=0)
+class MetricsEndpointTests(TestCase):
+    """Test request recording and the metrics endpoint"""
+
+    def setUp(self):
+        metrics.reset_registry()
+        self.addCleanup(metrics.reset_registry)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'metrics@scrape.org',
+            'observe-me'
+        )
+        self.client.force_authenticate(user=self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_requests_recorded_by_view_and_action(self):
+        """Latency, queries, size and status are labelled by action"""
+        self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': ''})
+
+        resp = self.client.get(METRICS_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp['Content-Type'], metrics.CONTENT_TYPE)
+        text = resp.content.decode()
+        labels = 'view="TagViewSet",action="list"'
+        self.assertIn(
+            f'http_request_duration_seconds_count{{{labels}}} 1\n', text)
+        self.assertIn(f'http_request_queries_count{{{labels}}} 1\n', text)
+        self.assertIn(f'http_response_size_bytes_count{{{labels}}} 1\n', text)
+        self.assertIn(f'http_responses_total{{{labels},status="200"}} 1\n',
+                      text)
+        self.assertIn('http_responses_total{view="TagViewSet",'
+                      'action="create",status="400"} 1\n', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_can_be_turned_off(self):
+        """Nothing is recorded with METRICS_ENABLED off"""
+        self.client.get(TAGS_URL)
+
+        self.assertEqual(metrics.get_registry().snapshot(), {})
+
+    @override_settings(METRICS_TOKEN='scraper-secret')
+    def test_token_required_when_set(self):
+        """With METRICS_TOKEN set, only the scraper may read the metrics"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        resp = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper-secret')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    @override_settings(DEBUG=False)
+    def test_denied_without_token_unless_debug(self):
+        """With DEBUG off the endpoint is closed until a token is set"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code,
+                         status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,121 @@
+from unittest.mock import Mock, PropertyMock, patch
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.middleware import RequestTimings, serializing
+from core.models import Recipe, Tag
+from recipe.readers import RecipeReader
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+TIMING = re.compile(
+    r'db;dur=[\d.]+;desc="(\d+) queries", serialize;dur=([\d.]+), '
+    r'render;dur=[\d.]+, total;dur=[\d.]+$'
+)
+
+
+@override_settings(RECIPE_API_CACHE_TTL=0, REQUEST_QUERY_BUDGET=0,
+                   REQUEST_LATENCY_BUDGET_MS=0)
+class QueryInstrumentationMiddlewareTests(TestCase):
+    """Test the per-request query counter and Server-Timing header"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'timing@server.org',
+            'count-queries'
+        )
+        self.client.force_authenticate(user=self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_server_timing_counts_queries(self):
+        """The header reports as many queries as the request ran"""
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(TAGS_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        match = TIMING.match(resp['Server-Timing'])
+        self.assertIsNotNone(match, resp['Server-Timing'])
+        self.assertEqual(int(match.group(1)), len(queries))
+
+    def test_serialize_time_reported(self):
+        """Building the response data shows up as serialize time"""
+        def slow(reader, rows):
+            time.sleep(0.02)
+            return []
+
+        with patch.object(RecipeReader, 'to_representation', slow):
+            resp = self.client.get(RECIPES_URL)
+
+        match = TIMING.match(resp['Server-Timing'])
+        self.assertIsNotNone(match, resp['Server-Timing'])
+        self.assertGreaterEqual(float(match.group(2)), 20)
+
+    def test_nested_serializing_counts_once(self):
+        """A block inside another adds nothing of its own"""
+        timings = RequestTimings()
+        request = Mock(_timings=timings)
+
+        with patch('core.middleware.time.perf_counter',
+                   side_effect=[1.0, 3.0]):
+            with serializing(request):
+                with serializing(request):
+                    pass
+
+        self.assertEqual(timings.serialize, 2.0)
+
+    def test_no_sql_kept(self):
+        """Nothing accumulates in connection.queries without DEBUG"""
+        self.client.get(TAGS_URL)
+
+        self.assertEqual(len(connection.queries), 0)
+
+    @override_settings(REQUEST_SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        """REQUEST_SERVER_TIMING=False leaves the header out"""
+        resp = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', resp)
+
+    @override_settings(REQUEST_QUERY_BUDGET=10)
+    def test_within_budget_not_logged(self):
+        """Requests that stay within budget log nothing"""
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                self.client.get(TAGS_URL)
+
+    @override_settings(REQUEST_QUERY_BUDGET=1)
+    def test_over_query_budget_logged(self):
+        """Going over the query budget logs the viewset and action"""
+        Recipe.objects.create(
+            user=self.user, title='Dal', time_minutes=30, price=2.00)
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(logs.records), 1)
+        message = logs.records[0].getMessage()
+        self.assertIn('Over queries budget', message)
+        self.assertIn('RecipeViewSet.list', message)
+        self.assertIn(f'GET {RECIPES_URL}', message)
+
+    @override_settings(REQUEST_LATENCY_BUDGET_MS=500)
+    @patch('core.middleware.RequestTimings.total', new_callable=PropertyMock)
+    def test_over_latency_budget_logged(self, total):
+        """Slow requests are logged too"""
+        total.return_value = 0.75
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            resp = self.client.get(TAGS_URL)
+
+        self.assertIn('total;dur=750.0', resp['Server-Timing'])
+        message = logs.records[0].getMessage()
+        self.assertIn('Over latency budget', message)
+        self.assertIn('TagViewSet.list', message)
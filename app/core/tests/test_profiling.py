@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import authentication, profiling
+from core.management.commands.profiles import summarize_collapsed
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test request profiling and the profiles command"""
+
+    def setUp(self):
+        authentication.reset_token_cache()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(
+            PROFILE_DIR=directory, PROFILE_KEEP=3, PROFILE_SAMPLE_RATE=0,
+            RECIPE_API_CACHE_TTL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory
+
+        self.staff = get_user_model().objects.create_user(
+            'staff@profile.org', 'show-me-the-stacks', is_staff=True)
+        self.user = get_user_model().objects.create_user(
+            'user@profile.org', 'just-a-user')
+        self.client = APIClient()
+
+    def get(self, user, **headers):
+        token, _ = Token.objects.get_or_create(user=user)
+        return self.client.get(
+            RECIPES_URL, HTTP_AUTHORIZATION=f'Token {token.key}', **headers)
+
+    def test_staff_header_saves_collapsed_stacks(self):
+        """Staff get a profile of the request when they ask for one"""
+        resp = self.get(self.staff, HTTP_X_PROFILE='1')
+
+        profile_id = resp['X-Profile-Id']
+        meta, = profiling.load()
+        self.assertEqual(meta['id'], profile_id)
+        self.assertEqual(meta['format'], 'collapsed')
+        self.assertEqual(meta['view'], 'RecipeViewSet.list')
+        self.assertEqual(meta['user'], self.staff.pk)
+        self.assertFalse(meta['sampled'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, profile_id + '.collapsed')))
+
+    def test_pstats_format(self):
+        """X-Profile: pstats saves a cProfile dump"""
+        resp = self.get(self.staff, HTTP_X_PROFILE='pstats')
+
+        out = StringIO()
+        call_command('profiles', resp['X-Profile-Id'], stdout=out)
+
+        self.assertIn('function calls', out.getvalue())
+        self.assertIn('RecipeViewSet.list', out.getvalue())
+
+    def test_header_ignored_for_other_users(self):
+        """Only staff can ask for profiles"""
+        resp = self.get(self.user, HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-Id', resp)
+        self.assertEqual(profiling.load(), [])
+
+    def test_sampling(self):
+        """A sample rate of 1 profiles every request, from anyone"""
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            resp = self.get(self.user)
+
+        self.assertIn('X-Profile-Id', resp)
+        self.assertTrue(profiling.load()[0]['sampled'])
+
+    def test_ring_buffer(self):
+        """Only the newest PROFILE_KEEP profiles are kept"""
+        ids = [self.get(self.staff, HTTP_X_PROFILE='1')['X-Profile-Id']
+               for _ in range(5)]
+
+        self.assertEqual([meta['id'] for meta in profiling.load()], ids[2:])
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+
+    def test_profiles_command_lists_newest_first(self):
+        """The command lists the saved profiles"""
+        first = self.get(self.staff, HTTP_X_PROFILE='1')['X-Profile-Id']
+        second = self.get(self.staff, HTTP_X_PROFILE='1')['X-Profile-Id']
+
+        out = StringIO()
+        call_command('profiles', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith(second))
+        self.assertTrue(lines[1].startswith(first))
+        self.assertIn(f'GET {RECIPES_URL}', lines[0])
+
+    def test_summarize_collapsed(self):
+        """Collapsed stacks are summarized by the frame on top"""
+        path = os.path.join(self.directory, 'stacks.collapsed')
+        with open(path, 'w') as f:
+            f.write('main;view;query 3\nmain;view;render 1\nmain;query 1\n')
+
+        total, frames = summarize_collapsed(path, 10)
+
+        self.assertEqual(total, 5)
+        self.assertEqual(frames[0], (4, 'query'))
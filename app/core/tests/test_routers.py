@@ -0,0 +1,185 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core import authentication
+from core.models import Recipe
+from core.routers import ReplicaRouter, use_replica
+from recipe.indexes import linked_ids
+
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+REPLICA = 'replica'
+
+
+@override_settings(REPLICA_DATABASES=[REPLICA], REPLICA_PIN_SECONDS=5,
+                   RECIPE_API_CACHE_TTL=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Test sending safe requests to a replica
+
+    A second connection to the test database stands in for the replica.
+    Rows must be committed for it to see them, hence TransactionTestCase.
+    """
+
+    def setUp(self):
+        connections.databases[REPLICA] = dict(
+            connections.databases['default'])
+        self.addCleanup(self.remove_replica)
+        caches['default'].clear()
+        authentication.reset_token_cache()
+
+        self.user = get_user_model().objects.create_user(
+            'replica@lag.org',
+            'eventually-consistent'
+        )
+        Recipe.objects.create(
+            user=self.user, title='Toad in the hole', time_minutes=40,
+            price=6.00)
+        self.client = self.token_client(self.user)
+
+    def remove_replica(self):
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        delattr(connections._connections, REPLICA)
+
+    def token_client(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def queries(self, method, *args, **kwargs):
+        """Make a request; return it with the query counts of both
+        databases"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            resp = method(*args, **kwargs)
+            if resp.streaming:
+                b''.join(resp.streaming_content)
+
+        return resp, len(primary), len(replica)
+
+    def test_reads_go_to_replica(self):
+        """Listing recipes reads from the replica, tokens from the
+        primary"""
+        resp, primary, replica = self.queries(self.client.get, RECIPES_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.data), 1)
+        self.assertEqual(primary, 1)  # The token lookup
+        self.assertGreater(replica, 0)
+
+    def test_writes_go_to_primary_and_pin(self):
+        """After a write the client reads from the primary"""
+        resp, primary, replica = self.queries(
+            self.client.post, RECIPES_URL,
+            {'title': 'Eton mess', 'time_minutes': 10, 'price': 3.00})
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replica, 0)
+
+        resp, primary, replica = self.queries(self.client.get, RECIPES_URL)
+        self.assertEqual(len(resp.data), 2)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_pin_is_per_client(self):
+        """Other clients keep reading from the replica"""
+        self.client.post(
+            RECIPES_URL,
+            {'title': 'Eton mess', 'time_minutes': 10, 'price': 3.00})
+        other = self.token_client(get_user_model().objects.create_user(
+            'other@lag.org', 'somewhere-else'))
+
+        _, _, replica = self.queries(other.get, RECIPES_URL)
+
+        self.assertGreater(replica, 0)
+
+    def test_pin_follows_user(self):
+        """The pin is the user's, whatever credentials they read with"""
+        self.client.post(
+            RECIPES_URL,
+            {'title': 'Eton mess', 'time_minutes': 10, 'price': 3.00})
+        other = APIClient()
+        other.force_authenticate(user=self.user)
+
+        _, primary, replica = self.queries(other.get, RECIPES_URL)
+
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    @override_settings(RECIPE_API_CACHE_TTL=60)
+    def test_replica_reads_not_cached(self):
+        """Responses read from a replica get no ETag and aren't cached"""
+        resp, _, _ = self.queries(self.client.get, RECIPES_URL)
+        self.assertNotIn('ETag', resp)
+
+        resp, _, replica = self.queries(self.client.get, RECIPES_URL)
+        self.assertEqual(len(resp.data), 1)
+        self.assertGreater(replica, 0)
+
+    def test_indexes_read_primary(self):
+        """In-memory indexes are never built from a replica"""
+        with use_replica(REPLICA), \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            linked = linked_ids('tags', user_id=self.user.pk)
+
+        self.assertEqual(linked, {})
+        self.assertEqual(len(replica), 0)
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_no_pinning(self):
+        """A pin time of zero never pins"""
+        self.client.post(
+            RECIPES_URL,
+            {'title': 'Eton mess', 'time_minutes': 10, 'price': 3.00})
+
+        _, _, replica = self.queries(self.client.get, RECIPES_URL)
+
+        self.assertGreater(replica, 0)
+
+    def test_streamed_export_reads_from_replica(self):
+        """The rows of a streaming response come from the replica too"""
+        resp, primary, replica = self.queries(
+            self.client.get, EXPORT_URL, {'format': 'ndjson'})
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(primary, 1)
+        self.assertGreater(replica, 1)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        """With no replicas configured everything uses the primary"""
+        _, primary, replica = self.queries(self.client.get, RECIPES_URL)
+
+        self.assertGreater(primary, 1)
+        self.assertEqual(replica, 0)
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    """Test the router on its own"""
+
+    def test_routing(self):
+        """Reads follow use_replica, except tokens; writes never do"""
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+        with use_replica(REPLICA):
+            self.assertEqual(router.db_for_read(Recipe), REPLICA)
+            self.assertEqual(router.db_for_read(Token), 'default')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    @override_settings(REPLICA_DATABASES=[REPLICA])
+    def test_replicas_not_migrated(self):
+        """Migrations only run on the primary"""
+        router = ReplicaRouter()
+
+        self.assertTrue(router.allow_migrate('default', 'core'))
+        self.assertFalse(router.allow_migrate(REPLICA, 'core'))
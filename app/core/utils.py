@@ -0,0 +1,15 @@
+from itertools import islice
+
+# Ids per IN (...) list: well under the bound parameter limits of SQLite
+# and the other backends
+CHUNK_SIZE = 500
+
+
+def chunks(iterable, size=CHUNK_SIZE):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
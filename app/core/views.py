@@ -0,0 +1,228 @@
+"""
+Serving uploaded media.
+
+With MEDIA_PUBLIC on, media is public, as it was under
+django.conf.urls.static: nobody is asked who they are, and only the
+unguessable uuid names of uploads keep one user's images from another.
+With it off, a recipe image or one of its renditions is only served to
+the recipe's owner, signed in by session or API token; everyone else
+gets a 404. Either way the path has to stay inside MEDIA_ROOT, and
+access is settled before the bytes are handed off to the front-end
+server when MEDIA_SENDFILE_BACKEND is set ('nginx' for X-Accel-Redirect,
+'xsendfile' for Apache/lighttpd X-Sendfile). Otherwise they are served
+from Python with strong ETags, conditional GETs and single byte-range
+support.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, \
+    HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import CachedTokenAuthentication
+from core.models import Recipe
+from recipe.renditions import RENDITIONS, rendition_name
+
+# Names produced by core.models.recipe_image_file_path, plus renditions.
+# Their content never changes, so browsers may keep them forever.
+IMMUTABLE_NAME = re.compile(
+    r'(^|/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+    r'(_\w+)?\.\w+$'
+)
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve_media_path(name):
+    """Return the absolute path of a media file, or raise Http404
+
+    Anything that escapes MEDIA_ROOT, isn't a regular file, or is a
+    half-written rendition is treated as missing.
+    """
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or path.endswith('.part'):
+        raise Http404('Not found')
+
+    if not os.path.isfile(path):
+        raise Http404('Not found')
+
+    return path
+
+
+def media_user(request):
+    """The user behind a media request, by session or API token, or None"""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        found = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return found[0] if found else None
+
+
+def is_owner(user, name):
+    """Whether name is the image of one of user's recipes, or one of its
+    renditions"""
+    recipes = Recipe.objects.filter(user=user)
+    if recipes.filter(image=name).exists():
+        return True
+
+    for rendition, (_, _, ext) in RENDITIONS.items():
+        suffix = f'_{rendition}.{ext}'
+        if not name.endswith(suffix):
+            continue
+        images = recipes.filter(
+            image__startswith=name[:-len(suffix)] + '.'
+        ).values_list('image', flat=True)
+        if any(rendition_name(image, rendition) == name for image in images):
+            return True
+
+    return False
+
+
+def check_access(request, name):
+    """Raise Http404 unless request may read the media file name"""
+    if settings.MEDIA_PUBLIC:
+        return
+    user = media_user(request)
+    if user is None or not is_owner(user, name):
+        raise Http404('Not found')
+
+
+def file_etag(stat):
+    """Strong validator: renditions are replaced atomically, so any rewrite
+    changes the mtime"""
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def cache_control(name):
+    """Cache lifetime for a media file; private media stays out of
+    shared caches"""
+    scope = 'public' if settings.MEDIA_PUBLIC else 'private'
+    if IMMUTABLE_NAME.search(name):
+        return f'{scope}, max-age=31536000, immutable'
+
+    return f'{scope}, max-age=3600'
+
+
+def parse_range(header, size):
+    """Turn a Range header into (start, end) inclusive, or None
+
+    Only single ranges are honoured; anything else gets the whole file.
+    Raises ValueError for a range that can't be satisfied.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+
+    return start, end
+
+
+def read_range(path, start, length):
+    """Yield length bytes of path starting at start"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(name, path):
+    """Let the front-end server send the file"""
+    response = HttpResponse()
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend == 'nginx':
+        prefix = settings.MEDIA_SENDFILE_URL.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(name)}'
+    elif backend == 'xsendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ValueError(f'Unknown MEDIA_SENDFILE_BACKEND {backend!r}')
+
+    # The front end fills this in from the file itself
+    del response['Content-Type']
+    return response
+
+
+def python_response(request, path, stat):
+    """Serve the file from Python, honouring conditionals and ranges"""
+    etag = file_etag(stat)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or \
+            if_none_match.strip() == '*':
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    size = stat.st_size
+    content_type = mimetypes.guess_type(path)[0] or \
+        'application/octet-stream'
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(path, start, length),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT"""
+    full_path = resolve_media_path(path)
+    check_access(request, path)
+    stat = os.stat(full_path)
+
+    if settings.MEDIA_SENDFILE_BACKEND:
+        response = sendfile_response(path, full_path)
+        response['ETag'] = file_etag(stat)
+    else:
+        response = python_response(request, full_path, stat)
+
+    response['Cache-Control'] = cache_control(path)
+    return response
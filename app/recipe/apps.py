@@ -1,5 +1,92 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, \
+    post_save, pre_delete
 
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        """Keep the search and in-memory indexes and response cache in
+        step with writes"""
+        from django.contrib.auth import get_user_model
+        from core.models import Recipe, Tag, Ingredient
+        from recipe import caching, indexes, search
+        # Register the in-memory indexes
+        from recipe import pantry, similarity  # noqa: F401
+        from recipe.signals import recipes_bulk_saved
+
+        post_save.connect(
+            search.recipe_saved, sender=Recipe,
+            dispatch_uid='recipe.search.recipe_saved'
+        )
+        post_delete.connect(
+            search.recipe_deleted, sender=Recipe,
+            dispatch_uid='recipe.search.recipe_deleted'
+        )
+        post_delete.connect(
+            indexes.recipe_deleted, sender=Recipe,
+            dispatch_uid='recipe.indexes.recipe_deleted'
+        )
+        for field in ('tags', 'ingredients'):
+            through = getattr(Recipe, field).through
+            m2m_changed.connect(
+                search.recipe_links_clearing, sender=through,
+                dispatch_uid=f'recipe.search.{field}_clearing'
+            )
+            m2m_changed.connect(
+                search.recipe_links_changed, sender=through,
+                dispatch_uid=f'recipe.search.{field}_changed'
+            )
+            m2m_changed.connect(
+                caching.owner_changed, sender=through,
+                dispatch_uid=f'recipe.caching.{field}_changed'
+            )
+            m2m_changed.connect(
+                indexes.recipe_links_changed, sender=through,
+                dispatch_uid=f'recipe.indexes.{field}_changed'
+            )
+        for model in (Tag, Ingredient):
+            label = model._meta.model_name
+            post_save.connect(
+                search.name_saved, sender=model,
+                dispatch_uid=f'recipe.search.{label}_saved'
+            )
+            pre_delete.connect(
+                search.name_deleting, sender=model,
+                dispatch_uid=f'recipe.search.{label}_deleting'
+            )
+            post_delete.connect(
+                search.name_deleted, sender=model,
+                dispatch_uid=f'recipe.search.{label}_deleted'
+            )
+            post_delete.connect(
+                indexes.name_deleted, sender=model,
+                dispatch_uid=f'recipe.indexes.{label}_deleted'
+            )
+        for model in (Recipe, Tag, Ingredient):
+            label = model._meta.model_name
+            post_save.connect(
+                caching.owner_changed, sender=model,
+                dispatch_uid=f'recipe.caching.{label}_saved'
+            )
+            post_delete.connect(
+                caching.owner_changed, sender=model,
+                dispatch_uid=f'recipe.caching.{label}_deleted'
+            )
+        post_save.connect(
+            caching.user_created, sender=get_user_model(),
+            dispatch_uid='recipe.caching.user_created'
+        )
+        recipes_bulk_saved.connect(
+            search.recipes_bulk_saved,
+            dispatch_uid='recipe.search.recipes_bulk_saved'
+        )
+        recipes_bulk_saved.connect(
+            caching.recipes_bulk_saved,
+            dispatch_uid='recipe.caching.recipes_bulk_saved'
+        )
+        recipes_bulk_saved.connect(
+            indexes.recipes_bulk_saved,
+            dispatch_uid='recipe.indexes.recipes_bulk_saved'
+        )
@@ -0,0 +1,148 @@
+"""
+Per-user response cache for the recipe API.
+
+Every user has a generation counter, and cached list and detail responses
+are keyed by it. Any write to a user's recipes, tags or ingredients bumps
+the counter, so their old entries simply stop being looked up and expire
+on their own; nothing has to find and delete them.
+
+The counter lives in the RECIPE_API_CACHE_ALIAS cache and only relies on
+add/get/incr, which the local-memory backend and Redis backends both
+provide atomically.
+
+Responses read from a replica are served but not cached: the replica may
+not have the write that moved the counter on yet.
+"""
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.cache import new_generation
+from core.models import Recipe
+from core.routers import current_replica
+
+KEY_PREFIX = 'recipe-api:'
+GENERATION_KEY = KEY_PREFIX + 'gen:{}'
+RESPONSE_KEY = KEY_PREFIX + 'resp:{}:{}:{}'
+
+
+def get_response_cache():
+    """Return the cache responses and generations are kept in"""
+    return caches[settings.RECIPE_API_CACHE_ALIAS]
+
+
+def get_generation(user_id):
+    """Return the current generation of user_id's data"""
+    cache = get_response_cache()
+    key = GENERATION_KEY.format(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), None)
+        generation = cache.get(key)
+
+    return generation
+
+
+def _bump(user_id):
+    cache = get_response_cache()
+    key = GENERATION_KEY.format(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, new_generation(), None):
+            cache.incr(key)
+
+
+def bump_generation(user_id):
+    """Invalidate every cached response of user_id
+
+    Inside a transaction the counter is bumped again on commit, so a
+    response cached from the old rows in the meantime is dropped as well.
+    """
+    _bump(user_id)
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(_bump, user_id))
+
+
+def response_key(request, *parts):
+    """Build the cache key of a response to request"""
+    user_id = request.user.pk
+    raw = ':'.join(str(part) for part in parts + (
+        request.get_host(),
+        sorted(request.query_params.lists()),
+    ))
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return RESPONSE_KEY.format(user_id, get_generation(user_id), digest)
+
+
+class CachedResponseMixin:
+    """Serve list and retrieve from the per-user response cache"""
+
+    def cached_response(self, respond, *parts):
+        """Return the cached response for this request, or respond() and
+        cache it"""
+        timeout = settings.RECIPE_API_CACHE_TTL
+        if not timeout:
+            return respond()
+
+        cache = get_response_cache()
+        key = response_key(
+            self.request, self.queryset.model._meta.label, self.action,
+            *parts)
+        cached = cache.get(key)
+        if cached is not None:
+            return Response(cached)
+
+        response = respond()
+        if response.status_code == status.HTTP_200_OK and \
+                current_replica() is None:
+            cache.set(key, response.data, timeout)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs),
+            lookup
+        )
+
+
+def owner_changed(sender, instance, **kwargs):
+    """Signal receiver: a recipe, tag or ingredient was written"""
+    bump_generation(instance.user_id)
+
+
+def user_created(sender, instance, created, **kwargs):
+    """Signal receiver: start a new user on a fresh generation
+
+    Databases can hand out the id of a deleted user again, and that
+    user's responses may still be cached.
+    """
+    if created:
+        bump_generation(instance.pk)
+
+
+def recipes_bulk_saved(sender, user, **kwargs):
+    """Signal receiver: the bulk endpoint wrote some recipes"""
+    bump_generation(user.pk)
+
+
+def renditions_ready(recipe_id):
+    """Invalidate the responses that show a recipe's renditions"""
+    user_id = Recipe.objects.filter(pk=recipe_id).values_list(
+        'user_id', flat=True).first()
+    if user_id is not None:
+        bump_generation(user_id)
@@ -0,0 +1,94 @@
+"""
+Conditional GET for the recipe API.
+
+ETags are built from the user's generation counter in recipe.caching,
+which every write to their recipes, tags or ingredients moves on, plus
+what identifies the response: the view, the object and the query
+parameters. Reading it is a single cache lookup, so a matching
+If-None-Match gets a 304 before any query runs. Unlike a timestamp, the
+counter can't stand still while the data changes, whatever the workers'
+clocks say, so Last-Modified and If-Modified-Since aren't used.
+
+A response read from a replica gets no ETag, since the replica may lag
+behind the counter. A request that matches an ETag issued earlier still
+gets its 304.
+"""
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.routers import current_replica
+from recipe.caching import get_generation
+
+
+def make_etag(*parts):
+    """Hash the parts of a validator into a strong ETag"""
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+
+def etag_matches(request, etag, any_matches=True):
+    """Check If-None-Match, using the weak comparison it calls for
+
+    '*' matches when any_matches is set, that is when the resource is
+    known to exist.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+
+    tags = parse_etags(header)
+    if tags == ['*']:
+        return any_matches
+
+    def strip(tag):
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return strip(etag) in [strip(tag) for tag in tags]
+
+
+class ConditionalGetMixin:
+    """Answer unchanged list and retrieve requests with 304 Not Modified"""
+
+    def get_etag(self, *parts):
+        user_id = self.request.user.pk
+        return make_etag(
+            user_id,
+            get_generation(user_id),
+            self.queryset.model._meta.label,
+            *parts,
+            sorted(self.request.query_params.lists())
+        )
+
+    def conditional_response(self, etag, respond, exists=True):
+        """Return a 304 if the client is current, otherwise respond()"""
+        if etag_matches(self.request, etag, any_matches=exists):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = respond()
+            if response.status_code != status.HTTP_200_OK or \
+                    current_replica() is not None:
+                return response
+
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_etag(self.action),
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # Whether the object exists isn't known without a query, so
+        # If-None-Match: * falls through to the normal response
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.conditional_response(
+            self.get_etag(self.action, lookup),
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs),
+            exists=False
+        )
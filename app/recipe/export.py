@@ -0,0 +1,102 @@
+"""
+Streaming export of a user's recipes as NDJSON or CSV.
+
+Rows come off a server-side cursor (QuerySet.iterator) and are rendered
+by RecipeReader a chunk at a time, so the tags and ingredients of each
+chunk are fetched in one query per relation and memory use depends on
+the chunk size, never on how many recipes there are.
+"""
+import csv
+import io
+import json
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.utils import chunks
+
+
+def to_json(data):
+    """Serialize data as compact JSON, like DRF's JSONRenderer"""
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, one recipe per line
+
+    The export streams its own body; this renderer picks the format during
+    content negotiation and renders error responses.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (to_json(data) + '\n').encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV with a header row; see NDJSONRenderer"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('field', 'message'))
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        for key, value in data.items():
+            writer.writerow((key, csv_value(value)))
+        return buffer.getvalue().encode(self.charset)
+
+
+def csv_value(value):
+    """Flatten a field of a recipe into one CSV cell
+
+    Tags and ingredients become their names separated by '; '; anything
+    else that isn't a plain value is written as JSON.
+    """
+    if isinstance(value, list):
+        if all(isinstance(item, dict) and 'name' in item for item in value):
+            return '; '.join(item['name'] for item in value)
+        return to_json(value)
+    if isinstance(value, dict):
+        return to_json(value)
+    if value is None:
+        return ''
+    return value
+
+
+def stream_ndjson(reader, rows, chunk_size):
+    """Yield the rendered rows as NDJSON, a chunk at a time"""
+    for chunk in chunks(rows, chunk_size):
+        yield ''.join(to_json(item) + '\n'
+                      for item in reader.to_representation(chunk))
+
+
+def stream_csv(reader, rows, chunk_size):
+    """Yield the rendered rows as CSV, a chunk at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(reader.fields)
+    yield buffer.getvalue()
+
+    for chunk in chunks(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for item in reader.to_representation(chunk):
+            writer.writerow([csv_value(item[field])
+                             for field in reader.fields])
+        yield buffer.getvalue()
+
+
+STREAMERS = {
+    NDJSONRenderer.format: stream_ndjson,
+    CSVRenderer.format: stream_csv,
+}
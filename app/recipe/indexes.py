@@ -0,0 +1,282 @@
+"""
+Per-user in-memory indexes of recipes, kept in step with writes.
+
+Some questions, like which recipes are similar to this one or which can
+be made from this pantry, are answered from an index of one user's
+recipes and their tags and ingredients held in memory. Each kind of index
+is a UserIndex subclass registered with register(), which gives it an
+IndexCache.
+
+Indexes are built on first use and cached per process
+(RECIPE_INDEX_CACHE_SIZE users for RECIPE_INDEX_CACHE_TTL seconds). Each
+user has a version counter per kind of index in the shared response
+cache, bumped whenever the recipes' relations the index covers change.
+The process that made the change updates its own index in place: the
+recipes concerned are re-read the next time the index is used. Other
+processes see the new version and rebuild. An index is also rebuilt
+once a tenth of its recipes have changed, for anything derived from the
+whole collection (such as IDF weights) to catch up.
+"""
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+
+from core.cache import TTLCache, new_generation
+from core.models import Recipe
+from core.utils import chunks
+from recipe.caching import get_response_cache
+
+VERSION_KEY = 'recipe-api:index:{}:{}'
+RELATIONS = ('tags', 'ingredients')
+# Rebuild once this share of the recipes has changed since the last build
+REBUILD_FRACTION = 0.1
+
+_registry = []
+
+
+def linked_ids(relation, recipe_ids=None, user_id=None):
+    """Map recipe id -> set of tag or ingredient ids, for some recipes or
+    all of a user's"""
+    m2m = Recipe._meta.get_field(relation)
+    through = m2m.remote_field.through
+    source = f'{m2m.m2m_field_name()}_id'
+    target = f'{m2m.m2m_reverse_field_name()}_id'
+
+    # Indexes outlive the request, so never build one from a lagging
+    # replica's rows
+    links = through.objects.using(DEFAULT_DB_ALIAS)
+    if recipe_ids is None:
+        batches = [links.filter(
+            **{f'{m2m.m2m_field_name()}__user_id': user_id})]
+    else:
+        batches = (
+            links.filter(**{f'{source}__in': ids})
+            for ids in chunks(recipe_ids)
+        )
+
+    linked = defaultdict(set)
+    for batch in batches:
+        for recipe_id, pk in batch.values_list(source, target).iterator():
+            linked[recipe_id].add(pk)
+
+    return linked
+
+
+class UserIndex:
+    """Base class of an index of one user's recipes
+
+    Subclasses name themselves, list the relations they are built from,
+    and implement load(), update() and __len__(). Their constructor takes
+    everything load() returned for the user.
+    """
+    name = None
+    relations = RELATIONS
+
+    def __init__(self, version=None):
+        self.version = version
+        self.pending = set()
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, user_id=None, recipe_ids=None):
+        """Read what the index holds about some recipes or all of a
+        user's, as {recipe id: data}; recipes with nothing are left out"""
+        raise NotImplementedError
+
+    @classmethod
+    def build(cls, user_id, version=None):
+        return cls(cls.load(user_id=user_id), version)
+
+    def update(self, data):
+        """Replace what is held about some recipes; empty data removes
+        them"""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    @property
+    def needs_rebuild(self):
+        return self.changes > max(1, len(self)) * REBUILD_FRACTION
+
+    def refresh(self):
+        """Re-read the recipes that changed since they were indexed"""
+        if not self.pending:
+            return
+        recipe_ids, self.pending = self.pending, set()
+        data = self.load(recipe_ids=recipe_ids)
+        self.update({pk: data.get(pk) for pk in recipe_ids})
+        self.changes += len(recipe_ids)
+
+
+class IndexCache:
+    """The per-process cache and shared versions of one kind of index"""
+
+    def __init__(self, index_class):
+        self.index_class = index_class
+        self._cache = None
+
+    def cache(self):
+        if self._cache is None:
+            self._cache = TTLCache(
+                maxsize=settings.RECIPE_INDEX_CACHE_SIZE,
+                timeout=settings.RECIPE_INDEX_CACHE_TTL
+            )
+        return self._cache
+
+    def reset(self):
+        """Forget every index so the next lookup rebuilds it from
+        settings"""
+        self._cache = None
+
+    def version_key(self, user_id):
+        return VERSION_KEY.format(self.index_class.name, user_id)
+
+    def get_version(self, user_id):
+        cache = get_response_cache()
+        key = self.version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, new_generation(), None)
+            version = cache.get(key)
+
+        return version
+
+    def _bump_version(self, user_id):
+        cache = get_response_cache()
+        key = self.version_key(user_id)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, new_generation(), None):
+                return None
+            return cache.incr(key)
+
+    def get(self, user_id):
+        """Return an up-to-date index of user_id's recipes, locked
+
+        Use it as a context manager: `with indexes.get(user_id) as index`.
+        """
+        cache = self.cache()
+        version = self.get_version(user_id)
+        index = cache.get(user_id)
+        if index is None or index.version != version or \
+                index.needs_rebuild:
+            index = self.index_class.build(user_id, version)
+            cache.set(user_id, index)
+
+        return _Locked(index)
+
+    def _changed(self, user_id, recipe_ids):
+        """Move the version on; keep this process's index if it was
+        current"""
+        version = self._bump_version(user_id)
+        cache = self.cache()
+        index = cache.get(user_id)
+        if index is None:
+            return
+
+        with index.lock:
+            if recipe_ids is not None and version is not None and \
+                    index.version == version - 1:
+                index.pending.update(recipe_ids)
+                index.version = version
+                return
+
+        cache.delete(user_id)
+
+    def changed(self, user_id, recipe_ids=None):
+        """The recipes recipe_ids, or any of user_id's recipes when None,
+        have changed
+
+        Inside a transaction the version moves again on commit, so an
+        index another process built from the old rows in the meantime is
+        dropped.
+        """
+        self._changed(user_id, recipe_ids)
+        if connection.in_atomic_block:
+            transaction.on_commit(partial(self._changed, user_id, recipe_ids))
+
+
+class _Locked:
+    """Hold an index's lock and bring it up to date while in use"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __enter__(self):
+        self.index.lock.acquire()
+        try:
+            self.index.refresh()
+        except Exception:
+            self.index.lock.release()
+            raise
+        return self.index
+
+    def __exit__(self, *exc_info):
+        self.index.lock.release()
+
+
+def register(index_class):
+    """Start keeping indexes of index_class; returns their IndexCache"""
+    indexes = IndexCache(index_class)
+    _registry.append(indexes)
+    return indexes
+
+
+def reset():
+    """Forget every cached index of every kind"""
+    for indexes in _registry:
+        indexes.reset()
+
+
+def recipes_changed(user_id, recipe_ids=None, relation=None):
+    """Tell the indexes covering relation (all, when None) about a
+    change"""
+    for indexes in _registry:
+        if relation is None or relation in indexes.index_class.relations:
+            indexes.changed(user_id, recipe_ids)
+
+
+def relation_of(model):
+    """The Recipe relation a through model or a related model belongs to"""
+    for relation in RELATIONS:
+        field = Recipe._meta.get_field(relation)
+        if model in (field.remote_field.through, field.related_model):
+            return relation
+    return None
+
+
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Signal receiver: a recipe's tags or ingredients changed"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    relation = relation_of(sender)
+    if not reverse:
+        recipes_changed(instance.user_id, [instance.pk], relation)
+    elif action == 'post_clear':
+        recipes_changed(instance.user_id, None, relation)
+    else:
+        recipes_changed(instance.user_id, pk_set, relation)
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    """Signal receiver: drop a deleted recipe"""
+    recipes_changed(instance.user_id, [instance.pk])
+
+
+def name_deleted(sender, instance, **kwargs):
+    """Signal receiver: deleting a tag or ingredient drops its links
+    without m2m_changed"""
+    recipes_changed(instance.user_id, None, relation_of(sender))
+
+
+def recipes_bulk_saved(sender, user, recipe_ids, **kwargs):
+    """Signal receiver: recipes written by a bulk writer"""
+    recipes_changed(user.pk, recipe_ids)
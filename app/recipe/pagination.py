@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination for the recipe API.
+
+Instead of OFFSET, each cursor remembers the ordering values of the last
+row on the page, and the next page is fetched with a WHERE clause that
+starts right after it. With an index on the ordering columns, page N costs
+the same as page 1.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opt-in keyset pagination over a view's keyset_ordering
+
+    Views whose ordering depends on the request can provide
+    get_keyset_ordering() instead.
+
+    Requests without a cursor or page_size parameter get the whole
+    collection, just as they did before pagination existed.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-id',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return a page of rows, or None if the client didn't opt in"""
+        params = request.query_params
+        if (self.cursor_query_param not in params and
+                self.page_size_query_param not in params):
+            return None
+
+        self.request = request
+        get_ordering = getattr(view, 'get_keyset_ordering', None)
+        if get_ordering is not None:
+            self.ordering = get_ordering()
+        else:
+            self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        # Fetch one extra row to find out whether there is a next page.
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+
+        return self.page
+
+    def get_page_size(self, request):
+        """Read the requested page size, capped at the configured maximum"""
+        max_size = settings.RECIPE_API_MAX_PAGE_SIZE
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            size = settings.RECIPE_API_PAGE_SIZE
+
+        return max(1, min(size, max_size))
+
+    def after(self, position):
+        """Build the WHERE clause for rows sorting after position
+
+        For an ordering (a, b) that is a > x OR (a = x AND b > y), with
+        the comparison flipped for descending fields.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        return condition
+
+    def encode_cursor(self, instance):
+        """Turn the ordering values of instance into an opaque cursor
+
+        instance may also be a row from values().
+        """
+        if isinstance(instance, dict):
+            position = [instance[field.lstrip('-')]
+                        for field in self.ordering]
+        else:
+            position = [getattr(instance, field.lstrip('-'))
+                        for field in self.ordering]
+        data = json.dumps(position).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def decode_cursor(self, request):
+        """Return the position stored in the request's cursor, if any"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = base64.urlsafe_b64decode(encoded.encode('ascii'))
+            position = json.loads(data.decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position
+
+    def get_next_link(self):
+        """Return the URL of the next page, or None on the last one"""
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+        return replace_query_param(
+            url, self.page_size_query_param, self.page_size)
+
+    def get_paginated_response(self, data):
+        """Wrap a page of data with the link to the next one"""
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
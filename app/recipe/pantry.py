@@ -0,0 +1,199 @@
+"""
+"What can I cook" matching of a pantry against a user's recipes.
+
+Given the ingredients someone has on hand, recipes are ranked by how
+much of them the pantry covers: the ones that can be made outright
+first, then by fewest ingredients missing, then by most of the pantry
+used, then newest first. Recipes sharing no ingredient with the pantry
+are left out.
+
+A user's recipes are held in a PantryIndex as bitsets, one Python int per
+ingredient with bit p set when the recipe at position p uses it, and one
+per ingredient count. Positions follow recipe ids, so higher bits are
+newer recipes; a recipe placed after the build with a lower id than the
+newest one breaks that, and the index reads such masks in id order until
+it is rebuilt. Matching a pantry of k ingredients takes a few dozen
+whole-collection bitwise operations, whatever the number of recipes:
+
+- the k ingredient bitsets are added up, bit-sliced, into a binary
+  counter of how many pantry ingredients each recipe has;
+- ANDing the counter's slices gives the recipes with exactly h of them,
+  and ANDing that with the recipes of h + m ingredients gives those
+  missing m;
+- results are read off those masks highest bit first.
+
+See recipe.indexes for how the index is cached and kept current.
+"""
+from recipe.indexes import UserIndex, linked_ids, register
+
+
+def to_bitset(positions):
+    """Return an int with the given bit positions set"""
+    if not positions:
+        return 0
+    buffer = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bits(mask):
+    """Yield the positions set in mask, highest first"""
+    while mask:
+        position = mask.bit_length() - 1
+        yield position
+        mask ^= 1 << position
+
+
+class PantryIndex(UserIndex):
+    """Bitsets of one user's recipes by ingredient"""
+    name = 'pantry'
+    relations = ('ingredients',)
+
+    def __init__(self, ingredients, version=None):
+        super().__init__(version)
+        self.ingredients = {}
+        self.positions = {}
+        self.ids = []
+        # Whether positions are still in recipe id order
+        self.ordered = True
+        self.bitsets = {}
+        self.by_count = {}
+
+        by_ingredient = {}
+        by_count = {}
+        for recipe_id in sorted(ingredients):
+            recipe_ingredients = frozenset(ingredients[recipe_id])
+            position = self.place(recipe_id)
+            self.ingredients[recipe_id] = recipe_ingredients
+            for pk in recipe_ingredients:
+                by_ingredient.setdefault(pk, []).append(position)
+            by_count.setdefault(len(recipe_ingredients), []).append(position)
+
+        self.bitsets = {pk: to_bitset(positions)
+                        for pk, positions in by_ingredient.items()}
+        self.by_count = {count: to_bitset(positions)
+                         for count, positions in by_count.items()}
+
+    @classmethod
+    def load(cls, user_id=None, recipe_ids=None):
+        return linked_ids('ingredients', recipe_ids, user_id)
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    @property
+    def needs_rebuild(self):
+        return not self.ordered or super().needs_rebuild
+
+    def place(self, recipe_id):
+        """Return the bit position of a recipe, giving it one if new"""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            if self.ids and recipe_id < self.ids[-1]:
+                self.ordered = False
+            position = self.positions[recipe_id] = len(self.ids)
+            self.ids.append(recipe_id)
+        return position
+
+    def newest_first(self, mask):
+        """Yield the recipe ids in mask, highest first"""
+        ids = (self.ids[position] for position in bits(mask))
+        if self.ordered:
+            return ids
+        return iter(sorted(ids, reverse=True))
+
+    def _toggle(self, bitsets, key, bit):
+        value = bitsets.get(key, 0) ^ bit
+        if value:
+            bitsets[key] = value
+        else:
+            bitsets.pop(key, None)
+
+    def update(self, ingredients):
+        """Removed recipes keep their position, with no bits set, until the
+        index is rebuilt"""
+        for recipe_id, new in ingredients.items():
+            new = frozenset(new or ())
+            old = self.ingredients.pop(recipe_id, frozenset())
+            if new == old:
+                if new:
+                    self.ingredients[recipe_id] = new
+                continue
+
+            bit = 1 << self.place(recipe_id)
+            for pk in old.symmetric_difference(new):
+                self._toggle(self.bitsets, pk, bit)
+            if old:
+                self._toggle(self.by_count, len(old), bit)
+            if new:
+                self._toggle(self.by_count, len(new), bit)
+                self.ingredients[recipe_id] = new
+
+    def counter(self, pantry):
+        """Return the bit-sliced count of pantry ingredients per recipe:
+        slice k holds bit k of each recipe's count"""
+        slices = []
+        for pk in pantry:
+            carry = self.bitsets.get(pk, 0)
+            for k, digit in enumerate(slices):
+                if not carry:
+                    break
+                slices[k], carry = digit ^ carry, digit & carry
+            if carry:
+                slices.append(carry)
+        return slices
+
+    def match(self, pantry, limit, max_missing=None):
+        """Return up to limit (recipe id, have, total) for the pantry, best
+        first"""
+        pantry = set(pantry)
+        slices = self.counter(pantry)
+        if not slices:
+            return []
+
+        def exactly(have, total):
+            """Recipes of total ingredients, have of them in the pantry"""
+            mask = self.by_count[total]
+            for k, digit in enumerate(slices):
+                mask &= digit if have >> k & 1 else ~digit
+            return mask
+
+        most = max(self.by_count)
+        if max_missing is None:
+            max_missing = most
+        # Beyond what the counter's slices can hold nothing matches
+        most_have = min(len(pantry), most, (1 << len(slices)) - 1)
+
+        results = []
+        for missing in range(0, min(max_missing, most - 1) + 1):
+            for have in range(most_have, 0, -1):
+                total = have + missing
+                if total not in self.by_count:
+                    continue
+                for recipe_id in self.newest_first(exactly(have, total)):
+                    results.append((recipe_id, have, total))
+                    if len(results) == limit:
+                        return results
+
+        return results
+
+
+pantry_indexes = register(PantryIndex)
+
+
+def pantry_matches(user_id, ingredient_ids, limit, max_missing=None):
+    """Match a pantry against user_id's recipes
+
+    Returns (recipe id, missing ingredient ids, coverage) tuples, best
+    first.
+    """
+    pantry = frozenset(ingredient_ids)
+    with pantry_indexes.get(user_id) as index:
+        return [
+            (recipe_id,
+             sorted(index.ingredients[recipe_id] - pantry),
+             have / total)
+            for recipe_id, have, total
+            in index.match(pantry, limit, max_missing)
+        ]
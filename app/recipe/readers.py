@@ -0,0 +1,201 @@
+"""
+Read-only serialization of recipes straight from values() rows.
+
+RecipeSerializer builds a model instance per row and runs every value
+through its field objects. For reads none of that is needed: the scalar
+columns come back from values() ready to use, and the related ids (and
+names, for details) are fetched from the through tables in one query per
+relation and grouped by recipe. The output is the same as the model
+serializers', key for key.
+
+Clients can ask for a sparse fieldset with ?fields= and ?omit=. Only the
+columns those fields need are selected, and a relation that isn't asked
+for is never queried at all.
+"""
+from collections import OrderedDict, defaultdict
+from functools import partial
+from operator import itemgetter
+
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from core.middleware import serializing
+from core.models import Recipe
+from core.utils import chunks
+from recipe.renditions import image_rendition_urls
+from recipe.serializers import RecipeSerializer
+
+
+def sparse_fields(query_params, available):
+    """Return the fields picked by ?fields= and ?omit=, in their usual order
+
+    fields lists what to keep (everything when absent) and omit what to
+    drop from that. Unknown names are a validation error rather than being
+    silently ignored.
+    """
+    requested = {}
+    for param in ('fields', 'omit'):
+        value = query_params.get(param)
+        if value is None:
+            continue
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({param: [
+                _('Unknown field "%s".') % name for name in unknown]})
+        requested[param] = names
+
+    keep = requested.get('fields', available)
+    omit = requested.get('omit', ())
+    return tuple(name for name in available
+                 if name in keep and name not in omit)
+
+
+class RecipeReader:
+    """Render recipes like RecipeSerializer, or RecipeDetailSerializer when
+    nested is set, from rows returned by values()
+
+    Pass fields to render only some of them; only the columns and
+    relations those fields need are then queried.
+    """
+
+    fields = RecipeSerializer.Meta.fields
+    relations = ('tags', 'ingredients')
+    # Columns each field is rendered from; id is always read
+    field_columns = {
+        'title': ('title',),
+        'time_minutes': ('time_minutes',),
+        'price': ('price',),
+        'link': ('link',),
+        'renditions': ('image', 'image_renditions_ready'),
+    }
+
+    def __init__(self, nested=False, context=None, fields=None):
+        self.nested = nested
+        self.request = (context or {}).get('request')
+        if fields is not None:
+            self.fields = tuple(fields)
+        # Borrow the one field whose formatting depends on settings
+        self.price = RecipeSerializer().fields['price'].to_representation
+        self.storage = Recipe._meta.get_field('image').storage
+
+    @property
+    def columns(self):
+        """The recipe columns the selected fields are rendered from"""
+        columns = ['id']
+        for field in self.fields:
+            columns.extend(self.field_columns.get(field, ()))
+        return tuple(columns)
+
+    def values(self, queryset, extra=()):
+        """Turn a recipe queryset into the rows this reader renders
+
+        extra names additional columns to keep, such as the ones a keyset
+        cursor is built from.
+        """
+        columns = list(dict.fromkeys(self.columns + tuple(extra)))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def links(self, field, recipe_ids):
+        """Map recipe id -> the representations of its related objects"""
+        m2m = Recipe._meta.get_field(field)
+        source = m2m.m2m_field_name()
+        target = m2m.m2m_reverse_field_name()
+        columns = [f'{source}_id', f'{target}_id']
+        if self.nested:
+            columns.append(f'{target}__name')
+
+        grouped = defaultdict(list)
+        for ids in chunks(recipe_ids):
+            rows = m2m.remote_field.through.objects.filter(**{
+                f'{source}_id__in': ids
+            }).order_by(f'{target}_id').values_list(*columns)
+            if self.nested:
+                for recipe_id, pk, name in rows:
+                    grouped[recipe_id].append(
+                        OrderedDict([('id', pk), ('name', name)]))
+            else:
+                for recipe_id, pk in rows:
+                    grouped[recipe_id].append(pk)
+
+        return grouped
+
+    def getters(self, recipe_ids):
+        """Return (field, function of a row) for each selected field"""
+        getters = {
+            'id': itemgetter('id'),
+            'title': itemgetter('title'),
+            'time_minutes': itemgetter('time_minutes'),
+            'price': lambda row: self.price(row['price']),
+            'link': itemgetter('link'),
+            'renditions': lambda row: image_rendition_urls(
+                row['image'], row['image_renditions_ready'], self.storage,
+                self.request),
+        }
+        for relation in self.relations:
+            # Relations nobody asked for are never queried
+            if relation in self.fields:
+                grouped = self.links(relation, recipe_ids)
+                getters[relation] = partial(self.linked, grouped)
+
+        return [(field, getters[field]) for field in self.fields]
+
+    @staticmethod
+    def linked(grouped, row):
+        """Look up the related objects of a row"""
+        return grouped.get(row['id'], [])
+
+    def to_representation(self, rows):
+        """Render a list of rows"""
+        rows = list(rows)
+        getters = self.getters([row['id'] for row in rows])
+
+        return [OrderedDict([(field, get(row)) for field, get in getters])
+                for row in rows]
+
+
+class RecipeReadMixin:
+    """Serve list and retrieve through RecipeReader"""
+
+    def get_reader(self):
+        """Return the reader for the current action and fieldset"""
+        return RecipeReader(
+            nested=self.action in ('retrieve', 'export'),
+            context=self.get_serializer_context(),
+            fields=sparse_fields(
+                self.request.query_params, RecipeReader.fields)
+        )
+
+    def list(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        # Keep the columns a keyset cursor is built from
+        cursor_fields = [field.lstrip('-')
+                         for field in self.get_keyset_ordering()]
+        queryset = reader.values(
+            self.filter_queryset(self.get_queryset()), cursor_fields)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            with serializing(request):
+                data = reader.to_representation(page)
+            return self.get_paginated_response(data)
+
+        with serializing(request):
+            data = reader.to_representation(queryset)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self.get_reader()
+        queryset = reader.values(
+            self.filter_queryset(self.get_queryset()), ('user_id',))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        # As get_object() would, with an unsaved recipe built from the row
+        self.check_object_permissions(request, Recipe(**row))
+
+        with serializing(request):
+            data = reader.to_representation([row])[0]
+        return Response(data)
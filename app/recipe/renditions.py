@@ -0,0 +1,155 @@
+"""
+Background generation of resized copies of recipe images.
+
+Uploading an image only saves the original. A job is then queued on a
+process pool that writes a fixed set of renditions next to it, and marks
+the recipe once they exist so the API can start handing out their URLs.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from PIL import Image
+
+from core.models import Recipe
+from recipe.caching import renditions_ready
+
+logger = logging.getLogger(__name__)
+
+# name -> (bounding box, Pillow format, file extension)
+RENDITIONS = OrderedDict([
+    ('thumbnail', ((150, 150), 'JPEG', 'jpg')),
+    ('medium', ((600, 600), 'JPEG', 'jpg')),
+    ('webp', ((600, 600), 'WEBP', 'webp')),
+])
+
+_executor = None
+
+
+def rendition_name(image_name, rendition):
+    """Return the storage name of one rendition of an image"""
+    ext = RENDITIONS[rendition][2]
+    root = os.path.splitext(image_name)[0]
+    return f'{root}_{rendition}.{ext}'
+
+
+def build_renditions(path):
+    """Write every rendition of the image at path and return their paths
+
+    This runs in a worker process, so it only touches the filesystem.
+    """
+    written = []
+    with Image.open(path) as original:
+        original.load()
+        for rendition, (size, fmt, _) in RENDITIONS.items():
+            img = original.copy()
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.thumbnail(size, Image.LANCZOS)
+
+            target = rendition_name(path, rendition)
+            # Write under a temporary name so nobody serves half a file
+            partial_path = f'{target}.part'
+            img.save(partial_path, format=fmt, quality=85)
+            os.replace(partial_path, target)
+            written.append(target)
+
+    return written
+
+
+def delete_renditions(image_name, storage):
+    """Remove the renditions of an image from storage"""
+    for rendition in RENDITIONS:
+        storage.delete(rendition_name(image_name, rendition))
+
+
+def image_replaced(image_name, storage):
+    """Delete the renditions of a replaced image once the new one is
+    committed"""
+    if image_name:
+        transaction.on_commit(partial(delete_renditions, image_name, storage))
+
+
+def rendition_urls(recipe, request=None):
+    """Return rendition name -> URL, or None until they have been built"""
+    return image_rendition_urls(
+        recipe.image.name, recipe.image_renditions_ready,
+        recipe.image.storage, request)
+
+
+def image_rendition_urls(image_name, ready, storage, request=None):
+    """rendition_urls() for an image known only by its name"""
+    if not image_name or not ready:
+        return None
+
+    urls = OrderedDict()
+    for rendition in RENDITIONS:
+        url = storage.url(rendition_name(image_name, rendition))
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[rendition] = url
+
+    return urls
+
+
+def get_executor():
+    """Return the shared process pool, starting it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_RENDITION_WORKERS)
+
+    return _executor
+
+
+def mark_ready(recipe_id, image_name):
+    """Flag a recipe's renditions as built
+
+    Matching on the image name too means a job for an image that has
+    since been replaced can't claim the new one is ready.
+    """
+    updated = Recipe.objects.filter(
+        pk=recipe_id,
+        image=image_name
+    ).update(image_renditions_ready=True)
+    if updated:
+        renditions_ready(recipe_id)
+    return bool(updated)
+
+
+def _job_done(recipe_id, image_name, submitter, future):
+    """Record the outcome of a rendition job"""
+    try:
+        written = future.result()
+        if not mark_ready(recipe_id, image_name):
+            # The image was replaced while its renditions were built
+            for path in written:
+                os.remove(path)
+    except Exception:
+        logger.exception('Building renditions of %s failed', image_name)
+    finally:
+        # Callbacks normally run on the pool's own thread; don't leave a
+        # connection open there, but never close the request's connection.
+        if threading.current_thread() is not submitter:
+            connection.close()
+
+
+def queue_renditions(recipe):
+    """Build the renditions of recipe.image in the background"""
+    path = recipe.image.path
+    if not settings.RECIPE_RENDITION_WORKERS:
+        build_renditions(path)
+        mark_ready(recipe.pk, recipe.image.name)
+        recipe.image_renditions_ready = True
+        return
+
+    future = get_executor().submit(build_renditions, path)
+    future.add_done_callback(partial(
+        _job_done, recipe.pk, recipe.image.name, threading.current_thread()
+    ))
@@ -0,0 +1,232 @@
+"""
+Full-text search over recipes.
+
+A recipe's title, tag names and ingredient names are indexed, weighted in
+that order. On PostgreSQL they live in Recipe.search_vector behind a GIN
+index; on SQLite (test runs) in the core_recipe_fts FTS5 table. Signal
+receivers below keep the index current as recipes and their relations
+change. Other backends fall back to a plain icontains match.
+
+Saving a recipe, then setting its tags and ingredients, fires three
+signals. Writes wrapped in batched_reindex() collect the recipes they
+touch and reindex each of them once, at the end of the block and in its
+transaction; outside such a block each signal reindexes at once.
+"""
+import re
+import threading
+from contextlib import contextmanager
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from core.models import Recipe
+from core.utils import chunks
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'core_recipe_fts'
+# Relative weights of title, tags and ingredients in SQLite's bm25()
+FTS_WEIGHTS = (10.0, 4.0, 2.0)
+
+_batch = threading.local()
+
+# Subquery collecting the names linked to a recipe through one relation
+NAMES_SQL = (
+    "(SELECT {agg} FROM {through} x JOIN {target} n ON n.id = x.{column} "
+    "WHERE x.recipe_id = r.id)"
+)
+
+POSTGRES_UPDATE_SQL = """
+UPDATE {recipe} r SET search_vector =
+    setweight(to_tsvector(%s, r.title), 'A') ||
+    setweight(to_tsvector(%s, coalesce({tags}, '')), 'B') ||
+    setweight(to_tsvector(%s, coalesce({ingredients}, '')), 'C')
+WHERE r.id IN ({ids})
+"""
+
+SQLITE_DELETE_SQL = 'DELETE FROM {fts} WHERE rowid IN ({ids})'
+SQLITE_INSERT_SQL = """
+INSERT INTO {fts} (rowid, title, tags, ingredients)
+SELECT r.id, r.title, coalesce({tags}, ''), coalesce({ingredients}, '')
+FROM {recipe} r WHERE r.id IN ({ids})
+"""
+
+
+def names_sql(field, agg):
+    """Build the subquery aggregating the names behind one relation"""
+    m2m = Recipe._meta.get_field(field)
+    return NAMES_SQL.format(
+        agg=agg,
+        through=m2m.remote_field.through._meta.db_table,
+        target=m2m.related_model._meta.db_table,
+        column=m2m.m2m_reverse_name(),
+    )
+
+
+def update_search_index(recipe_ids):
+    """Recompute the search index entries of the given recipes"""
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        for ids in chunks(recipe_ids):
+            placeholders = ', '.join(['%s'] * len(ids))
+            if vendor == 'postgresql':
+                agg = "string_agg(n.name, ' ')"
+                cursor.execute(POSTGRES_UPDATE_SQL.format(
+                    recipe=Recipe._meta.db_table,
+                    tags=names_sql('tags', agg),
+                    ingredients=names_sql('ingredients', agg),
+                    ids=placeholders,
+                ), [SEARCH_CONFIG] * 3 + ids)
+            elif vendor == 'sqlite':
+                agg = "group_concat(n.name, ' ')"
+                cursor.execute(SQLITE_DELETE_SQL.format(
+                    fts=FTS_TABLE, ids=placeholders), ids)
+                cursor.execute(SQLITE_INSERT_SQL.format(
+                    fts=FTS_TABLE,
+                    recipe=Recipe._meta.db_table,
+                    tags=names_sql('tags', agg),
+                    ingredients=names_sql('ingredients', agg),
+                    ids=placeholders,
+                ), ids)
+
+
+@contextmanager
+def batched_reindex():
+    """Run a block in a transaction, reindexing the recipes it touches
+    once at its end
+
+    A block inside another one joins it.
+    """
+    if getattr(_batch, 'recipe_ids', None) is not None:
+        yield
+        return
+
+    _batch.recipe_ids = set()
+    try:
+        with transaction.atomic():
+            yield
+            recipe_ids, _batch.recipe_ids = _batch.recipe_ids, None
+            update_search_index(recipe_ids)
+    finally:
+        _batch.recipe_ids = None
+
+
+def reindex(recipe_ids):
+    """Reindex recipes now, or at the end of the current batch"""
+    pending = getattr(_batch, 'recipe_ids', None)
+    if pending is None:
+        update_search_index(recipe_ids)
+    else:
+        pending.update(recipe_ids)
+
+
+def unindex(recipes):
+    """Drop a queryset of recipes from the SQLite index, ahead of a raw
+    delete that skips recipe_deleted"""
+    if connection.vendor == 'sqlite':
+        sql, params = recipes.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQLITE_DELETE_SQL.format(fts=FTS_TABLE, ids=sql), params)
+
+
+def fts_match(q):
+    """Quote every word of q so FTS5 treats them as plain terms"""
+    words = re.findall(r'\w+', q)
+    return ' '.join('"%s"' % word for word in words)
+
+
+def search_recipes(queryset, q):
+    """Filter queryset to recipes matching q, annotated with search_rank
+
+    A higher search_rank is a better match on every backend.
+    """
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(q, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+
+    if vendor == 'sqlite':
+        match = fts_match(q)
+        if not match:
+            return queryset.annotate(search_rank=Value(
+                0.0, output_field=FloatField())).none()
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = '
+            f'{Recipe._meta.db_table}.id',
+            (match,),
+            output_field=FloatField()
+        )
+        return queryset.annotate(search_rank=rank).filter(
+            search_rank__isnull=False)
+
+    matches = Recipe.objects.filter(
+        Q(title__icontains=q) |
+        Q(tags__name__icontains=q) |
+        Q(ingredients__name__icontains=q)
+    ).values('id')
+    return queryset.filter(id__in=matches).annotate(
+        search_rank=Value(0.0, output_field=FloatField()))
+
+
+def recipe_saved(sender, instance, **kwargs):
+    """Signal receiver: reindex a recipe whose title may have changed"""
+    reindex([instance.pk])
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    """Signal receiver: drop a deleted recipe from the SQLite index"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQLITE_DELETE_SQL.format(fts=FTS_TABLE, ids='%s'),
+                [instance.pk]
+            )
+
+
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Signal receiver: reindex recipes whose tags or ingredients changed"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        reindex([instance.pk])
+    elif action == 'post_clear':
+        # The cleared links are already gone, so pre_clear stashed them
+        reindex(getattr(instance, '_search_recipe_ids', []))
+    else:
+        reindex(pk_set)
+
+
+def recipe_links_clearing(sender, instance, action, reverse, **kwargs):
+    """Signal receiver: remember which recipes a reverse clear touches"""
+    if action == 'pre_clear' and reverse:
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True))
+
+
+def name_saved(sender, instance, created, **kwargs):
+    """Signal receiver: a renamed tag or ingredient changes its recipes"""
+    if not created:
+        reindex(instance.recipe_set.values_list('id', flat=True))
+
+
+def name_deleting(sender, instance, **kwargs):
+    """Signal receiver: remember the recipes of a tag being deleted"""
+    instance._search_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True))
+
+
+def name_deleted(sender, instance, **kwargs):
+    """Signal receiver: reindex the recipes a deleted tag was on"""
+    reindex(getattr(instance, '_search_recipe_ids', []))
+
+
+def recipes_bulk_saved(sender, recipe_ids, **kwargs):
+    """Signal receiver: reindex recipes written by the bulk endpoint"""
+    reindex(recipe_ids)
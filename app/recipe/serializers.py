@@ -1,10 +1,82 @@
-# from django.utils.translation import ugettext_lazy as _
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, MANY_RELATION_KWARGS
 
 from core import models
+from core.middleware import TimedSerializerMixin
+from recipe.renditions import rendition_urls
+from recipe.signals import recipes_bulk_saved
 
 
-class TagSerializer(serializers.ModelSerializer):
+class RenditionsField(serializers.ReadOnlyField):
+    """URLs of a recipe's resized images, once they have been built"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return rendition_urls(recipe, self.context.get('request'))
+
+
+class BatchedManyRelatedField(ManyRelatedField):
+    """Resolve a whole list of primary keys with a single query
+
+    The stock ManyRelatedField asks its child to get() each id in turn.
+    This looks them all up with one id__in query and reports every
+    missing id at once.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            try:
+                pks.append(int(item))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+
+        found = child.get_queryset().in_bulk(pks)
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in found]
+        if missing:
+            raise serializers.ValidationError([
+                child.error_messages['does_not_exist'].format(pk_value=pk)
+                for pk in missing
+            ], code='does_not_exist')
+
+        return [found[pk] for pk in dict.fromkeys(pks)]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field limited to objects the requesting user owns"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()
+
+        return queryset.filter(user=request.user)
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the tag object"""
     class Meta:
         model = models.Tag
@@ -12,7 +84,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Serializer for the ingredient object"""
     class Meta:
         model = models.Ingredient
@@ -20,22 +93,39 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class TagCountSerializer(TagSerializer):
+    """Serialize a tag with the number of recipes using it"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count',)
+
+
+class IngredientCountSerializer(IngredientSerializer):
+    """Serialize an ingredient with the number of recipes using it"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the recipe object"""
 
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=models.Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=models.Tag.objects.all()
     )
+    renditions = RenditionsField()
 
     class Meta:
         model = models.Recipe
         fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes',
-                  'price', 'link')
+                  'price', 'link', 'renditions')
         read_only_fields = ('id',)
 
 
@@ -45,10 +135,175 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     """Serializer for recipe images"""
+    renditions = RenditionsField()
 
     class Meta:
         model = models.Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'renditions')
         read_only_fields = ('id',)
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """Validate and write a whole batch of recipes together
+
+    Items with an id update that recipe, the rest are created. Related
+    ids for every item are checked with one query per relation, and the
+    writes happen in a single transaction with batched INSERTs for the
+    recipes and both through tables.
+    """
+    batch_size = 500
+
+    def to_internal_value(self, data):
+        """Check each item, then check them against each other"""
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        max_items = settings.RECIPE_BULK_MAX_ITEMS
+        if len(data) > max_items:
+            raise serializers.ValidationError({
+                'non_field_errors': [
+                    _('At most %d recipes per request.') % max_items
+                ]
+            })
+
+        items = []
+        errors = []
+        for entry in data:
+            try:
+                items.append(self.child.run_validation(entry))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                items.append({})
+                errors.append(exc.detail)
+
+        user = self.context['request'].user
+        ids = [item['id'] for item in items if 'id' in item]
+        self.existing = models.Recipe.objects.filter(
+            user=user, id__in=ids).in_bulk()
+        seen = set()
+        for pos, item in enumerate(items):
+            pk = item.get('id')
+            if pk is None:
+                continue
+            if pk in seen:
+                errors[pos]['id'] = [_('Duplicate recipe id %d.') % pk]
+            elif pk not in self.existing:
+                errors[pos]['id'] = [_('Recipe %d not found.') % pk]
+            seen.add(pk)
+
+        for field, model in (('tags', models.Tag),
+                             ('ingredients', models.Ingredient)):
+            wanted = {pk for item in items for pk in item.get(field, ())}
+            found = set(model.objects.filter(
+                user=user, id__in=wanted).values_list('id', flat=True))
+            for pos, item in enumerate(items):
+                missing = sorted(set(item.get(field, ())) - found)
+                if missing:
+                    errors[pos][field] = [
+                        _('Invalid pk "%s" - object does not exist.') % pk
+                        for pk in missing
+                    ]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    def create(self, validated_data):
+        """Insert new recipes, update existing ones, then link them all"""
+        recipes = []
+        links = {'tags': {}, 'ingredients': {}}
+        with transaction.atomic():
+            new = []
+            for item in validated_data:
+                item = dict(item)
+                related = {
+                    field: item.pop(field, None) for field in links
+                }
+                pk = item.pop('id', None)
+                if pk is None:
+                    recipe = models.Recipe(**item)
+                    new.append(recipe)
+                    # New recipes start out with no relations
+                    related = {
+                        field: ids or [] for field, ids in related.items()
+                    }
+                else:
+                    recipe = self.existing[pk]
+                    for attr, value in item.items():
+                        setattr(recipe, attr, value)
+                    recipe.save()
+
+                recipes.append((recipe, related))
+
+            self.insert_recipes(new)
+            for recipe, related in recipes:
+                for field, ids in related.items():
+                    if ids is not None:
+                        links[field][recipe.pk] = ids
+
+            for field, recipe_links in links.items():
+                self.replace_links(field, recipe_links)
+
+        saved = [recipe for recipe, related in recipes]
+        recipes_bulk_saved.send(
+            sender=models.Recipe,
+            user=self.context['request'].user,
+            recipe_ids=[recipe.pk for recipe in saved]
+        )
+        return saved
+
+    def insert_recipes(self, recipes):
+        """INSERT new recipes, making sure each one ends up with its id"""
+        if connection.features.can_return_ids_from_bulk_insert:
+            models.Recipe.objects.bulk_create(
+                recipes, batch_size=self.batch_size)
+        else:
+            for recipe in recipes:
+                recipe.save()
+
+    def replace_links(self, field, recipe_links):
+        """Set the field's through rows of each recipe in recipe_links"""
+        if not recipe_links:
+            return
+
+        through = getattr(models.Recipe, field).through
+        target = models.Recipe._meta.get_field(field) \
+            .m2m_reverse_field_name()
+        through.objects.filter(recipe_id__in=list(recipe_links)).delete()
+        through.objects.bulk_create(
+            [
+                through(recipe_id=recipe_id, **{f'{target}_id': pk})
+                for recipe_id, ids in recipe_links.items()
+                for pk in dict.fromkeys(ids)
+            ],
+            batch_size=self.batch_size
+        )
+
+
+class RecipeBulkSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
+    """One item of a bulk recipe write
+
+    Unlike RecipeSerializer, id is accepted to update an existing recipe,
+    and related ids are plain integers validated by the list serializer.
+    Leaving out tags or ingredients keeps an existing recipe's links.
+    """
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta:
+        model = models.Recipe
+        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes',
+                  'price', 'link')
+        list_serializer_class = RecipeBulkListSerializer
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after the bulk endpoint writes recipes. bulk_create and the batched
+# through-table inserts skip post_save and m2m_changed, so anything that
+# tracks recipes needs to listen for this as well.
+recipes_bulk_saved = Signal(providing_args=['user', 'recipe_ids'])
@@ -0,0 +1,144 @@
+"""
+"Similar recipes" ranking over tags and ingredients.
+
+Each recipe is a sparse vector with one entry per tag and ingredient it
+uses, weighted by inverse document frequency: a tag on every recipe says
+little, a rare ingredient says a lot. Recipes are ranked by the cosine
+of their vectors.
+
+A user's vectors are kept in a SimilarityIndex, which holds an inverted
+index (feature -> recipe ids) alongside the vectors. Scoring a recipe
+only visits the recipes that share one of its features, so a top-k
+query costs in proportion to those posting lists, never to the whole
+collection. The index is plain Python data: there is no array library
+to lean on, and for these sparse sets a dict of sets is what a CSR
+matrix would give us anyway. See recipe.indexes for how it is cached and
+kept current; IDF weights are fixed when it is built.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from recipe.indexes import RELATIONS, UserIndex, linked_ids, register
+
+
+def feature(relation, pk):
+    """Encode a tag or ingredient id as one integer feature"""
+    return pk * len(RELATIONS) + RELATIONS.index(relation)
+
+
+class SimilarityIndex(UserIndex):
+    """IDF-weighted cosine similarity between one user's recipes"""
+    name = 'similar'
+
+    def __init__(self, features, version=None):
+        super().__init__(version)
+        self.features = {}
+        self.postings = defaultdict(set)
+        self.norms = {}
+
+        for recipe_id, recipe_features in features.items():
+            self.features[recipe_id] = recipe_features
+            for f in recipe_features:
+                self.postings[f].add(recipe_id)
+
+        # Smoothed so a feature on every recipe still counts a little
+        count = len(self.features)
+        self.weights = {
+            f: math.log((count + 1) / (len(recipes) + 1)) + 1
+            for f, recipes in self.postings.items()
+        }
+        self.default_weight = math.log(count + 1) + 1
+        for recipe_id, recipe_features in self.features.items():
+            self.norms[recipe_id] = self.norm(recipe_features)
+
+    @classmethod
+    def load(cls, user_id=None, recipe_ids=None):
+        features = defaultdict(set)
+        for relation in cls.relations:
+            linked = linked_ids(relation, recipe_ids, user_id)
+            for recipe_id, pks in linked.items():
+                features[recipe_id].update(feature(relation, pk)
+                                           for pk in pks)
+        return features
+
+    def __len__(self):
+        return len(self.features)
+
+    def weight(self, f):
+        return self.weights.get(f, self.default_weight)
+
+    def norm(self, recipe_features):
+        return math.sqrt(sum(self.weight(f) ** 2 for f in recipe_features))
+
+    def update(self, features):
+        for recipe_id, new in features.items():
+            new = new or set()
+            old = self.features.pop(recipe_id, set())
+            self.norms.pop(recipe_id, None)
+            for f in old - new:
+                self.postings[f].discard(recipe_id)
+            for f in new - old:
+                self.postings[f].add(recipe_id)
+            if new:
+                self.features[recipe_id] = new
+                self.norms[recipe_id] = self.norm(new)
+
+    def similar(self, recipe_id, limit):
+        """Return the limit most similar recipes as (score, id), best
+        first
+
+        Features are visited rarest (heaviest) first. A recipe that only
+        shares the features still to come can score at most
+        sqrt(their summed squared weights) / norm, by Cauchy-Schwarz.
+        Once that is below the limit-th best score so far, no new
+        recipe can make the cut, and the remaining, long posting lists
+        only need looking at for the recipes already found.
+        """
+        features = self.features.get(recipe_id)
+        if not features:
+            return []
+
+        norm = self.norms[recipe_id]
+        norms = self.norms
+        weights = {f: self.weight(f) ** 2 for f in features}
+        ordered = sorted(features, key=weights.get, reverse=True)
+        remaining = sum(weights.values())
+
+        def cosines():
+            return ((dot / (norm * norms[other]), other)
+                    for other, dot in scores.items() if other != recipe_id)
+
+        def exact(other):
+            shared = features.intersection(self.features[other])
+            return sum(weights[f] for f in shared) / (norm * norms[other])
+
+        scores = {}
+        closed = False
+        for f in ordered:
+            postings = self.postings[f]
+            if not closed and len(scores) > limit and \
+                    len(postings) > len(scores):
+                # The full scores of the best partial matches so far are
+                # a floor for the final limit-th best
+                floor = min(exact(other)
+                            for _, other in heapq.nlargest(limit, cosines()))
+                closed = math.sqrt(remaining) / norm < floor
+            if closed:
+                postings = postings.intersection(scores)
+            weight = weights[f]
+            get = scores.get
+            for other in postings:
+                scores[other] = get(other, 0.0) + weight
+            remaining -= weight
+
+        return heapq.nlargest(limit, cosines())
+
+
+similar_indexes = register(SimilarityIndex)
+
+
+def similar_recipes(user_id, recipe_id, limit):
+    """Rank user_id's other recipes by similarity to recipe_id"""
+    with similar_indexes.get(user_id) as index:
+        return index.similar(recipe_id, limit)
@@ -0,0 +1,49 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Assertions that keep an endpoint's query count in check
+
+    Mix into a TestCase. The idea is to hit the same endpoint at several
+    result sizes and insist the number of queries stays put, which is
+    what an N+1 regression breaks first.
+    """
+
+    def count_queries(self, func, *args, **kwargs):
+        """Call func and return (number of queries, its result)"""
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args, **kwargs)
+
+        return len(ctx), result
+
+    def assertQueryCountFlat(self, request, grow, sizes=(1, 3, 10),
+                             max_queries=None):
+        """Assert request() costs the same number of queries at every size
+
+        grow(n) is called to add n more rows before each measurement, so
+        the result set ends up at the running total of sizes. If
+        max_queries is given, every measurement must also fit under it.
+        Returns the list of query counts.
+        """
+        counts = []
+        for size in sizes:
+            grow(size)
+            num, resp = self.count_queries(request)
+            self.assertLess(
+                resp.status_code, 400,
+                f'Request failed with {resp.status_code}'
+            )
+            counts.append(num)
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'Query count grows with result size: {counts}'
+        )
+        if max_queries is not None:
+            self.assertLessEqual(
+                counts[0], max_queries,
+                f'{counts[0]} queries is over the budget of {max_queries}'
+            )
+
+        return counts
@@ -0,0 +1,125 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Ingredient, Tag
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def recipe_payload(title, **params):
+    """Build one item of a bulk request"""
+    payload = {'title': title, 'time_minutes': 10, 'price': '5.00'}
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test the bulk recipe endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'bulk@importer.org',
+            'many-at-once'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Soup')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Leek')
+
+    def test_bulk_create(self):
+        """A list of recipes is created with their relations"""
+        payload = [
+            recipe_payload('Leek soup', tags=[self.tag.id],
+                           ingredients=[self.ingredient.id]),
+            recipe_payload('Toast'),
+        ]
+        resp = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['title'] for r in resp.data],
+                         ['Leek soup', 'Toast'])
+        soup = Recipe.objects.get(id=resp.data[0]['id'])
+        self.assertEqual(soup.user, self.user)
+        self.assertEqual(list(soup.tags.all()), [self.tag])
+        self.assertEqual(list(soup.ingredients.all()), [self.ingredient])
+        self.assertEqual(resp.data[0]['tags'], [self.tag.id])
+        self.assertEqual(resp.data[1]['tags'], [])
+
+    def test_bulk_update(self):
+        """Items with an id update that recipe"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Old', time_minutes=5, price=1.00)
+        recipe.tags.add(self.tag)
+        other = Recipe.objects.create(
+            user=self.user, title='Keep', time_minutes=5, price=1.00)
+        other.tags.add(self.tag)
+
+        payload = [
+            recipe_payload('New', id=recipe.id,
+                           ingredients=[self.ingredient.id], tags=[]),
+            recipe_payload('Kept', id=other.id),
+        ]
+        resp = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+        self.assertEqual(recipe.tags.count(), 0)
+        self.assertEqual(list(recipe.ingredients.all()), [self.ingredient])
+        self.assertEqual(list(other.tags.all()), [self.tag])
+
+    def test_errors_reported_per_item(self):
+        """Bad items are reported in place and nothing is written"""
+        other_user = get_user_model().objects.create_user(
+            'other@importer.org', 'not-yours')
+        foreign_tag = Tag.objects.create(user=other_user, name='Theirs')
+        foreign_recipe = Recipe.objects.create(
+            user=other_user, title='Theirs', time_minutes=1, price=1.00)
+
+        payload = [
+            recipe_payload('Fine'),
+            recipe_payload('Foreign tag', tags=[foreign_tag.id]),
+            recipe_payload('Foreign recipe', id=foreign_recipe.id),
+            {'title': 'Missing fields'},
+        ]
+        resp = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(resp.data), 4)
+        self.assertEqual(resp.data[0], {})
+        self.assertIn('tags', resp.data[1])
+        self.assertIn('id', resp.data[2])
+        self.assertIn('time_minutes', resp.data[3])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=2)
+    def test_batch_size_limit(self):
+        """Oversized batches are rejected outright"""
+        payload = [recipe_payload(f'R{i}') for i in range(3)]
+        resp = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_relation_queries_do_not_scale(self):
+        """Linking relations costs the same for 2 recipes as for 20"""
+        def post(count):
+            payload = [
+                recipe_payload(f'R{i}', tags=[self.tag.id],
+                               ingredients=[self.ingredient.id])
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(BULK_URL, payload, format='json')
+            return [
+                q['sql'] for q in ctx.captured_queries
+                if 'recipe_tags' in q['sql'] or
+                'recipe_ingredients' in q['sql']
+            ]
+
+        self.assertEqual(len(post(2)), len(post(20)))
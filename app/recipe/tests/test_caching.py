@@ -0,0 +1,148 @@
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+from recipe import caching, renditions
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, title='Cauldron cakes'):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class ResponseCacheTests(TestCase):
+    """Test the per-user response cache of the recipe API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'cache@generation.org',
+            'remember-me'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def test_repeat_list_served_from_cache(self):
+        """A cached list runs no queries at all"""
+        first = self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPE_URL)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data, first.data)
+
+    def test_create_invalidates_list(self):
+        """A new recipe shows up in the next list"""
+        self.client.get(RECIPE_URL)
+
+        sample_recipe(self.user, 'Chocolate frogs')
+
+        resp = self.client.get(RECIPE_URL)
+        self.assertEqual(len(resp.data), 2)
+
+    def test_tag_added_invalidates_detail(self):
+        """Linking a tag shows in the cached recipe detail"""
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+        tag = Tag.objects.create(user=self.user, name='Sweet')
+
+        self.recipe.tags.add(tag)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.data['tags'][0]['name'], 'Sweet')
+
+    def test_tag_rename_invalidates_detail(self):
+        """Renaming a tag shows in the recipes it is on"""
+        tag = Tag.objects.create(user=self.user, name='Sweet')
+        self.recipe.tags.add(tag)
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+
+        tag.name = 'Savoury'
+        tag.save()
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.data['tags'][0]['name'], 'Savoury')
+
+    def test_delete_invalidates_list(self):
+        """A deleted recipe leaves the list"""
+        self.client.get(RECIPE_URL)
+
+        self.recipe.delete()
+
+        self.assertEqual(self.client.get(RECIPE_URL).data, [])
+
+    def test_bulk_write_invalidates_list(self):
+        """Recipes written by the bulk endpoint show up in the list"""
+        self.client.get(RECIPE_URL)
+
+        self.client.post(BULK_URL, [
+            {'title': 'Toast', 'time_minutes': 2, 'price': '1.00'},
+        ], format='json')
+
+        resp = self.client.get(RECIPE_URL)
+        self.assertEqual(len(resp.data), 2)
+
+    def test_renditions_ready_invalidates(self):
+        """Finished renditions show up in the cached detail"""
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image='uploads/recipe/pie.jpg')
+        url = detail_url(self.recipe.id)
+        self.assertIsNone(self.client.get(url).data['renditions'])
+
+        renditions.mark_ready(self.recipe.id, 'uploads/recipe/pie.jpg')
+
+        resp = self.client.get(url)
+        self.assertIn('thumbnail', resp.data['renditions'])
+
+    def test_cache_is_per_user(self):
+        """Another user's cached list is never served"""
+        self.client.get(TAGS_URL)
+        Tag.objects.create(user=self.user, name='Sweet')
+        self.client.get(TAGS_URL)
+
+        other = get_user_model().objects.create_user(
+            'other@generation.org', 'remember-me')
+        self.client.force_authenticate(user=other)
+
+        self.assertEqual(self.client.get(TAGS_URL).data, [])
+
+    def test_other_users_writes_keep_cache(self):
+        """Writes by one user leave other users' entries alone"""
+        other = get_user_model().objects.create_user(
+            'other@generation.org', 'remember-me')
+        generation = caching.get_generation(self.user.pk)
+
+        sample_recipe(other)
+
+        self.assertEqual(caching.get_generation(self.user.pk), generation)
+
+    def test_evicted_generation_starts_fresh(self):
+        """A counter lost from the cache never reuses an old generation"""
+        generation = caching.get_generation(self.user.pk)
+        cache.delete(caching.GENERATION_KEY.format(self.user.pk))
+
+        self.assertGreater(caching.get_generation(self.user.pk), generation)
+
+    @override_settings(RECIPE_API_CACHE_TTL=0)
+    def test_ttl_zero_disables_cache(self):
+        """With no TTL every request is computed afresh"""
+        self.client.get(RECIPE_URL)
+
+        with self.assertNumQueries(3):
+            self.client.get(RECIPE_URL)
@@ -0,0 +1,166 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, title='Pumpkin pasties'):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag handling in the recipe API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'etag@conditional.org',
+            'not-modified'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def etag(self, url, params=None):
+        """Fetch url and return its ETag"""
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp['ETag']
+
+    def test_list_not_modified(self):
+        """Repeating a list request with its ETag gets a 304"""
+        etag = self.etag(RECIPE_URL)
+
+        resp = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(resp.content, b'')
+
+    def test_weak_etag_matches(self):
+        """A client that weakened our ETag still gets a 304"""
+        etag = self.etag(RECIPE_URL)
+
+        resp = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH='W/' + etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_depends_on_params(self):
+        """Different query parameters describe different responses"""
+        plain = self.etag(RECIPE_URL)
+        paged = self.etag(RECIPE_URL, {'page_size': 1})
+
+        self.assertNotEqual(plain, paged)
+
+    def test_list_etag_changes_on_delete(self):
+        """Deleting a recipe changes the list ETag"""
+        sample_recipe(self.user, 'Treacle tart')
+        etag = self.etag(RECIPE_URL)
+
+        self.recipe.delete()
+
+        self.assertNotEqual(self.etag(RECIPE_URL), etag)
+
+    def test_list_etag_is_per_user(self):
+        """Two users with identical data don't share an ETag"""
+        etag = self.etag(TAGS_URL)
+        other = get_user_model().objects.create_user(
+            'other@conditional.org', 'not-modified')
+        self.client.force_authenticate(user=other)
+
+        self.assertNotEqual(self.etag(TAGS_URL), etag)
+
+    def test_detail_changes_when_tag_added(self):
+        """Linking a tag to a recipe changes the recipe's ETag"""
+        url = detail_url(self.recipe.id)
+        etag = self.etag(url)
+        tag = Tag.objects.create(user=self.user, name='Sweet')
+
+        self.recipe.tags.add(tag)
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_detail_changes_when_tag_renamed(self):
+        """Renaming a tag changes the recipes it is on"""
+        tag = Tag.objects.create(user=self.user, name='Sweet')
+        self.recipe.tags.add(tag)
+        url = detail_url(self.recipe.id)
+        etag = self.etag(url)
+
+        tag.name = 'Savoury'
+        tag.save()
+
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_tags_in_use_change_with_links(self):
+        """assigned_only lists notice links being removed"""
+        tag = Tag.objects.create(user=self.user, name='Sweet')
+        self.recipe.tags.add(tag)
+        etag = self.etag(TAGS_URL, {'assigned_only': 1})
+
+        tag.recipe_set.clear()
+
+        resp = self.client.get(
+            TAGS_URL, {'assigned_only': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, [])
+
+    def test_detail_not_modified(self):
+        """Repeating a detail request with its ETag gets a 304 without
+        touching the database"""
+        url = detail_url(self.recipe.id)
+        etag = self.etag(url)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_edit_changes_etags(self):
+        """Editing a recipe changes the list and detail ETags"""
+        url = detail_url(self.recipe.id)
+        list_etag = self.etag(RECIPE_URL)
+        etag = self.etag(url)
+
+        self.recipe.title = 'Pumpkin soup'
+        self.recipe.save()
+
+        self.assertNotEqual(self.etag(url), etag)
+        self.assertNotEqual(self.etag(RECIPE_URL), list_etag)
+
+    def test_if_modified_since_ignored(self):
+        """Dates aren't validators; If-Modified-Since gets the full
+        response"""
+        resp = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['title'], self.recipe.title)
+        self.assertNotIn('Last-Modified', resp)
+
+    def test_detail_of_other_user_is_404(self):
+        """Validators don't leak other users' recipes"""
+        other = get_user_model().objects.create_user(
+            'other@conditional.org', 'not-modified')
+        recipe = sample_recipe(other)
+
+        resp = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
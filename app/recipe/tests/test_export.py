@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def sample_recipe(user, title='Pumpkin juice'):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class RecipeExportTests(TestCase):
+    """Test the streaming recipe export"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'export@backup.org',
+            'take-it-all'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def content(self, resp):
+        """Join a streamed response into text"""
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content).decode('utf-8')
+
+    def test_export_requires_login(self):
+        """Exports are only for authenticated users"""
+        resp = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_ndjson(self):
+        """By default each recipe is one line of JSON, with names"""
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Drink'))
+        sample_recipe(self.user, 'Butterbeer')
+        other = get_user_model().objects.create_user(
+            'other@backup.org', 'take-it-all')
+        sample_recipe(other, 'Not mine')
+
+        resp = self.client.get(EXPORT_URL)
+
+        self.assertEqual(resp['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        lines = [json.loads(line)
+                 for line in self.content(resp).splitlines()]
+        self.assertEqual([line['title'] for line in lines],
+                         ['Butterbeer', 'Pumpkin juice'])
+        self.assertEqual(lines[1]['tags'], [
+            {'id': recipe.tags.get().id, 'name': 'Drink'}])
+        self.assertEqual(lines[1]['price'], '5.00')
+
+    def test_export_csv(self):
+        """?format=csv gives a header row and names joined in a cell"""
+        recipe = sample_recipe(self.user)
+        for name in ('Pumpkin', 'Sugar'):
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=name))
+
+        resp = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertTrue(resp['Content-Type'].startswith('text/csv'))
+        self.assertIn('recipes.csv', resp['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.content(resp))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['ingredients'], 'Pumpkin; Sugar')
+        self.assertEqual(rows[0]['renditions'], '')
+
+    def test_export_fields_and_filters(self):
+        """Sparse fieldsets and filters apply to exports too"""
+        tag = Tag.objects.create(user=self.user, name='Drink')
+        sample_recipe(self.user).tags.add(tag)
+        sample_recipe(self.user, 'Rock cakes')
+
+        resp = self.client.get(
+            EXPORT_URL, {'fields': 'title', 'tags': str(tag.id)})
+
+        self.assertEqual(self.content(resp), '{"title":"Pumpkin juice"}\n')
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_relations_fetched_per_chunk(self):
+        """Relations are looked up once per chunk, not once per recipe"""
+        tag = Tag.objects.create(user=self.user, name='Drink')
+        for i in range(5):
+            sample_recipe(self.user, f'Recipe {i}').tags.add(tag)
+
+        with CaptureQueriesContext(connection) as ctx:
+            lines = self.content(self.client.get(EXPORT_URL)).splitlines()
+
+        self.assertEqual(len(lines), 5)
+        tag_queries = [q for q in ctx.captured_queries
+                       if 'FROM "core_recipe_tags"' in q['sql']]
+        self.assertEqual(len(tag_queries), 3)
+
+    def test_export_bad_fields_rejected(self):
+        """Errors come back in the requested format"""
+        resp = self.client.get(EXPORT_URL, {'fields': 'colour'})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('colour', resp.content.decode('utf-8'))
@@ -136,3 +136,20 @@ class PrivateUserApiTests(TestCase):
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_ingredients_with_counts(self):
+        """Test with_counts reports how many recipes use an ingredient"""
+        eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        Ingredient.objects.create(user=self.user, name='Cheese')
+        recipe = Recipe.objects.create(
+            title='Omelette',
+            time_minutes=5,
+            price=3.00,
+            user=self.user
+        )
+        recipe.ingredients.add(eggs)
+
+        res = self.client.get(INGREDIENT_URL, {'with_counts': 1})
+
+        counts = {row['name']: row['recipe_count'] for row in res.data}
+        self.assertEqual(counts, {'Eggs': 1, 'Cheese': 0})
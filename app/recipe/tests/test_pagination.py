@@ -0,0 +1,99 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, title='Butterbeer'):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class KeysetPaginationTests(TestCase):
+    """Test opt-in keyset pagination of the recipe API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'pages@paginate.org',
+            'turn-the-page'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url, params):
+        """Follow next links from url, returning every page's results"""
+        pages = []
+        resp = self.client.get(url, params)
+        while True:
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            pages.append(resp.data['results'])
+            if not resp.data['next']:
+                return pages
+            resp = self.client.get(resp.data['next'])
+
+    def test_unpaginated_by_default(self):
+        """Without opting in we get a plain list"""
+        sample_recipe(self.user)
+        resp = self.client.get(RECIPE_URL)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(resp.data, list)
+
+    def test_recipes_paginate_by_id(self):
+        """Recipe pages cover every recipe once, newest first"""
+        ids = [sample_recipe(self.user, f'R{i}').id for i in range(7)]
+
+        pages = self.walk(RECIPE_URL, {'page_size': 3})
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        seen = [row['id'] for page in pages for row in page]
+        self.assertEqual(seen, sorted(ids, reverse=True))
+
+    def test_tags_paginate_by_name_and_id(self):
+        """Tags with the same name are neither skipped nor repeated"""
+        for name in ['Lunch', 'Dinner', 'Dinner', 'Dinner', 'Brunch']:
+            Tag.objects.create(user=self.user, name=name)
+
+        pages = self.walk(TAGS_URL, {'page_size': 2})
+
+        seen = [row['id'] for page in pages for row in page]
+        expected = Tag.objects.order_by('-name', '-id')
+        self.assertEqual(seen, [tag.id for tag in expected])
+
+    @override_settings(RECIPE_API_MAX_PAGE_SIZE=2)
+    def test_page_size_is_capped(self):
+        """Clients can't ask for more than the configured maximum"""
+        for i in range(3):
+            sample_recipe(self.user, f'R{i}')
+
+        resp = self.client.get(RECIPE_URL, {'page_size': 500})
+
+        self.assertEqual(len(resp.data['results']), 2)
+        self.assertIsNotNone(resp.data['next'])
+
+    def test_later_pages_do_not_use_offset(self):
+        """Pages past the first are a keyset seek, not an OFFSET scan"""
+        for i in range(5):
+            sample_recipe(self.user, f'R{i}')
+        first = self.client.get(RECIPE_URL, {'page_size': 2})
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.data['next'])
+
+        for query in ctx.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_invalid_cursor(self):
+        """A cursor we didn't hand out is rejected"""
+        resp = self.client.get(RECIPE_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
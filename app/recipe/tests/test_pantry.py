@@ -0,0 +1,195 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Ingredient
+from recipe import indexes, pantry
+from recipe.signals import recipes_bulk_saved
+
+PANTRY_URL = reverse('recipe:recipe-pantry')
+
+
+def sample_recipe(user, title, *ingredients):
+    """Create a sample recipe using some ingredients"""
+    recipe = Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+    recipe.ingredients.add(*ingredients)
+    return recipe
+
+
+class PantryIndexTests(TestCase):
+    """Test the matching on its own"""
+
+    def test_ranking(self):
+        """Makeable recipes first, then fewest missing, then most of the
+        pantry used, then newest"""
+        index = pantry.PantryIndex({
+            1: {10, 11},
+            2: {10},
+            3: {10, 11, 12},
+            4: {12, 13},
+            5: {10, 12, 13, 14},
+            6: {11, 15},
+            7: {13, 14},
+        })
+
+        self.assertEqual(index.match({10, 11, 15}, 10), [
+            (6, 2, 2), (1, 2, 2), (2, 1, 1), (3, 2, 3), (5, 1, 4),
+        ])
+
+    def test_limit_and_max_missing(self):
+        """Results stop at limit, and at max_missing ingredients
+        missing"""
+        index = pantry.PantryIndex({pk: {1, pk} for pk in range(2, 12)})
+        index.update({12: {1}})
+
+        self.assertEqual(index.match({1}, 3), [(12, 1, 1), (11, 1, 2),
+                                               (10, 1, 2)])
+        self.assertEqual(index.match({1}, 20, max_missing=0), [(12, 1, 1)])
+        self.assertEqual(index.match({99}, 20), [])
+
+    def test_update(self):
+        """Updates move recipes between bitsets; removed ones never
+        match"""
+        index = pantry.PantryIndex({1: {10}, 2: {10, 11}, 3: {11}})
+
+        index.update({1: None, 2: {11}, 3: {10, 11}})
+
+        self.assertEqual(index.match({10}, 10), [(3, 1, 2)])
+        self.assertEqual(index.match({11}, 10), [(2, 1, 1), (3, 1, 2)])
+        self.assertEqual(len(index), 2)
+
+    def test_update_out_of_order(self):
+        """A recipe placed after the build still ranks by its id"""
+        index = pantry.PantryIndex({1: {10}, 3: {10}})
+
+        index.update({2: {10}})
+
+        self.assertEqual(index.match({10}, 10),
+                         [(3, 1, 1), (2, 1, 1), (1, 1, 1)])
+        self.assertTrue(index.needs_rebuild)
+
+    def test_many_pantry_ingredients(self):
+        """The bit-sliced counter counts past a single bit"""
+        index = pantry.PantryIndex({
+            1: set(range(10)),
+            2: set(range(5)),
+            3: set(range(7)) | {100},
+        })
+
+        self.assertEqual(index.match(range(8), 10),
+                         [(2, 5, 5), (3, 7, 8), (1, 8, 10)])
+
+    def test_counts_beyond_the_counter(self):
+        """Counts the counter can't hold don't match recipes sharing
+        nothing"""
+        index = pantry.PantryIndex({1: {1}, 2: set(range(100, 112))})
+
+        self.assertEqual(index.match(range(12), 10), [(1, 1, 1)])
+
+
+class PantryApiTests(TestCase):
+    """Test the recipes/pantry action"""
+
+    def setUp(self):
+        indexes.reset()
+        self.addCleanup(indexes.reset)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'pantry@taste.org',
+            'whats-in-the-fridge'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        self.milk = Ingredient.objects.create(user=self.user, name='Milk')
+        self.flour = Ingredient.objects.create(user=self.user, name='Flour')
+        self.sugar = Ingredient.objects.create(user=self.user, name='Sugar')
+
+        self.omelette = sample_recipe(self.user, 'Omelette', self.eggs)
+        self.pancakes = sample_recipe(
+            self.user, 'Pancakes', self.eggs, self.milk, self.flour)
+        self.cake = sample_recipe(
+            self.user, 'Cake', self.eggs, self.flour, self.sugar, self.milk)
+        self.syrup = sample_recipe(self.user, 'Syrup', self.sugar)
+
+    def pantry(self, *ingredients, **params):
+        params['ingredients'] = ','.join(str(i.id) for i in ingredients)
+        resp = self.client.get(PANTRY_URL, params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data
+
+    def test_ranked_by_coverage(self):
+        """Makeable recipes come first, then those missing the fewest
+        ingredients, with what is missing"""
+        results = self.pantry(self.eggs, self.milk)
+
+        self.assertEqual([item['id'] for item in results],
+                         [self.omelette.id, self.pancakes.id, self.cake.id])
+        self.assertEqual(results[0]['missing'], [])
+        self.assertEqual(results[0]['coverage'], 1.0)
+        self.assertEqual(results[1]['title'], 'Pancakes')
+        self.assertEqual(results[1]['missing'], [self.flour.id])
+        self.assertEqual(results[2]['coverage'], 0.5)
+
+    def test_limit_max_missing_and_fields(self):
+        """?limit= and ?max_missing= cap the results, ?fields= picks what
+        is rendered"""
+        results = self.pantry(
+            self.eggs, self.milk, self.flour, max_missing=0, fields='id')
+
+        self.assertEqual(results, [
+            {'id': self.pancakes.id, 'missing': [], 'coverage': 1.0},
+            {'id': self.omelette.id, 'missing': [], 'coverage': 1.0},
+        ])
+        self.assertEqual(len(self.pantry(self.eggs, limit=1)), 1)
+
+    def test_invalid_params(self):
+        """Ingredients are required; limits must be sensible numbers"""
+        for params in ({}, {'ingredients': 'eggs'},
+                       {'ingredients': '1', 'limit': '0'},
+                       {'ingredients': '1', 'max_missing': '-1'}):
+            resp = self.client.get(PANTRY_URL, params)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipes_not_matched(self):
+        """Only the user's own recipes are matched"""
+        other = get_user_model().objects.create_user(
+            'other@taste.org', 'whats-in-the-fridge')
+        sample_recipe(other, 'Boiled egg', self.eggs)
+
+        self.assertEqual(len(self.pantry(self.eggs)), 3)
+
+    def test_index_follows_writes(self):
+        """Link changes, deletes and bulk writes reach the cached index"""
+        self.pantry(self.sugar)
+        cache = pantry.pantry_indexes.cache()
+        index = cache.get(self.user.id)
+
+        self.cake.ingredients.remove(self.eggs, self.flour, self.milk)
+        self.syrup.delete()
+        results = self.pantry(self.sugar)
+
+        self.assertIs(cache.get(self.user.id), index)
+        self.assertEqual([item['id'] for item in results], [self.cake.id])
+
+        Recipe.ingredients.through.objects.create(
+            recipe=self.omelette, ingredient=self.sugar)
+        recipes_bulk_saved.send(
+            sender=Recipe, user=self.user, recipe_ids=[self.omelette.id])
+        self.assertEqual([item['id'] for item in self.pantry(self.sugar)],
+                         [self.cake.id, self.omelette.id])
+
+        sugar_id = self.sugar.id
+        self.sugar.delete()
+        resp = self.client.get(PANTRY_URL, {'ingredients': sugar_id})
+        self.assertEqual(resp.data, [])
+
+    def test_answered_from_the_index(self):
+        """Once built, the index answers without touching the links"""
+        self.pantry(self.eggs)
+
+        with self.assertNumQueries(3):
+            self.pantry(self.eggs, self.milk)
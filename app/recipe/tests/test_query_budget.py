@@ -0,0 +1,108 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+from recipe.tests.query_budget import QueryBudgetMixin
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+    """Return the recipe's URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Make sure no endpoint issues a query per row"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'budget@counting.org',
+            'counting-queries'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Tofu')
+
+    def add_recipes(self, count):
+        """Create count recipes, each with a tag and an ingredient"""
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=5.00
+            )
+            recipe.tags.add(
+                self.tag, Tag.objects.create(user=self.user, name=f'T{i}'))
+            recipe.ingredients.add(self.ingredient)
+
+    def test_recipe_list_budget(self):
+        """Listing recipes costs one query plus one per relation"""
+        self.assertQueryCountFlat(
+            lambda: self.client.get(RECIPE_URL),
+            self.add_recipes,
+            max_queries=3
+        )
+
+    def test_recipe_filtered_list_budget(self):
+        """Filtering recipes doesn't reintroduce per-row queries"""
+        self.assertQueryCountFlat(
+            lambda: self.client.get(RECIPE_URL, {
+                'tags': str(self.tag.id),
+                'ingredients': str(self.ingredient.id),
+            }),
+            self.add_recipes,
+            max_queries=3
+        )
+
+    def test_recipe_detail_budget(self):
+        """Retrieving a recipe doesn't scale with its tags"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Stew', time_minutes=60, price=7.00)
+
+        def add_tags(count):
+            for i in range(count):
+                recipe.tags.add(
+                    Tag.objects.create(user=self.user, name=f'Tag {i}'))
+                recipe.ingredients.add(
+                    Ingredient.objects.create(user=self.user, name=f'I{i}'))
+
+        self.assertQueryCountFlat(
+            lambda: self.client.get(detail_url(recipe.id)),
+            add_tags,
+            max_queries=3
+        )
+
+    def test_tag_list_budget(self):
+        """Listing tags is a single query"""
+        self.assertQueryCountFlat(
+            lambda: self.client.get(TAGS_URL, {'assigned_only': 1}),
+            self.add_recipes,
+            max_queries=1
+        )
+
+    def test_ingredient_list_budget(self):
+        """Listing ingredients is a single query"""
+        self.assertQueryCountFlat(
+            lambda: self.client.get(INGREDIENTS_URL),
+            self.add_recipes,
+            max_queries=1
+        )
+
+    def test_budget_catches_n_plus_one(self):
+        """The harness itself flags a query per row"""
+        def per_row():
+            resp = self.client.get(TAGS_URL)
+            for tag in Tag.objects.all():
+                list(tag.recipe_set.all())
+            return resp
+
+        with self.assertRaises(AssertionError):
+            self.assertQueryCountFlat(per_row, self.add_recipes)
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.readers import RecipeReader
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+
+class RecipeReaderTests(TestCase):
+    """Test the values()-based reader matches the model serializers"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'reader@fastpath.org',
+            'read-only'
+        )
+        request = APIRequestFactory().get('/api/recipe/recipes/')
+        self.context = {'request': Request(request)}
+
+        # Link in a different order than the ids to catch ordering slips
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dessert', 'Quick')]
+        ingredients = [Ingredient.objects.create(user=self.user, name=name)
+                       for name in ('Salt', 'Flour')]
+        Recipe.objects.create(
+            user=self.user, title='Plain', time_minutes=5, price=1)
+        linked = Recipe.objects.create(
+            user=self.user, title='Linked', time_minutes=45, price='12.5',
+            link='https://example.com/linked')
+        linked.tags.add(tags[2], tags[0])
+        linked.ingredients.add(ingredients[1], ingredients[0])
+        Recipe.objects.create(
+            user=self.user, title='Pictured', time_minutes=20, price='7.25',
+            image='uploads/recipe/pie.jpg', image_renditions_ready=True)
+        Recipe.objects.create(
+            user=self.user, title='Pending', time_minutes=20, price='7.25',
+            image='uploads/recipe/tart.jpg')
+
+    def render(self, data):
+        """Render data the way the API does"""
+        return JSONRenderer().render(data)
+
+    def test_list_output_identical(self):
+        """Listing renders to the same bytes as RecipeSerializer"""
+        queryset = Recipe.objects.order_by('-id')
+        expected = RecipeSerializer(
+            queryset, many=True, context=self.context).data
+
+        reader = RecipeReader(context=self.context)
+        actual = reader.to_representation(reader.values(queryset))
+
+        self.assertEqual(self.render(actual), self.render(expected))
+
+    def test_detail_output_identical(self):
+        """Details render to the same bytes as RecipeDetailSerializer"""
+        reader = RecipeReader(nested=True, context=self.context)
+        for recipe in Recipe.objects.all():
+            expected = RecipeDetailSerializer(
+                recipe, context=self.context).data
+            row = reader.values(Recipe.objects.filter(pk=recipe.pk)).get()
+
+            actual = reader.to_representation([row])[0]
+
+            self.assertEqual(self.render(actual), self.render(expected))
+
+    def test_query_count(self):
+        """Rows plus one query per relation"""
+        reader = RecipeReader(context=self.context)
+
+        with self.assertNumQueries(3):
+            reader.to_representation(reader.values(Recipe.objects.all()))
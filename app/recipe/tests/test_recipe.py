@@ -1,16 +1,22 @@
 import tempfile
 import os
+from unittest.mock import Mock, patch
 
 from PIL import Image
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.test import APIClient
 from rest_framework import status
 
 from core.models import Recipe, Ingredient, Tag
+from recipe.renditions import delete_renditions
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.views import RecipeViewSet
 
 RECIPE_URL = reverse('recipe:recipe-list')
 
@@ -114,6 +120,24 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(resp.data, serializer.data)
 
+    def test_detail_checks_object_permissions(self):
+        """The values() detail path still asks for object permission"""
+        recipe = sample_recipe(user=self.user)
+        checked = []
+
+        class DenyObjects(IsAuthenticated):
+            def has_object_permission(self, request, view, obj):
+                checked.append(obj)
+                return False
+
+        with patch.object(RecipeViewSet, 'permission_classes',
+                          (DenyObjects,)):
+            resp = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual([(obj.pk, obj.user_id) for obj in checked],
+                         [(recipe.id, self.user.id)])
+
     def test_create_simple_recipe(self):
         """Test creating a recipe via API"""
         payload = {
@@ -206,7 +230,62 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_create_recipe_with_foreign_tag(self):
+        """Tags belonging to someone else can't be attached"""
+        other_user = get_user_model().objects.create_user(
+            email='test@other.org', password='canna guess')
+        tag = sample_tag(user=other_user)
+        payload = {
+            'title': 'Borrowed',
+            'tags': [tag.id],
+            'time_minutes': 5,
+            'price': 1.00
+        }
+        resp = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', resp.data)
+
+    def test_missing_ingredients_reported_together(self):
+        """Every unknown ingredient id is named in the error"""
+        ingred = sample_ingredient(user=self.user)
+        payload = {
+            'title': 'Mystery stew',
+            'ingredients': [ingred.id, 9998, 9999],
+            'time_minutes': 5,
+            'price': 1.00
+        }
+        resp = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(resp.data['ingredients']), 2)
+        self.assertIn('9998', resp.data['ingredients'][0])
+        self.assertIn('9999', resp.data['ingredients'][1])
+
+    def test_related_ids_validated_in_one_query(self):
+        """Forty ingredients take one query to validate, not forty"""
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'Spice {i}')
+            for i in range(40)
+        ]
+        serializer = RecipeSerializer(
+            data={
+                'title': 'Garam masala',
+                'ingredients': [i.id for i in ingredients],
+                'tags': [],
+                'time_minutes': 5,
+                'price': 1.00,
+            },
+            context={'request': Mock(user=self.user)}
+        )
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(
+            serializer.validated_data['ingredients'], ingredients)
+
 
+@override_settings(RECIPE_RENDITION_WORKERS=0)
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
@@ -220,6 +299,9 @@ class RecipeImageUploadTests(TestCase):
 
     def tearDown(self):
         """Clean up the test files"""
+        if self.recipe.image:
+            image = self.recipe.image
+            delete_renditions(image.name, image.storage)
         self.recipe.image.delete()
 
     def test_upload_image_to_recipe(self):
@@ -288,3 +370,73 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+    def test_filter_any_without_duplicates(self):
+        """A recipe matching several of the ids comes back once"""
+        recipe = sample_recipe(user=self.user, title='Shakshuka')
+        tag1 = sample_tag(user=self.user, name='Breakfast')
+        tag2 = sample_tag(user=self.user, name='Vegetarian')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {'tags': f'{tag1.id},{tag2.id}', 'tags_mode': 'any'}
+        )
+
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_filter_all_tags_and_ingredients(self):
+        """With _mode=all only recipes linked to every id match"""
+        recipe1 = sample_recipe(user=self.user, title='Shakshuka')
+        recipe2 = sample_recipe(user=self.user, title='Porridge')
+        recipe3 = sample_recipe(user=self.user, title='Huevos rancheros')
+        tag1 = sample_tag(user=self.user, name='Breakfast')
+        tag2 = sample_tag(user=self.user, name='Vegetarian')
+        eggs = sample_ingredient(user=self.user, name='Eggs')
+        recipe1.tags.add(tag1, tag2)
+        recipe1.ingredients.add(eggs)
+        recipe2.tags.add(tag1, tag2)
+        recipe3.tags.add(tag1)
+        recipe3.ingredients.add(eggs)
+
+        res = self.client.get(
+            RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}', 'tags_mode': 'all'})
+        self.assertEqual([item['id'] for item in res.data],
+                         [recipe2.id, recipe1.id])
+
+        res = self.client.get(RECIPE_URL, {
+            'tags': f'{tag1.id},{tag2.id},{tag2.id}', 'tags_mode': 'all',
+            'ingredients': f'{eggs.id}', 'ingredients_mode': 'all',
+        })
+        self.assertEqual([item['id'] for item in res.data], [recipe1.id])
+
+    def test_filter_invalid_mode(self):
+        """Modes other than any and all are rejected"""
+        tag = sample_tag(user=self.user)
+
+        res = self.client.get(
+            RECIPE_URL, {'tags': f'{tag.id}', 'tags_mode': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags_mode', res.data)
+
+        res = self.client.get(RECIPE_URL, {'ingredients_mode': 'every'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingredients_mode', res.data)
+
+    def test_filter_all_of_many_ids(self):
+        """Matching all of many ids takes one subquery, not one per id"""
+        recipe = sample_recipe(user=self.user)
+        tags = [sample_tag(user=self.user, name=f'Tag {n}')
+                for n in range(30)]
+        recipe.tags.add(*tags)
+        ids = ','.join(str(tag.id) for tag in tags)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                RECIPE_URL, {'tags': ids, 'tags_mode': 'all'})
+
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+        self.assertLess(
+            max(query['sql'].count('SELECT') for query in queries), 5)
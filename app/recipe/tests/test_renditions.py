@@ -0,0 +1,156 @@
+import tempfile
+import threading
+import os
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe
+from recipe import renditions
+
+
+def image_upload_url(recipe_id):
+    """Return an image URL for this recipe's image"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+class BuildRenditionsTests(TestCase):
+    """Test the rendition worker itself"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'original.png')
+        Image.new('RGBA', (1200, 800)).save(self.path, format='PNG')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_builds_every_rendition(self):
+        """Each rendition fits its box and uses its format"""
+        written = renditions.build_renditions(self.path)
+
+        self.assertEqual(len(written), len(renditions.RENDITIONS))
+        for name, (size, fmt, _) in renditions.RENDITIONS.items():
+            path = renditions.rendition_name(self.path, name)
+            with Image.open(path) as img:
+                self.assertEqual(img.format, fmt)
+                self.assertLessEqual(img.width, size[0])
+                self.assertLessEqual(img.height, size[1])
+        self.assertFalse(
+            [f for f in os.listdir(self.tmpdir.name) if f.endswith('.part')])
+
+    @override_settings(RECIPE_RENDITION_WORKERS=1)
+    def test_builds_in_process_pool(self):
+        """The job can be shipped to a worker process"""
+        future = renditions.get_executor().submit(
+            renditions.build_renditions, self.path)
+
+        for path in future.result(timeout=30):
+            self.assertTrue(os.path.exists(path))
+
+
+class RenditionUploadTests(TestCase):
+    """Test the rendition URLs exposed by the API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'renditions@thumbs.org',
+            'smaller-please'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Pie', time_minutes=40, price=4.00)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            renditions.delete_renditions(
+                self.recipe.image.name, self.recipe.image.storage)
+        self.recipe.image.delete()
+
+    def upload(self):
+        """Upload a small JPEG to the recipe"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (800, 400)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+    @override_settings(RECIPE_RENDITION_WORKERS=0)
+    def test_upload_returns_rendition_urls(self):
+        """Once built, every rendition has a URL that exists on disk"""
+        resp = self.upload()
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_renditions_ready)
+        self.assertEqual(
+            list(resp.data['renditions']), list(renditions.RENDITIONS))
+        for name in renditions.RENDITIONS:
+            path = renditions.rendition_name(self.recipe.image.path, name)
+            self.assertTrue(os.path.exists(path))
+
+        resp = self.client.get(reverse('recipe:recipe-list'))
+        self.assertIn('thumbnail', resp.data[0]['renditions'])
+
+    @override_settings(RECIPE_RENDITION_WORKERS=2)
+    @patch('recipe.renditions.get_executor')
+    def test_upload_queues_job(self, get_executor):
+        """With workers configured the request only queues the job"""
+        resp = self.upload()
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIsNone(resp.data['renditions'])
+        self.recipe.refresh_from_db()
+        submit = get_executor.return_value.submit
+        submit.assert_called_once_with(
+            renditions.build_renditions, self.recipe.image.path)
+
+    def test_stale_job_does_not_mark_new_image(self):
+        """A job for a replaced image leaves the new one unmarked"""
+        self.recipe.image = 'uploads/recipe/new.jpg'
+        self.recipe.save()
+
+        renditions.mark_ready(self.recipe.id, 'uploads/recipe/old.jpg')
+
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image_renditions_ready)
+
+    @override_settings(RECIPE_RENDITION_WORKERS=0)
+    @patch('recipe.renditions.transaction.on_commit',
+           side_effect=lambda func: func())
+    def test_replaced_image_renditions_deleted(self, on_commit):
+        """Uploading a new image deletes the old image's renditions"""
+        self.upload()
+        self.recipe.refresh_from_db()
+        old = [renditions.rendition_name(self.recipe.image.path, name)
+               for name in renditions.RENDITIONS]
+        old_image = self.recipe.image.path
+
+        self.upload()
+
+        self.assertFalse(any(os.path.exists(path) for path in old))
+        os.remove(old_image)
+
+    def test_stale_job_removes_its_files(self):
+        """Renditions built for a replaced image are thrown away"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+            written = f.name
+        future = Future()
+        future.set_result([written])
+
+        renditions._job_done(self.recipe.id, 'uploads/recipe/old.jpg',
+                             threading.current_thread(), future)
+
+        self.assertFalse(os.path.exists(written))
@@ -0,0 +1,139 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Ingredient, Tag
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, title):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class RecipeSearchApiTests(TestCase):
+    """Test full-text search of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'search@finder.org',
+            'seek-and-find'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, q, **params):
+        """Return the titles the search endpoint finds for q"""
+        resp = self.client.get(RECIPE_URL, dict(q=q, **params))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return [row['title'] for row in resp.data]
+
+    def test_search_matches_title_tags_and_ingredients(self):
+        """Titles, tag names and ingredient names are all searched"""
+        sample_recipe(self.user, 'Lemon tart')
+        by_tag = sample_recipe(self.user, 'Pavlova')
+        by_tag.tags.add(Tag.objects.create(user=self.user, name='Lemon'))
+        by_ingredient = sample_recipe(self.user, 'Fish')
+        by_ingredient.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='lemon zest'))
+        sample_recipe(self.user, 'Toast')
+
+        self.assertEqual(
+            set(self.search('lemon')), {'Lemon tart', 'Pavlova', 'Fish'})
+
+    def test_title_ranks_above_ingredient(self):
+        """A title match outranks an ingredient match"""
+        by_ingredient = sample_recipe(self.user, 'Risotto')
+        by_ingredient.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Saffron'))
+        sample_recipe(self.user, 'Saffron buns')
+
+        self.assertEqual(self.search('saffron'), ['Saffron buns', 'Risotto'])
+
+    def test_search_limited_to_user(self):
+        """Other users' recipes never match"""
+        other_user = get_user_model().objects.create_user(
+            'other@finder.org', 'not-mine')
+        sample_recipe(other_user, 'Lemon tart')
+
+        self.assertEqual(self.search('lemon'), [])
+
+    def test_index_follows_changes(self):
+        """Renames, retitles and removed tags are reflected"""
+        recipe = sample_recipe(self.user, 'Stew')
+        tag = Tag.objects.create(user=self.user, name='Winter')
+        recipe.tags.add(tag)
+
+        tag.name = 'Autumn'
+        tag.save()
+        self.assertEqual(self.search('winter'), [])
+        self.assertEqual(self.search('autumn'), ['Stew'])
+
+        recipe.tags.remove(tag)
+        self.assertEqual(self.search('autumn'), [])
+
+        recipe.title = 'Goulash'
+        recipe.save()
+        self.assertEqual(self.search('goulash'), ['Goulash'])
+
+        tag.recipe_set.add(recipe)
+        tag.recipe_set.clear()
+        self.assertEqual(self.search('autumn'), [])
+
+        recipe.tags.add(tag)
+        tag.delete()
+        self.assertEqual(self.search('autumn'), [])
+
+    def test_bulk_created_recipes_are_indexed(self):
+        """Recipes written by the bulk endpoint are searchable"""
+        payload = [{'title': 'Gazpacho', 'time_minutes': 5, 'price': '2'}]
+        self.client.post(
+            reverse('recipe:recipe-bulk'), payload, format='json')
+
+        self.assertEqual(self.search('gazpacho'), ['Gazpacho'])
+
+    def test_create_reindexes_once(self):
+        """Creating a recipe with tags and ingredients through the API
+        indexes it in one go"""
+        tag = Tag.objects.create(user=self.user, name='Brunch')
+        ingredient = Ingredient.objects.create(user=self.user, name='Kale')
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(RECIPE_URL, {
+                'title': 'Green eggs', 'time_minutes': 5, 'price': 2.00,
+                'tags': [tag.id], 'ingredients': [ingredient.id],
+            })
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        reindexes = [q for q in ctx.captured_queries
+                     if 'core_recipe_fts' in q['sql'] and
+                     q['sql'].lstrip().startswith('INSERT')]
+        self.assertEqual(len(reindexes), 1)
+        self.assertEqual(self.search('kale brunch'), ['Green eggs'])
+
+    def test_search_paginates(self):
+        """Ranked results can be paged with a cursor"""
+        for i in range(5):
+            sample_recipe(self.user, f'Soup {i}')
+
+        resp = self.client.get(RECIPE_URL, {'q': 'soup', 'page_size': 2})
+        seen = [row['id'] for row in resp.data['results']]
+        while resp.data['next']:
+            resp = self.client.get(resp.data['next'])
+            seen += [row['id'] for row in resp.data['results']]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_punctuation_is_harmless(self):
+        """Query syntax characters are treated as plain text"""
+        sample_recipe(self.user, 'Fish and chips')
+
+        self.assertEqual(self.search('"fish" AND (chips'), ['Fish and chips'])
+        self.assertEqual(self.search('***'), [])
@@ -0,0 +1,180 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag, Ingredient
+from recipe import indexes, similarity
+from recipe.signals import recipes_bulk_saved
+
+
+def similar_url(recipe_id):
+    """Return the similar recipes URL of a recipe"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_recipe(user, title):
+    """Create a sample recipe"""
+    return Recipe.objects.create(
+        user=user, title=title, time_minutes=10, price=5.00)
+
+
+class SimilarityIndexTests(TestCase):
+    """Test the ranking on its own"""
+
+    def test_cosine_ranking(self):
+        """Recipes sharing more, and rarer, features rank higher"""
+        index = similarity.SimilarityIndex({
+            1: {10, 11, 12},
+            2: {10, 11, 12},
+            3: {10, 11},
+            4: {10, 13},
+            5: {13, 14},
+            6: {10, 20},
+            7: {10},
+        })
+
+        ranked = index.similar(1, 10)
+
+        # 20 is rarer than 13, so it weighs more against 6 than 13 does
+        # against 4
+        self.assertEqual([pk for _, pk in ranked], [2, 3, 7, 4, 6])
+        self.assertAlmostEqual(ranked[0][0], 1.0)
+        self.assertTrue(all(0 < score < 1 for score, _ in ranked[1:]))
+
+    def test_update(self):
+        """Updating a recipe moves it between posting lists"""
+        index = similarity.SimilarityIndex({1: {10}, 2: {11}, 3: {10}})
+
+        index.update({2: {10}, 3: set()})
+
+        self.assertEqual([pk for _, pk in index.similar(1, 10)], [2])
+        self.assertEqual(index.similar(3, 10), [])
+
+    def test_limit(self):
+        """Only the best limit matches come back"""
+        index = similarity.SimilarityIndex(
+            {pk: {1} for pk in range(1, 21)})
+
+        self.assertEqual(len(index.similar(1, 5)), 5)
+
+
+class SimilarRecipesApiTests(TestCase):
+    """Test the recipes/{id}/similar action"""
+
+    def setUp(self):
+        indexes.reset()
+        self.addCleanup(indexes.reset)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'similar@taste.org',
+            'more-like-this'
+        )
+        self.client.force_authenticate(user=self.user)
+
+        self.tag = Tag.objects.create(user=self.user, name='Dinner')
+        self.garlic = Ingredient.objects.create(user=self.user, name='Garlic')
+        self.basil = Ingredient.objects.create(user=self.user, name='Basil')
+        self.pasta = Ingredient.objects.create(user=self.user, name='Pasta')
+
+        self.pesto = sample_recipe(self.user, 'Pesto pasta')
+        self.pesto.tags.add(self.tag)
+        self.pesto.ingredients.add(self.garlic, self.basil, self.pasta)
+        self.aglio = sample_recipe(self.user, 'Aglio e olio')
+        self.aglio.tags.add(self.tag)
+        self.aglio.ingredients.add(self.garlic, self.pasta)
+        self.bread = sample_recipe(self.user, 'Garlic bread')
+        self.bread.ingredients.add(self.garlic)
+        self.salad = sample_recipe(self.user, 'Green salad')
+
+    def similar(self, recipe, **params):
+        resp = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data
+
+    def test_ranked_by_similarity(self):
+        """The closest recipes come first, with their scores; recipes
+        with nothing in common are left out"""
+        results = self.similar(self.pesto)
+
+        self.assertEqual([item['id'] for item in results],
+                         [self.aglio.id, self.bread.id])
+        self.assertEqual(results[0]['title'], 'Aglio e olio')
+        self.assertGreater(results[0]['similarity'],
+                           results[1]['similarity'])
+
+    def test_limit_and_fields(self):
+        """?limit= caps the results, ?fields= picks what is rendered"""
+        results = self.similar(self.pesto, limit=1, fields='id,title')
+
+        self.assertEqual(results, [{
+            'id': self.aglio.id, 'title': 'Aglio e olio',
+            'similarity': results[0]['similarity'],
+        }])
+
+    def test_invalid_limit(self):
+        """Limits that aren't a sensible number are rejected"""
+        for limit in ('0', 'ten', '100000'):
+            resp = self.client.get(similar_url(self.pesto.id),
+                                   {'limit': limit})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_recipe_not_found(self):
+        """Recipes of other users can't be looked up"""
+        other = get_user_model().objects.create_user(
+            'other@taste.org', 'more-like-this')
+        recipe = sample_recipe(other, 'Secret sauce')
+
+        resp = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_without_features(self):
+        """A recipe without tags or ingredients has no similar recipes"""
+        self.assertEqual(self.similar(self.salad), [])
+
+    def test_index_follows_link_changes(self):
+        """Adding and removing links updates the cached index in place"""
+        self.similar(self.pesto)
+        cache = similarity.similar_indexes.cache()
+        index = cache.get(self.user.id)
+
+        self.salad.ingredients.add(self.basil, self.pasta)
+        self.bread.ingredients.remove(self.garlic)
+        results = self.similar(self.pesto)
+
+        self.assertIs(cache.get(self.user.id), index)
+        # Basil was only on the pesto, so sharing it counts for a lot
+        self.assertEqual([item['id'] for item in results],
+                         [self.salad.id, self.aglio.id])
+
+    def test_index_follows_reverse_and_deletes(self):
+        """Links changed from the tag side, deleted tags and recipes and
+        bulk writes all reach the index"""
+        self.similar(self.pesto)
+
+        self.tag.recipe_set.add(self.salad)
+        self.assertIn(self.salad.id,
+                      [item['id'] for item in self.similar(self.pesto)])
+
+        self.tag.delete()
+        self.aglio.delete()
+        self.assertEqual([item['id'] for item in self.similar(self.pesto)],
+                         [self.bread.id])
+
+        Recipe.ingredients.through.objects.create(
+            recipe=self.salad, ingredient=self.basil)
+        recipes_bulk_saved.send(
+            sender=Recipe, user=self.user, recipe_ids=[self.salad.id])
+        self.assertEqual([item['id'] for item in self.similar(self.pesto)],
+                         [self.salad.id, self.bread.id])
+
+    def test_answered_from_the_index(self):
+        """Once built, the index answers without touching the links"""
+        self.similar(self.pesto)
+
+        # The ownership check, then the results with their tag and
+        # ingredient ids
+        with self.assertNumQueries(4):
+            self.similar(self.aglio)
@@ -0,0 +1,92 @@
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import Recipe, Tag
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class SparseFieldsTests(TestCase):
+    """Test ?fields= and ?omit= on the recipe endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'sparse@fields.org',
+            'just-the-title'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Rock cakes', time_minutes=30, price=3)
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Hard'))
+
+    def get_with_sql(self, url, params):
+        """GET url, returning the response and the SQL it ran"""
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp, [query['sql'] for query in ctx.captured_queries]
+
+    def test_fields_trims_list(self):
+        """Only the requested fields come back, in their usual order"""
+        resp = self.client.get(
+            RECIPE_URL, {'fields': 'time_minutes,title,id'})
+
+        self.assertEqual(list(resp.data[0]), ['id', 'title', 'time_minutes'])
+        self.assertEqual(resp.data[0]['title'], 'Rock cakes')
+
+    def test_fields_narrow_select_and_skip_relations(self):
+        """Unused columns and relations are not queried"""
+        resp, sql = self.get_with_sql(
+            RECIPE_URL, {'fields': 'id,title,time_minutes'})
+
+        recipe_sql = [q for q in sql if 'FROM "core_recipe"' in q][-1]
+        self.assertNotIn('"price"', recipe_sql)
+        self.assertNotIn('"image"', recipe_sql)
+        self.assertFalse([q for q in sql if 'core_recipe_tags' in q])
+        self.assertFalse([q for q in sql if 'core_recipe_ingredients' in q])
+
+    def test_omit(self):
+        """omit drops fields from the full set"""
+        resp, sql = self.get_with_sql(
+            RECIPE_URL, {'omit': 'tags,ingredients,renditions'})
+
+        self.assertEqual(list(resp.data[0]),
+                         ['id', 'title', 'time_minutes', 'price', 'link'])
+        self.assertFalse([q for q in sql if 'core_recipe_tags' in q])
+
+    def test_fields_on_detail(self):
+        """Details honour fields too, keeping nested relations"""
+        resp = self.client.get(
+            detail_url(self.recipe.id), {'fields': 'title,tags'})
+
+        self.assertEqual(list(resp.data), ['title', 'tags'])
+        self.assertEqual(resp.data['tags'][0]['name'], 'Hard')
+
+    def test_paginate_without_id(self):
+        """Cursors still work when id isn't among the fields"""
+        Recipe.objects.create(
+            user=self.user, title='Treacle fudge', time_minutes=5, price=2)
+
+        resp = self.client.get(RECIPE_URL, {'fields': 'title', 'page_size': 1})
+        self.assertEqual(resp.data['results'], [{'title': 'Treacle fudge'}])
+
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual(resp.data['results'], [{'title': 'Rock cakes'}])
+
+    def test_unknown_field_rejected(self):
+        """Asking for a field that doesn't exist is a 400"""
+        resp = self.client.get(RECIPE_URL, {'fields': 'title,colour'})
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', resp.data)
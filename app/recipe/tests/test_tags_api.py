@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
@@ -133,3 +135,36 @@ class PrivateUserApiTests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_assigned_only_uses_exists(self):
+        """Test assigned_only is a correlated EXISTS, not a JOIN+DISTINCT"""
+        Tag.objects.create(user=self.user, name='Breakfast')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        sql = ctx.captured_queries[-1]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_retrieve_tags_with_counts(self):
+        """Test with_counts reports recipe usage in a single query"""
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        lunch = Tag.objects.create(user=self.user, name='Lunch')
+        Tag.objects.create(user=self.user, name='Dinner')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=5, price=2.00, user=self.user)
+            recipe.tags.add(breakfast)
+        recipe.tags.add(lunch)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                TAGS_URL, {'with_counts': 1, 'assigned_only': 1})
+
+        counts = {row['name']: row['recipe_count'] for row in res.data}
+        self.assertEqual(counts, {'Breakfast': 2, 'Lunch': 1})
+
+        res = self.client.get(TAGS_URL, {'with_counts': 1})
+        counts = {row['name']: row['recipe_count'] for row in res.data}
+        self.assertEqual(counts['Dinner'], 0)
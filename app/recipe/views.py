@@ -1,38 +1,122 @@
+from django.conf import settings
+from django.db.models import Count, Exists, IntegerField, OuterRef, \
+    Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils.translation import ugettext_lazy as _
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication
+from core.middleware import serializing
 from core.models import Tag, Ingredient, Recipe
+from core.routers import ReplicaReadMixin
+from recipe.caching import CachedResponseMixin
+from recipe.conditional import ConditionalGetMixin
+from recipe.export import NDJSONRenderer, CSVRenderer, STREAMERS
+from recipe.pagination import KeysetPagination
+from recipe.pantry import pantry_matches
+from recipe.readers import RecipeReadMixin
+from recipe.renditions import image_replaced, queue_renditions
+from recipe.search import batched_reindex, search_recipes
+from recipe.similarity import similar_recipes
 from recipe.serializers \
     import \
     TagSerializer, IngredientSerializer, RecipeSerializer, \
-    RecipeDetailSerializer, RecipeImageSerializer
+    RecipeDetailSerializer, RecipeImageSerializer, RecipeBulkSerializer, \
+    TagCountSerializer, IngredientCountSerializer
 
+# Values of ?tags_mode= and ?ingredients_mode=, the default first
+LINK_MODES = ('any', 'all')
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+
+def filter_by_links(queryset, field, ids, match_all=False):
+    """Keep recipes whose field (tags or ingredients) links to any, or
+    every, one of ids
+
+    Any is a correlated EXISTS subquery, a point lookup on the through
+    table's (recipe, tag or ingredient) unique index. All is a single
+    subquery of the recipes linked to as many distinct ids as were asked
+    for, however many that is. Unlike a join, neither repeats a recipe
+    that matches more than one id.
+    """
+    m2m = Recipe._meta.get_field(field)
+    links = m2m.remote_field.through.objects.order_by()
+    source = f'{m2m.m2m_field_name()}_id'
+    target = f'{m2m.m2m_reverse_field_name()}_id'
+    ids = set(ids)
+
+    if match_all:
+        return queryset.filter(pk__in=links.filter(
+            **{f'{target}__in': ids}
+        ).values(source).annotate(
+            matched=Count(target, distinct=True)
+        ).filter(matched=len(ids)).values(source))
+
+    alias = f'has_{field}'
+    return queryset.annotate(**{alias: Exists(links.filter(**{
+        m2m.m2m_field_name(): OuterRef('pk'),
+        f'{target}__in': ids,
+    }))}).filter(**{alias: True})
+
+
+class BaseRecipeAttrViewSet(ConditionalGetMixin,
+                            CachedResponseMixin,
+                            ReplicaReadMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     authentication_classes = (
-        TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         IsAuthenticated,
     )
+    pagination_class = KeysetPagination
+    # id breaks ties between equal names so keyset cursors are exact
+    keyset_ordering = ('-name', '-id')
+
+    def _flag(self, name):
+        """Read a 0/1 query parameter"""
+        return bool(int(self.request.query_params.get(name, 0)))
+
+    def get_recipe_links(self):
+        """Through-table rows linking the outer object to its recipes"""
+        field = Recipe._meta.get_field(self.recipe_field)
+        column = field.m2m_reverse_field_name()
+        return field.remote_field.through.objects.filter(
+            **{column: OuterRef('pk')}
+        ).order_by().values(column)
 
     def get_queryset(self):
         """Return objects for current user"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        queryset = self.queryset.filter(user=self.request.user)
+        links = self.get_recipe_links()
 
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-name').distinct()
+        if self._flag('assigned_only'):
+            # A correlated EXISTS stops at the first link, where a join
+            # would have to read every link and DISTINCT them away again.
+            queryset = queryset.annotate(
+                assigned=Exists(links)
+            ).filter(assigned=True)
+
+        if self._flag('with_counts'):
+            counts = links.annotate(count=Count('*')).values('count')
+            queryset = queryset.annotate(recipe_count=Coalesce(
+                Subquery(counts, output_field=IntegerField()), 0))
+
+        return queryset.order_by(*self.keyset_ordering)
+
+    def get_serializer_class(self):
+        """Include recipe counts when they were asked for"""
+        if self.action == 'list' and self._flag('with_counts'):
+            return self.count_serializer_class
+
+        return self.serializer_class
 
     def perform_create(self, serializer):
         """Override to make sure a new attribute belongs to its user"""
@@ -42,46 +126,73 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
 class TagViewSet(BaseRecipeAttrViewSet):
     """Create a new tag in the system"""
     serializer_class = TagSerializer
+    count_serializer_class = TagCountSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Create a new ingredient in the system"""
     serializer_class = IngredientSerializer
+    count_serializer_class = IngredientCountSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, CachedResponseMixin,
+                    RecipeReadMixin, ReplicaReadMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the DB"""
     authentication_classes = (
-        TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         IsAuthenticated,
     )
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-id',)
 
     def _params_to_ints(self, qs):
         """Turn a comma delimited list of ints into a list of int"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _filter_links(self, queryset, field):
+        """Filter by ?<field>=, matching any or all of the ids as
+        ?<field>_mode= says; the mode is checked even without ids"""
+        mode = self.request.query_params.get(f'{field}_mode', LINK_MODES[0])
+        if mode not in LINK_MODES:
+            raise ValidationError({f'{field}_mode': [
+                _('Must be one of: %s.') % ', '.join(LINK_MODES)]})
+
+        ids = self.request.query_params.get(field)
+        if not ids:
+            return queryset
+        return filter_by_links(queryset, field, self._params_to_ints(ids),
+                               match_all=mode == 'all')
+
+    def get_keyset_ordering(self):
+        """Order by relevance when searching, newest first otherwise"""
+        if self.request.query_params.get('q'):
+            return ('-search_rank',) + self.keyset_ordering
+
+        return self.keyset_ordering
+
     def get_queryset(self):
         """Get the authenticated user's recipes"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('q')
         queryset = self.queryset
 
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            # Magic string indicates a filter on a foreign id link:
-            queryset = queryset.filter(tags__id__in=tag_ids)
+        if search:
+            queryset = search_recipes(queryset, search)
 
-        if ingredients:
-            ingred_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingred_ids)
+        queryset = self._filter_links(queryset, 'tags')
+        queryset = self._filter_links(queryset, 'ingredients')
 
-        return queryset.filter(user=self.request.user)
+        return queryset.filter(
+            user=self.request.user
+        ).order_by(*self.get_keyset_ordering())
 
     def get_serializer_class(self):
         """Return different serializer for our detail view"""
@@ -89,12 +200,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeDetailSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'bulk':
+            return RecipeBulkSerializer
 
         return self.serializer_class
 
     def perform_create(self, serializer):
         """Override to make sure a new attribute belongs to its user"""
-        serializer.save(user=self.request.user)
+        with batched_reindex():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        """Reindex the recipe once for its fields and relations"""
+        with batched_reindex():
+            serializer.save()
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -106,7 +225,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            # Renditions of any previous image no longer apply
+            previous = recipe.image.name
+            recipe = serializer.save(image_renditions_ready=False)
+            if previous != recipe.image.name:
+                image_replaced(previous, recipe.image.storage)
+            queue_renditions(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -117,3 +241,122 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Create or update a list of recipes in one go"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with batched_reindex():
+            recipes = serializer.save(user=request.user)
+
+        prefetch_related_objects(recipes, 'tags', 'ingredients')
+        results = RecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        created = any('id' not in item for item in request.data)
+        return Response(
+            results.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(methods=['GET'], detail=False,
+            renderer_classes=(NDJSONRenderer, CSVRenderer))
+    def export(self, request):
+        """Stream every recipe as NDJSON, or CSV with ?format=csv"""
+        reader = self.get_reader()
+        rows = reader.values(
+            self.filter_queryset(self.get_queryset())
+        ).iterator(chunk_size=settings.RECIPE_EXPORT_CHUNK_SIZE)
+
+        renderer = request.accepted_renderer
+        stream = STREAMERS[renderer.format](
+            reader, rows, settings.RECIPE_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            stream,
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{renderer.format}"'
+        return response
+
+    def _int_param(self, name, default, lowest, highest=None):
+        """Read an optional whole number query parameter within bounds"""
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError(
+                {name: [_('A whole number is required.')]})
+        if highest is None:
+            if value < lowest:
+                raise ValidationError({name: [
+                    _('Must be at least %d.') % lowest]})
+        elif not lowest <= value <= highest:
+            raise ValidationError({name: [
+                _('Must be between %(lowest)d and %(highest)d.') %
+                {'lowest': lowest, 'highest': highest}]})
+        return value
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """List the user's recipes most like this one, best match first"""
+        recipe_id = get_object_or_404(
+            Recipe.objects.filter(user=request.user).values('id'), pk=pk
+        )['id']
+
+        limit = self._int_param(
+            'limit', settings.RECIPE_SIMILAR_LIMIT,
+            1, settings.RECIPE_SIMILAR_MAX_LIMIT)
+
+        ranked = similar_recipes(request.user.pk, recipe_id, limit)
+        reader = self.get_reader()
+        rows = reader.values(Recipe.objects.filter(
+            user=request.user, id__in=[other for score, other in ranked]))
+        rows = {row['id']: row for row in rows}
+
+        # Skip any recipe deleted since it was ranked
+        ranked = [(score, other) for score, other in ranked if other in rows]
+        with serializing(request):
+            results = reader.to_representation(
+                [rows[other] for score, other in ranked])
+        for item, (score, other) in zip(results, ranked):
+            item['similarity'] = round(score, 4)
+
+        return Response(results)
+
+    @action(methods=['GET'], detail=False)
+    def pantry(self, request):
+        """List the recipes that can be made from ?ingredients=, those
+        missing the fewest ingredients first"""
+        try:
+            ingredient_ids = self._params_to_ints(
+                request.query_params.get('ingredients', ''))
+        except ValueError:
+            raise ValidationError({'ingredients': [
+                _('A comma separated list of ingredient ids is required.')]})
+        limit = self._int_param(
+            'limit', settings.RECIPE_PANTRY_LIMIT,
+            1, settings.RECIPE_PANTRY_MAX_LIMIT)
+        max_missing = None
+        if 'max_missing' in request.query_params:
+            max_missing = self._int_param('max_missing', None, 0)
+
+        matches = pantry_matches(
+            request.user.pk, ingredient_ids, limit, max_missing)
+        reader = self.get_reader()
+        rows = reader.values(Recipe.objects.filter(
+            user=request.user, id__in=[match[0] for match in matches]))
+        rows = {row['id']: row for row in rows}
+
+        # Skip any recipe deleted since it was matched
+        matches = [match for match in matches if match[0] in rows]
+        with serializing(request):
+            results = reader.to_representation(
+                [rows[recipe_id] for recipe_id, missing, coverage in matches])
+        for item, (recipe_id, missing, coverage) in zip(results, matches):
+            item['missing'] = missing
+            item['coverage'] = round(coverage, 4)
+
+        return Response(results)
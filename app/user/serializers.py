@@ -9,8 +9,10 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
+from core.middleware import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for our user object"""
     class Meta:
         model = get_user_model()
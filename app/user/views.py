@@ -1,7 +1,9 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+from core.routers import ReplicaReadMixin
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -16,11 +18,11 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     """Manage an authenticated user"""
     serializer_class = UserSerializer
     authentication_classes = (
-        authentication.TokenAuthentication,
+        CachedTokenAuthentication,
     )
     permission_classes = (
         permissions.IsAuthenticated,